@@ -0,0 +1,225 @@
+"""
+Benchmark: vistas sync (WSGI) vs async (ASGI) - Datos con Alex
+===============================================================
+Mide requests/segundo de un solo proceso en validate y create-preference
+contra un Mercado Pago falso con latencia fija (MP_API_BASE_URL), que es
+lo que domina el tiempo de estos endpoints en producción.
+
+- sync: las vistas de payments/views.py, N threads en paralelo (como un
+  worker gthread de gunicorn con N threads)
+- async: las vistas de payments/views_async.py, M requests concurrentes
+  en un solo event loop (como un worker de uvicorn)
+
+Uso (desde backend/):
+    python -m benchmarks.bench_async_views --requests 400 --latency 0.1
+===============================================================
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+# =============================================================================
+# MERCADO PAGO FALSO
+# =============================================================================
+
+class FakeMercadoPago(BaseHTTPRequestHandler):
+    latency = 0.1
+    protocol_version = 'HTTP/1.1'
+
+    def _reply(self, status: int, body: dict) -> None:
+        time.sleep(self.latency)
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        payment_id = self.path.rstrip('/').rsplit('/', 1)[-1]
+        # pending: no es terminal, así cada validate consulta a MP
+        self._reply(200, {'id': payment_id, 'status': 'pending', 'status_detail': 'pending_waiting_payment',
+                          'transaction_amount': 1.0, 'metadata': {}})
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        preference_id = f"pref-{time.monotonic_ns()}"
+        self._reply(201, {'id': preference_id, 'init_point': f"https://mp.test/{preference_id}",
+                          'sandbox_init_point': f"https://mp.test/sandbox/{preference_id}"})
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def start_fake_mp(latency: float) -> ThreadingHTTPServer:
+    FakeMercadoPago.latency = latency
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeMercadoPago)
+    server.daemon_threads = True
+    server.request_queue_size = 1024
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# =============================================================================
+# URLS DEL BENCHMARK (sync y async en el mismo proceso)
+# =============================================================================
+
+urlpatterns: list = []
+
+
+def _setup_django(mp_url: str, runtime_dir: str) -> None:
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    os.environ['MP_API_BASE_URL'] = mp_url
+    os.environ['PAYMENTS_RUNTIME_DIR'] = runtime_dir
+    os.environ.setdefault('MP_ACCESS_TOKEN', 'TEST-benchmark')
+    os.environ.setdefault('TRACE_LEVEL', 'WARNING')
+
+    import django
+    from django.conf import settings
+
+    django.setup()
+    settings.DATABASES['default']['NAME'] = str(Path(runtime_dir) / 'bench.sqlite3')
+    settings.ROOT_URLCONF = __name__
+    settings.ALLOWED_HOSTS = ['*']
+
+    from django.core.management import call_command
+    from django.urls import path
+
+    call_command('migrate', verbosity=0)
+
+    from payments import views, views_async
+    module = sys.modules[__name__]
+    module.urlpatterns[:] = [
+        path('sync/create-preference/', views.create_preference),
+        path('sync/validate/', views.pago_exitoso),
+        path('async/create-preference/', views_async.create_preference),
+        path('async/validate/', views_async.pago_exitoso),
+    ]
+
+
+# =============================================================================
+# CARGA
+# =============================================================================
+
+_ids = itertools.count(1)
+
+
+def _request_args(endpoint: str, prefix: str) -> tuple[str, dict]:
+    n = next(_ids)
+    if endpoint == 'validate':
+        return f"/{prefix}/validate/", {'data': {'payment_id': str(9_000_000 + n)}}
+    body = json.dumps({'first_name': 'Bench', 'last_name': 'Mark', 'document': '1',
+                       'email': f"bench{n}@example.com", 'course_id': 'tracker-habitos'})
+    return f"/{prefix}/create-preference/", {'data': body, 'content_type': 'application/json'}
+
+
+def _summary(latencies: list[float], errors: int, elapsed: float) -> dict:
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'rps': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies) * 1000, 1),
+        'p95_ms': round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 1),
+    }
+
+
+def run_sync(endpoint: str, total: int, threads: int) -> dict:
+    from django.test import Client
+
+    local = threading.local()
+
+    def one() -> tuple[float, bool]:
+        client = getattr(local, 'client', None) or Client()
+        local.client = client
+        url, kwargs = _request_args(endpoint, 'sync')
+        started = time.perf_counter()
+        method = client.get if endpoint == 'validate' else client.post
+        response = method(url, **kwargs)
+        return time.perf_counter() - started, response.status_code == 200
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(lambda _: one(), range(total)))
+    elapsed = time.perf_counter() - started
+    return {'threads': threads, **_summary([r[0] for r in results], sum(not r[1] for r in results), elapsed)}
+
+
+def run_async(endpoint: str, total: int, concurrency: int) -> dict:
+    from django.test import AsyncClient
+
+    async def main() -> list[tuple[float, bool]]:
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def one() -> tuple[float, bool]:
+            async with semaphore:
+                url, kwargs = _request_args(endpoint, 'async')
+                started = time.perf_counter()
+                method = client.get if endpoint == 'validate' else client.post
+                response = await method(url, **kwargs)
+                return time.perf_counter() - started, response.status_code == 200
+
+        try:
+            return await asyncio.gather(*(one() for _ in range(total)))
+        finally:
+            from payments.async_clients import aclose_clients
+            await aclose_clients()
+
+    started = time.perf_counter()
+    results = asyncio.run(main())
+    elapsed = time.perf_counter() - started
+    return {'concurrency': concurrency, **_summary([r[0] for r in results], sum(not r[1] for r in results), elapsed)}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=400, help='requests por escenario')
+    parser.add_argument('--latency', type=float, default=0.1, help='latencia del MP falso (segundos)')
+    parser.add_argument('--threads', type=int, default=4, help='threads del escenario sync')
+    parser.add_argument('--concurrency', type=int, default=100, help='requests en vuelo del escenario async')
+    parser.add_argument('--endpoint', choices=['validate', 'create-preference', 'all'], default='all')
+    args = parser.parse_args()
+
+    server = start_fake_mp(args.latency)
+    with tempfile.TemporaryDirectory(prefix='bench-async-') as runtime_dir:
+        _setup_django(f"http://127.0.0.1:{server.server_port}", runtime_dir)
+        endpoints = ['validate', 'create-preference'] if args.endpoint == 'all' else [args.endpoint]
+        report = {'latency_s': args.latency, 'results': {}}
+        for endpoint in endpoints:
+            sync_result = run_sync(endpoint, args.requests, args.threads)
+            async_result = run_async(endpoint, args.requests, args.concurrency)
+            report['results'][endpoint] = {
+                'sync': sync_result,
+                'async': async_result,
+                'speedup': round(async_result['rps'] / sync_result['rps'], 2),
+            }
+        # Antes de borrar la base temporal: escribir el ledger y el journal
+        from payments import journal, ledger
+        ledger.stop_writer(timeout=2)
+        ledger.flush()
+        journal.close_journal()
+        print(json.dumps(report, indent=2))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
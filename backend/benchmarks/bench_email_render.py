@@ -0,0 +1,87 @@
+"""
+Benchmark: armado del email de entrega - Datos con Alex
+========================================================
+Compara, por producto del catálogo, el costo de armar el SendSmtpEmail:
+
+- template: render completo del template de Django en cada envío
+  (cached loader, así que sin leer ni compilar el archivo)
+- skeleton: esqueleto precalculado (payments/emails.py), solo se escapa
+  el nombre del cliente y se unen los fragmentos
+
+No envía nada: mide solo el armado del mensaje.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_email_render --iterations 5000
+========================================================
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import timeit
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+
+def _setup_django() -> None:
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    os.environ.setdefault('TRACE_LEVEL', 'WARNING')
+
+    import django
+
+    django.setup()
+
+
+def _per_op_us(func, iterations: int, repeat: int) -> float:
+    best = min(timeit.repeat(func, number=iterations, repeat=repeat))
+    return round(best / iterations * 1_000_000, 2)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    _setup_django()
+
+    import sib_api_v3_sdk
+    from payments.catalog import get_catalog
+    from payments.emails import build_skeleton, get_skeleton, render_delivery_html
+
+    results = {}
+    for product in get_catalog():
+        skeleton = get_skeleton(product.id)
+
+        def full_render():
+            # Lo que cuesta sin esqueleto: template, asunto, adjuntos y mensaje
+            fresh = build_skeleton(product)
+            return sib_api_v3_sdk.SendSmtpEmail(
+                to=[{"email": "cliente@example.com", "name": "Ana"}],
+                sender=fresh.sender,
+                subject=fresh.subject,
+                html_content=render_delivery_html(product, "Ana"),
+                attachment=list(fresh.attachments),
+            )
+
+        def from_skeleton():
+            return skeleton.build("cliente@example.com", "Ana")
+
+        template_us = _per_op_us(full_render, max(args.iterations // 10, 1), args.repeat)
+        skeleton_us = _per_op_us(from_skeleton, args.iterations, args.repeat)
+        results[product.id] = {
+            'template_us': template_us,
+            'skeleton_us': skeleton_us,
+            'speedup': round(template_us / skeleton_us, 1) if skeleton_us else None,
+        }
+
+    print(json.dumps({'iterations': args.iterations, 'results': results}, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,330 @@
+"""
+Suite de micro-benchmarks de los caminos calientes - Datos con Alex
+====================================================================
+Mide por separado, con Mercado Pago y Brevo reemplazados por stubs en
+memoria (sin red), lo que cuesta cada camino del flujo de pagos:
+
+- preference_payload: validar el body de create-preference y armar la
+  preferencia de MP
+- validate_new / validate_repeat: pago_exitoso de punta a punta (Django
+  test client) para un pago nuevo y para uno ya entregado
+- webhook_new / webhook_duplicate: webhook de punta a punta, una
+  notificación nueva (filtro + inbox) y una repetida
+- email_send[<producto>]: send_product_email por producto del catálogo
+  (esqueleto, adjuntos o links, SendSmtpEmail y el stub de Brevo)
+- mp_payment_parse / mp_payment_serialize: JSON de un pago real de MP
+  (benchmarks/fixtures/mp_payment.json)
+
+Cada caso reporta µs por operación (el mejor de `--repeat` corridas).
+`--save` guarda el resultado como baseline JSON; `--compare` vuelve a
+medir y termina con código 1 si algún caso es más lento que el baseline
+por encima de `--tolerance`. Los baselines son de una máquina: generarlos
+y compararlos en la misma.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_hot_paths                      # medir e imprimir
+    python -m benchmarks.bench_hot_paths --save               # guardar baseline
+    python -m benchmarks.bench_hot_paths --compare            # medir y comparar
+    python -m benchmarks.bench_hot_paths --compare --filter validate
+====================================================================
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import logging
+import os
+import platform
+import sys
+import tempfile
+import time
+import timeit
+from dataclasses import dataclass
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any, Callable
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+BENCH_DIR = Path(__file__).resolve().parent
+DEFAULT_BASELINE = BENCH_DIR / 'baselines' / 'hot_paths.json'
+MP_PAYMENT_FIXTURE = BENCH_DIR / 'fixtures' / 'mp_payment.json'
+
+
+# =============================================================================
+# UPSTREAMS FALSOS
+# =============================================================================
+
+class _FakePaymentResource:
+    def __init__(self, template: dict[str, Any]) -> None:
+        self.template = template
+
+    def get(self, payment_id):
+        return {'status': 200, 'response': {**self.template, 'id': int(payment_id)}}
+
+
+class _FakePreferenceResource:
+    def create(self, preference_data):
+        preference_id = f"pref-{preference_data['external_reference']}"
+        return {'status': 201, 'response': {'id': preference_id, 'init_point': f"https://mp.test/{preference_id}",
+                                            'sandbox_init_point': f"https://mp.test/sandbox/{preference_id}"}}
+
+
+class FakeMercadoPagoSDK:
+    """Lo que usa payments/clients.py del SDK de MP, sin red."""
+
+    def __init__(self, payment_template: dict[str, Any]) -> None:
+        self._payment = _FakePaymentResource(payment_template)
+        self._preference = _FakePreferenceResource()
+
+    def payment(self):
+        return self._payment
+
+    def preference(self):
+        return self._preference
+
+
+class FakeBrevoApi:
+    """TransactionalEmailsApi sin red: solo serializa el mensaje como el SDK."""
+
+    def __init__(self) -> None:
+        import sib_api_v3_sdk
+
+        self._client = sib_api_v3_sdk.ApiClient()
+
+    def send_transac_email(self, send_smtp_email, **kwargs):
+        self._client.sanitize_for_serialization(send_smtp_email)
+        return SimpleNamespace(message_id='<bench@smtp-relay.mailin.fr>', message_ids=None)
+
+
+# =============================================================================
+# ENTORNO
+# =============================================================================
+
+def _setup_django(runtime_dir: str) -> None:
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    os.environ['PAYMENTS_RUNTIME_DIR'] = runtime_dir
+    os.environ['PAYMENTS_BACKGROUND_AUTOSTART'] = 'false'
+    # Sin threads del outbox: se mide el request, no el envío en segundo plano
+    os.environ['EMAIL_OUTBOX_WORKERS'] = '0'
+    os.environ.setdefault('MP_ACCESS_TOKEN', 'TEST-benchmark')
+    os.environ.setdefault('EMAIL_HOST_PASSWORD', 'benchmark')
+    os.environ.setdefault('DEFAULT_FROM_EMAIL', 'bench@example.com')
+    os.environ.setdefault('TRACE_LEVEL', 'WARNING')
+
+    import django
+    from django.conf import settings
+
+    django.setup()
+    settings.DATABASES['default']['NAME'] = str(Path(runtime_dir) / 'bench.sqlite3')
+    settings.ALLOWED_HOSTS = ['*']
+
+    from django.core.management import call_command
+
+    call_command('migrate', verbosity=0)
+
+    from payments import clients, inbox
+
+    payment_template = json.loads(MP_PAYMENT_FIXTURE.read_text())
+    fake_sdk = FakeMercadoPagoSDK(payment_template)
+    fake_brevo = FakeBrevoApi()
+    clients.get_mp_sdk = lambda: fake_sdk
+    clients.get_brevo_api = lambda: fake_brevo
+    # El consumidor del inbox consultaría el pago en paralelo al benchmark
+    inbox.start_consumer = lambda: None
+    # Los logs por request ([OUTBOX] ...) a la consola agregan ruido que no es del código medido
+    logging.disable(logging.WARNING)
+
+
+def _teardown_django() -> None:
+    from payments import journal, ledger
+
+    # Antes de borrar la base temporal: escribir el ledger y el journal
+    ledger.stop_writer(timeout=2)
+    ledger.flush()
+    journal.close_journal()
+
+
+# =============================================================================
+# CASOS
+# =============================================================================
+
+@dataclass
+class Case:
+    name: str
+    func: Callable[[], Any]
+    iterations: int
+
+
+def _cases(quick: bool) -> list[Case]:
+    from django.test import Client, RequestFactory
+
+    from payments.catalog import get_catalog
+    from payments.services import send_product_email
+    from payments.views import build_preference_data, parse_checkout
+
+    scale = 10 if quick else 1
+    client = Client()
+    factory = RequestFactory()
+    ids = itertools.count(7_000_000_000)
+    checkout_body = json.dumps({'first_name': 'Ana', 'last_name': 'Gómez', 'document': '30.111.222',
+                                'email': 'Comprador@Example.com', 'course_id': 'tracker-habitos'})
+
+    def preference_payload():
+        request = factory.post('/api/payments/create-preference/', checkout_body, content_type='application/json')
+        checkout, error = parse_checkout(request)
+        return build_preference_data(checkout)
+
+    def validate_new():
+        response = client.get('/api/payments/validate/', {'payment_id': str(next(ids))})
+        assert response.status_code == 200, response.content
+
+    repeated_id = str(next(ids))
+    client.get('/api/payments/validate/', {'payment_id': repeated_id})
+
+    def validate_repeat():
+        response = client.get('/api/payments/validate/', {'payment_id': repeated_id})
+        assert response.status_code == 200, response.content
+
+    def webhook(payment_id: str, notification_id: int):
+        body = json.dumps({'id': notification_id, 'type': 'payment', 'action': 'payment.updated',
+                           'data': {'id': payment_id}})
+        response = client.post(f"/api/payments/webhook/?data.id={payment_id}&type=payment", body,
+                               content_type='application/json')
+        assert response.status_code == 200, response.content
+
+    def webhook_new():
+        payment_id = next(ids)
+        webhook(str(payment_id), payment_id)
+
+    duplicate_id = next(ids)
+    webhook(str(duplicate_id), duplicate_id)
+
+    def webhook_duplicate():
+        webhook(str(duplicate_id), duplicate_id)
+
+    payment_text = MP_PAYMENT_FIXTURE.read_text()
+    payment_data = json.loads(payment_text)
+
+    cases = [
+        Case('preference_payload', preference_payload, 2000 // scale),
+        Case('validate_new', validate_new, 300 // scale),
+        Case('validate_repeat', validate_repeat, 1000 // scale),
+        Case('webhook_new', webhook_new, 300 // scale),
+        Case('webhook_duplicate', webhook_duplicate, 1000 // scale),
+        Case('mp_payment_parse', lambda: json.loads(payment_text), 20000 // scale),
+        Case('mp_payment_serialize', lambda: json.dumps(payment_data), 20000 // scale),
+    ]
+    for product in get_catalog():
+        order = SimpleNamespace(id='bench-order', first_name='Ana', email='comprador@example.com',
+                                course_id=product.id, course_title=product.title)
+        cases.append(Case(f"email_send[{product.id}]", lambda order=order: send_product_email(order), 1000 // scale))
+    return cases
+
+
+def _per_op_us(func: Callable[[], Any], iterations: int, repeat: int) -> float:
+    func()   # calentar cachés (esqueletos, conexiones, statements)
+    best = min(timeit.repeat(func, number=max(iterations, 1), repeat=repeat))
+    return round(best / max(iterations, 1) * 1_000_000, 2)
+
+
+def run(name_filter: str | None, repeat: int, quick: bool) -> dict[str, Any]:
+    results = {}
+    for case in _cases(quick):
+        if name_filter and name_filter not in case.name:
+            continue
+        started = time.perf_counter()
+        results[case.name] = {'us_per_op': _per_op_us(case.func, case.iterations, repeat),
+                              'iterations': case.iterations}
+        print(f"  {case.name:<40} {results[case.name]['us_per_op']:>12.2f} µs/op "
+              f"({time.perf_counter() - started:.1f}s)", file=sys.stderr)
+    return results
+
+
+# =============================================================================
+# BASELINES
+# =============================================================================
+
+def _machine() -> dict[str, Any]:
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def save_baseline(path: Path, results: dict[str, Any], repeat: int) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'machine': _machine(),
+        'repeat': repeat,
+        'results': results,
+    }, indent=2, ensure_ascii=False) + '\n')
+
+
+def compare(baseline: dict[str, Any], results: dict[str, Any], tolerance: float) -> tuple[list[dict[str, Any]], bool]:
+    """Filas de la comparación y si hubo alguna regresión."""
+    rows, regressed = [], False
+    for name, current in results.items():
+        previous = baseline['results'].get(name)
+        if previous is None:
+            rows.append({'case': name, 'baseline_us': None, 'current_us': current['us_per_op'], 'status': 'new'})
+            continue
+        ratio = current['us_per_op'] / previous['us_per_op'] if previous['us_per_op'] else 1.0
+        status = 'ok'
+        if ratio > 1 + tolerance:
+            status = 'REGRESSION'
+            regressed = True
+        elif ratio < 1 - tolerance:
+            status = 'faster'
+        rows.append({'case': name, 'baseline_us': previous['us_per_op'], 'current_us': current['us_per_op'],
+                     'change_pct': round((ratio - 1) * 100, 1), 'status': status})
+    return rows, regressed
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='corridas por caso (se toma la mejor)')
+    parser.add_argument('--filter', help='solo los casos cuyo nombre contiene este texto')
+    parser.add_argument('--quick', action='store_true', help='10 veces menos iteraciones (más ruido)')
+    parser.add_argument('--baseline', type=Path, default=DEFAULT_BASELINE, help='archivo de baseline')
+    parser.add_argument('--save', action='store_true', help='guardar el resultado como baseline')
+    parser.add_argument('--compare', action='store_true', help='comparar contra el baseline (código 1 si empeoró)')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='empeoramiento tolerado (default 0.25 = 25%%)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='bench-hot-paths-') as runtime_dir:
+        _setup_django(runtime_dir)
+        try:
+            results = run(args.filter, args.repeat, args.quick)
+        finally:
+            _teardown_django()
+
+    report: dict[str, Any] = {'results': results}
+    regressed = False
+    if args.compare:
+        try:
+            baseline = json.loads(args.baseline.read_text())
+        except FileNotFoundError:
+            parser.error(f"No hay baseline en {args.baseline} (generarlo con --save)")
+        if baseline.get('machine') != _machine():
+            print(f"⚠️ Baseline de otra máquina ({baseline.get('machine')}): la comparación es orientativa",
+                  file=sys.stderr)
+        rows, regressed = compare(baseline, results, args.tolerance)
+        report = {'baseline': str(args.baseline), 'tolerance': args.tolerance, 'comparison': rows}
+    if args.save:
+        save_baseline(args.baseline, results, args.repeat)
+        report['saved'] = str(args.baseline)
+
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if regressed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
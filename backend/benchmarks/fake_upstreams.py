@@ -0,0 +1,439 @@
+"""
+Mercado Pago y Brevo falsos (HTTP local) - Datos con Alex
+==========================================================
+Servidores HTTP que imitan lo que el backend usa de cada upstream, para
+pruebas de carga sin cobrar tarjetas ni mandar emails reales:
+
+- Mercado Pago: POST /checkout/preferences, GET /v1/payments/<id>,
+  GET /v1/payments/search. Un pago existe cuando el "comprador" paga la
+  preferencia: POST /_fake/pay {"preference_id": ...} (el pago queda
+  aprobado con la metadata de la preferencia, como en MP) y cambia de
+  estado con POST /_fake/update {"payment_id": ..., "status": "refunded"}
+- Brevo: POST /smtp/email (envío simple y con messageVersions). Cuenta
+  los emails recibidos por destinatario: GET /_fake/deliveries?prefix=...
+
+Cada servidor tiene su perfil de fallas (FaultProfile): distribución de
+latencia, proporción de errores 5xx y proporción de 429 con Retry-After.
+Las rutas /_fake/* no tienen latencia ni fallas.
+
+Latencias (segundos):
+    0.1                 fija
+    uniform:0.05:0.3    uniforme entre 0.05 y 0.3
+    normal:0.1:0.03     normal (media, desvío), nunca negativa
+    lognormal:0.08:0.6  lognormal (mediana, sigma): cola larga como MP
+
+Uso (desde backend/), y después arrancar el backend con
+MP_API_BASE_URL / BREVO_API_BASE_URL apuntando a las URLs impresas:
+    python -m benchmarks.fake_upstreams --mp-latency lognormal:0.15:0.5 --mp-error-rate 0.02
+==========================================================
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import math
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable
+from urllib.parse import parse_qs, urlsplit
+
+
+# =============================================================================
+# PERFIL DE FALLAS
+# =============================================================================
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """Función que devuelve una latencia (segundos) según `spec`."""
+    kind, _, params = spec.partition(':')
+    try:
+        if not params:
+            value = float(kind)
+            return lambda: value
+        args = [float(p) for p in params.split(':')]
+        if kind == 'uniform':
+            low, high = args
+            return lambda: random.uniform(low, high)
+        if kind == 'normal':
+            mean, stddev = args
+            return lambda: max(random.gauss(mean, stddev), 0.0)
+        if kind == 'lognormal':
+            median, sigma = args
+            return lambda: random.lognormvariate(math.log(median), sigma)
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError(f"latencia inválida: {spec!r} (ver --help)")
+
+
+@dataclass
+class FaultProfile:
+    latency: Callable[[], float] = field(default=lambda: 0.0)
+    error_rate: float = 0.0        # proporción de respuestas 500/503
+    rate_limit_rate: float = 0.0   # proporción de respuestas 429
+    retry_after: int = 1           # Retry-After de los 429 (segundos)
+
+    def pick(self) -> int | None:
+        """Status de falla para este request, o None si responde normal."""
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            return 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return random.choice((500, 503))
+        return None
+
+
+class _Counters:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.values: Counter[str] = Counter()
+
+    def incr(self, name: str) -> None:
+        with self._lock:
+            self.values[name] += 1
+
+    def snapshot(self) -> dict[str, int]:
+        with self._lock:
+            return dict(self.values)
+
+
+class _FakeHandler(BaseHTTPRequestHandler):
+    """Base: lectura del body, respuestas JSON y fallas inyectadas."""
+
+    protocol_version = 'HTTP/1.1'
+    profile = FaultProfile()
+    state: Any = None
+
+    def _read_json(self) -> Any:
+        raw = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        try:
+            return json.loads(raw) if raw else {}
+        except ValueError:
+            return None
+
+    def _reply(self, status: int, body: Any, headers: dict[str, str] | None = None) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _inject(self) -> bool:
+        """Aplica latencia y, si toca, responde una falla. True si respondió."""
+        time.sleep(self.profile.latency())
+        status = self.profile.pick()
+        if status is None:
+            return False
+        self.state.counters.incr(f"injected_{status}")
+        headers = {'Retry-After': str(self.profile.retry_after)} if status == 429 else None
+        self._reply(status, self.error_body(status), headers)
+        return True
+
+    def error_body(self, status: int) -> dict[str, Any]:
+        return {'status': status, 'message': 'fake upstream error'}
+
+    def do_HEAD(self) -> None:
+        # clients.warm_clients() abre la conexión con un HEAD a la base
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def _serve(handler: type[_FakeHandler], port: int, host: str) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    server.request_queue_size = 1024
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# =============================================================================
+# MERCADO PAGO FALSO
+# =============================================================================
+
+class FakeMercadoPagoState:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.preferences: dict[str, dict[str, Any]] = {}
+        self.payments: dict[str, dict[str, Any]] = {}
+        self.payment_gets: Counter[str] = Counter()   # GET /v1/payments/<id> por pago
+        # Ids altos y distintos en cada arranque: no chocan con una base ya usada
+        self._payment_ids = itertools.count(int(time.time()) * 1000)
+        self.counters = _Counters()
+
+    def create_preference(self, data: dict[str, Any]) -> dict[str, Any]:
+        preference_id = f"fake-{uuid.uuid4().hex[:16]}"
+        preference = {
+            **data,
+            'id': preference_id,
+            'init_point': f"https://mp.fake/checkout?pref_id={preference_id}",
+            'sandbox_init_point': f"https://sandbox.mp.fake/checkout?pref_id={preference_id}",
+            'date_created': _now(),
+        }
+        with self._lock:
+            self.preferences[preference_id] = preference
+        return preference
+
+    def pay(self, preference_id: str, status: str = 'approved') -> dict[str, Any] | None:
+        with self._lock:
+            preference = self.preferences.get(preference_id)
+            if preference is None:
+                return None
+            payment_id = next(self._payment_ids)
+        item = (preference.get('items') or [{}])[0]
+        now = _now()
+        payment = {
+            'id': payment_id,
+            'status': status,
+            'status_detail': 'accredited' if status == 'approved' else status,
+            'date_created': now,
+            'date_last_updated': now,
+            'date_approved': now if status == 'approved' else None,
+            'transaction_amount': item.get('unit_price', 0),
+            'currency_id': item.get('currency_id', 'ARS'),
+            'external_reference': preference.get('external_reference'),
+            'preference_id': preference_id,
+            'payer': preference.get('payer') or {},
+            'metadata': preference.get('metadata') or {},
+        }
+        with self._lock:
+            self.payments[str(payment_id)] = payment
+        self.counters.incr('payments_created')
+        return payment
+
+    def get_payment(self, payment_id: str) -> dict[str, Any] | None:
+        with self._lock:
+            self.payment_gets[payment_id] += 1
+            return self.payments.get(payment_id)
+
+    def update(self, payment_id: str, status: str) -> dict[str, Any] | None:
+        """Cambia el estado de un pago (reembolso, contracargo, ...)."""
+        with self._lock:
+            payment = self.payments.get(payment_id)
+            if payment is not None:
+                payment.update(status=status, status_detail=status, date_last_updated=_now())
+            return payment
+
+    def search(self, query: dict[str, str]) -> dict[str, Any]:
+        field_name = query.get('range') or 'date_created'
+        with self._lock:
+            payments = list(self.payments.values())
+        if query.get('status'):
+            payments = [p for p in payments if p['status'] == query['status']]
+        if query.get('begin_date'):
+            begin = _parse_date(query['begin_date'])
+            payments = [p for p in payments if _parse_date(p[field_name]) >= begin]
+        if query.get('end_date') and query['end_date'] != 'NOW':
+            end = _parse_date(query['end_date'])
+            payments = [p for p in payments if _parse_date(p[field_name]) <= end]
+        payments.sort(key=lambda p: (p[query.get('sort') or 'date_created'], p['id']),
+                      reverse=query.get('criteria') == 'desc')
+        self.counters.incr('searches')
+        offset = int(query.get('offset') or 0)
+        limit = int(query.get('limit') or 30)
+        return {
+            'paging': {'total': len(payments), 'limit': limit, 'offset': offset},
+            'results': payments[offset:offset + limit],
+        }
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            counts = {'preferences': len(self.preferences), 'payments': len(self.payments)}
+        return {**counts, **self.counters.snapshot()}
+
+
+class FakeMercadoPagoHandler(_FakeHandler):
+    state: FakeMercadoPagoState
+
+    def error_body(self, status: int) -> dict[str, Any]:
+        return {'message': 'fake upstream error', 'error': 'internal_error', 'status': status, 'cause': []}
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        if url.path == '/_fake/stats':
+            self._reply(200, self.state.stats())
+            return
+        self.state.counters.incr('requests')
+        if self._inject():
+            return
+        if url.path.rstrip('/') == '/v1/payments/search':
+            query = {k: v[0] for k, v in parse_qs(url.query).items()}
+            self._reply(200, self.state.search(query))
+            return
+        payment_id = url.path.rstrip('/').rsplit('/', 1)[-1]
+        payment = self.state.get_payment(payment_id)
+        if payment is None:
+            self._reply(404, {'message': 'Payment not found', 'error': 'not_found', 'status': 404, 'cause': []})
+            return
+        self._reply(200, payment)
+
+    def do_POST(self) -> None:
+        url = urlsplit(self.path)
+        body = self._read_json()
+        if url.path == '/_fake/update':
+            payment = self.state.update(str((body or {}).get('payment_id', '')), (body or {}).get('status', 'refunded'))
+            self._reply(200 if payment else 404, payment or {'message': 'payment not found'})
+            return
+        if url.path == '/_fake/pay':
+            payment = self.state.pay(str((body or {}).get('preference_id', '')), (body or {}).get('status', 'approved'))
+            self._reply(201 if payment else 404, payment or {'message': 'preference not found'})
+            return
+        self.state.counters.incr('requests')
+        if self._inject():
+            return
+        if url.path.rstrip('/') != '/checkout/preferences' or not isinstance(body, dict):
+            self._reply(400, {'message': 'bad request', 'error': 'bad_request', 'status': 400, 'cause': []})
+            return
+        self._reply(201, self.state.create_preference(body))
+
+
+def start_fake_mercadopago(
+    profile: FaultProfile | None = None, port: int = 0, host: str = '127.0.0.1',
+) -> tuple[ThreadingHTTPServer, FakeMercadoPagoState]:
+    state = FakeMercadoPagoState()
+    handler = type('FakeMercadoPago', (FakeMercadoPagoHandler,), {'profile': profile or FaultProfile(), 'state': state})
+    return _serve(handler, port, host), state
+
+
+# =============================================================================
+# BREVO FALSO
+# =============================================================================
+
+class FakeBrevoState:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.deliveries: Counter[str] = Counter()
+        self.counters = _Counters()
+
+    def record(self, message: dict[str, Any]) -> list[str]:
+        """Registra un envío. Retorna un message id por destinatario."""
+        versions = message.get('messageVersions') or [{'to': message.get('to') or []}]
+        recipients = [(to.get('email') or '').lower() for version in versions for to in version.get('to') or []]
+        with self._lock:
+            self.deliveries.update(recipients)
+        self.counters.incr('messages')
+        return [f"<{uuid.uuid4().hex}@smtp-relay.fake>" for _ in recipients]
+
+    def deliveries_for(self, prefix: str = '') -> dict[str, int]:
+        with self._lock:
+            return {email: count for email, count in self.deliveries.items() if email.startswith(prefix)}
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            counts = {
+                'recipients': len(self.deliveries),
+                'emails': sum(self.deliveries.values()),
+                'duplicate_emails': sum(count - 1 for count in self.deliveries.values() if count > 1),
+            }
+        return {**counts, **self.counters.snapshot()}
+
+
+class FakeBrevoHandler(_FakeHandler):
+    state: FakeBrevoState
+
+    def error_body(self, status: int) -> dict[str, Any]:
+        code = 'too_many_requests' if status == 429 else 'internal_error'
+        return {'code': code, 'message': 'fake upstream error'}
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        if url.path == '/_fake/stats':
+            self._reply(200, self.state.stats())
+        elif url.path == '/_fake/deliveries':
+            prefix = parse_qs(url.query).get('prefix', [''])[0].lower()
+            self._reply(200, self.state.deliveries_for(prefix))
+        else:
+            self._reply(404, {'code': 'not_found', 'message': 'not found'})
+
+    def do_POST(self) -> None:
+        body = self._read_json()
+        self.state.counters.incr('requests')
+        if self._inject():
+            return
+        if urlsplit(self.path).path.rstrip('/') != '/v3/smtp/email' or not isinstance(body, dict):
+            self._reply(400, {'code': 'invalid_parameter', 'message': 'bad request'})
+            return
+        message_ids = self.state.record(body)
+        if body.get('messageVersions'):
+            self._reply(201, {'messageIds': message_ids})
+        else:
+            self._reply(201, {'messageId': message_ids[0] if message_ids else ''})
+
+
+def start_fake_brevo(
+    profile: FaultProfile | None = None, port: int = 0, host: str = '127.0.0.1',
+) -> tuple[ThreadingHTTPServer, FakeBrevoState]:
+    state = FakeBrevoState()
+    handler = type('FakeBrevo', (FakeBrevoHandler,), {'profile': profile or FaultProfile(), 'state': state})
+    return _serve(handler, port, host), state
+
+
+def _now() -> str:
+    return datetime.now(timezone(timedelta(hours=-3))).isoformat(timespec='milliseconds')
+
+
+def _parse_date(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+
+def base_urls(mp_server: ThreadingHTTPServer, brevo_server: ThreadingHTTPServer) -> dict[str, str]:
+    """Variables de entorno para que el backend use los upstreams falsos."""
+    return {
+        'MP_API_BASE_URL': f"http://127.0.0.1:{mp_server.server_port}",
+        'BREVO_API_BASE_URL': f"http://127.0.0.1:{brevo_server.server_port}/v3",
+    }
+
+
+def add_profile_arguments(parser: argparse.ArgumentParser) -> None:
+    for name, label, latency in (('mp', 'Mercado Pago', 'lognormal:0.15:0.5'), ('brevo', 'Brevo', 'lognormal:0.3:0.4')):
+        parser.add_argument(f'--{name}-latency', type=parse_latency, default=parse_latency(latency),
+                            help=f"latencia de {label} (default {latency})")
+        parser.add_argument(f'--{name}-error-rate', type=float, default=0.0, help=f"proporción de 5xx de {label}")
+        parser.add_argument(f'--{name}-rate-limit', type=float, default=0.0, help=f"proporción de 429 de {label}")
+    parser.add_argument('--retry-after', type=int, default=1, help='Retry-After de los 429 (segundos)')
+
+
+def profiles_from_args(args: argparse.Namespace) -> tuple[FaultProfile, FaultProfile]:
+    return (
+        FaultProfile(args.mp_latency, args.mp_error_rate, args.mp_rate_limit, args.retry_after),
+        FaultProfile(args.brevo_latency, args.brevo_error_rate, args.brevo_rate_limit, args.retry_after),
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--mp-port', type=int, default=8081)
+    parser.add_argument('--brevo-port', type=int, default=8082)
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    mp_profile, brevo_profile = profiles_from_args(args)
+    mp_server, _ = start_fake_mercadopago(mp_profile, args.mp_port, args.host)
+    brevo_server, _ = start_fake_brevo(brevo_profile, args.brevo_port, args.host)
+    for name, value in base_urls(mp_server, brevo_server).items():
+        print(f"export {name}={value}")
+    print("Ctrl+C para terminar", file=sys.stderr)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        pass
+    mp_server.shutdown()
+    brevo_server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
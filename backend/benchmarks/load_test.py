@@ -0,0 +1,343 @@
+"""
+Prueba de carga del flujo de compra completo - Datos con Alex
+==============================================================
+Genera compras a un ritmo fijo (requests/segundo, lazo abierto: una
+compra nueva cada 1/rps aunque las anteriores no hayan terminado) contra
+un backend que usa los upstreams falsos de benchmarks/fake_upstreams.py.
+Cada compra es el flujo real:
+
+1. POST create-preference (email de comprador único por compra)
+2. El comprador paga en el MP falso (POST /_fake/pay, no se mide)
+3. A la vez, como en producción: GET validate (el comprador vuelve del
+   checkout) y `--webhooks` notificaciones de MP al webhook
+
+Al terminar espera a que el outbox entregue los emails y reporta, en
+JSON: throughput, p50/p95/p99 por endpoint, compras sin email y emails
+duplicados (un mismo comprador que recibió más de uno, contado en el
+Brevo falso). Termina con código 1 si hubo duplicados.
+
+Uso (desde backend/):
+    # todo en un comando: upstreams falsos + gunicorn con una base temporal
+    python -m benchmarks.load_test --spawn --rps 20 --duration 30
+    python -m benchmarks.load_test --spawn --rps 20 --mp-error-rate 0.05 --brevo-rate-limit 0.1
+
+    # contra un backend ya levantado (con MP_API_BASE_URL / BREVO_API_BASE_URL
+    # apuntando a `python -m benchmarks.fake_upstreams`)
+    python -m benchmarks.load_test --target http://127.0.0.1:8000 \\
+        --mp-fake http://127.0.0.1:8081 --brevo-fake http://127.0.0.1:8082
+
+Con --spawn se respetan las variables GUNICORN_* del entorno (p. ej.
+GUNICORN_WORKER_CLASS=uvicorn para las vistas async).
+==============================================================
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import hashlib
+import hmac
+import itertools
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterator
+
+import httpx
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+from benchmarks.fake_upstreams import (  # noqa: E402
+    add_profile_arguments, base_urls, profiles_from_args, start_fake_brevo, start_fake_mercadopago,
+)
+
+API = '/api/payments'
+PRODUCTS = ('tracker-habitos', 'planificador-financiero', 'pack-productividad')
+
+
+# =============================================================================
+# RESULTADOS
+# =============================================================================
+
+def _percentile(ordered: list[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, max(math.ceil(q * len(ordered)) - 1, 0))]
+
+
+@dataclass
+class Results:
+    latencies: dict[str, list[float]] = field(default_factory=dict)
+    statuses: dict[str, Counter[str]] = field(default_factory=dict)
+    expected: set[str] = field(default_factory=set)
+    started: int = 0
+    completed: int = 0
+    dropped: int = 0
+
+    def record(self, endpoint: str, seconds: float, status: str) -> None:
+        self.latencies.setdefault(endpoint, []).append(seconds)
+        self.statuses.setdefault(endpoint, Counter())[status] += 1
+
+    def endpoint_summary(self) -> dict[str, Any]:
+        summary = {}
+        for endpoint, latencies in self.latencies.items():
+            ordered = sorted(latencies)
+            statuses = self.statuses[endpoint]
+            summary[endpoint] = {
+                'requests': len(ordered),
+                'errors': sum(count for status, count in statuses.items() if not status.startswith('2')),
+                'statuses': dict(sorted(statuses.items())),
+                'p50_ms': round(_percentile(ordered, 0.50) * 1000, 1),
+                'p95_ms': round(_percentile(ordered, 0.95) * 1000, 1),
+                'p99_ms': round(_percentile(ordered, 0.99) * 1000, 1),
+                'max_ms': round(ordered[-1] * 1000, 1),
+            }
+        return summary
+
+
+# =============================================================================
+# FLUJO DE COMPRA
+# =============================================================================
+
+class LoadTest:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.run_id = uuid.uuid4().hex[:8]
+        self.results = Results()
+        self._notification_ids = itertools.count(int(time.time()) * 1000)
+
+    def email(self, n: int) -> str:
+        return f"load-{self.run_id}-{n}@example.com"
+
+    async def _timed(self, endpoint: str, request) -> httpx.Response | None:
+        started = time.perf_counter()
+        try:
+            response = await request
+        except httpx.HTTPError as e:
+            self.results.record(endpoint, time.perf_counter() - started, type(e).__name__)
+            return None
+        self.results.record(endpoint, time.perf_counter() - started, str(response.status_code))
+        return response
+
+    def _webhook_headers(self, payment_id: str) -> dict[str, str]:
+        request_id = str(uuid.uuid4())
+        headers = {'X-Request-Id': request_id}
+        if self.args.webhook_secret:
+            # Misma cuenta que payments/webhook_guard.sign()
+            ts = str(int(time.time() * 1000))
+            manifest = f"id:{payment_id};request-id:{request_id};ts:{ts};"
+            v1 = hmac.new(self.args.webhook_secret.encode(), manifest.encode(), hashlib.sha256).hexdigest()
+            headers['X-Signature'] = f"ts={ts},v1={v1}"
+        return headers
+
+    async def webhook(self, client: httpx.AsyncClient, payment_id: str, action: str) -> None:
+        body = {'id': next(self._notification_ids), 'type': 'payment', 'action': action,
+                'data': {'id': payment_id}, 'live_mode': False}
+        await self._timed('webhook', client.post(
+            f"{self.args.target}{API}/webhook/", params={'data.id': payment_id, 'type': 'payment'},
+            json=body, headers=self._webhook_headers(payment_id),
+        ))
+
+    async def flow(self, client: httpx.AsyncClient, n: int) -> None:
+        started = time.perf_counter()
+        checkout = {'first_name': 'Carga', 'last_name': f"Prueba {n}", 'document': str(30_000_000 + n),
+                    'email': self.email(n), 'course_id': PRODUCTS[n % len(PRODUCTS)]}
+        response = await self._timed('create_preference', client.post(
+            f"{self.args.target}{API}/create-preference/", json=checkout,
+        ))
+        if response is None or response.status_code != 200:
+            return
+        paid = await client.post(f"{self.args.mp_fake}/_fake/pay",
+                                 json={'preference_id': response.json()['preference_id']})
+        payment_id = str(paid.json()['id'])
+        self.results.expected.add(checkout['email'])
+
+        # El comprador vuelve del checkout mientras MP avisa por webhook
+        actions = ['payment.created'] + ['payment.updated'] * (self.args.webhooks - 1)
+        await asyncio.gather(
+            self._timed('validate', client.get(f"{self.args.target}{API}/validate/",
+                                               params={'payment_id': payment_id})),
+            *(self.webhook(client, payment_id, action) for action in actions[:self.args.webhooks]),
+        )
+        self.results.completed += 1
+        self.results.record('flow', time.perf_counter() - started, '200')
+
+    async def run(self) -> float:
+        """Lanza las compras a `rps` por segundo. Retorna los segundos que tomó."""
+        args = self.args
+        total = max(int(args.rps * args.duration), 1)
+        limits = httpx.Limits(max_connections=args.max_in_flight * (args.webhooks + 1))
+        async with httpx.AsyncClient(timeout=args.timeout, limits=limits) as client:
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            in_flight: set[asyncio.Task] = set()
+            for n in range(total):
+                delay = started + n / args.rps - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                if len(in_flight) >= args.max_in_flight:
+                    # El backend no da abasto: se registra en vez de acumular
+                    self.results.dropped += 1
+                    continue
+                task = asyncio.create_task(self.flow(client, n))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+                self.results.started += 1
+            await asyncio.gather(*in_flight)
+            return loop.time() - started
+
+    def drain(self) -> dict[str, Any]:
+        """Espera a que el outbox mande los emails y cuenta entregas por comprador."""
+        prefix = f"load-{self.run_id}-"
+        started = time.monotonic()
+        deliveries: dict[str, int] = {}
+        while True:
+            deliveries = httpx.get(f"{self.args.brevo_fake}/_fake/deliveries", params={'prefix': prefix}).json()
+            if self.results.expected <= deliveries.keys() or time.monotonic() - started > self.args.drain:
+                break
+            time.sleep(0.5)
+        duplicates = {email: count for email, count in deliveries.items() if count > 1}
+        return {
+            'expected': len(self.results.expected),
+            'delivered': len(self.results.expected & deliveries.keys()),
+            'missing': len(self.results.expected - deliveries.keys()),
+            'duplicate_deliveries': sum(count - 1 for count in duplicates.values()),
+            'duplicate_recipients': sorted(duplicates)[:10],
+            'drain_s': round(time.monotonic() - started, 1),
+        }
+
+    def report(self, elapsed: float) -> dict[str, Any]:
+        endpoints = self.results.endpoint_summary()
+        requests = sum(e['requests'] for name, e in endpoints.items() if name != 'flow')
+        deliveries = self.drain()
+        upstreams = {
+            'mercadopago': httpx.get(f"{self.args.mp_fake}/_fake/stats").json(),
+            'brevo': httpx.get(f"{self.args.brevo_fake}/_fake/stats").json(),
+        }
+        return {
+            'target': self.args.target,
+            'target_rps': self.args.rps,
+            'seconds': round(elapsed, 1),
+            'flows': {'started': self.results.started, 'completed': self.results.completed,
+                      'dropped': self.results.dropped},
+            'throughput': {'flows_per_s': round(self.results.completed / elapsed, 1),
+                           'requests_per_s': round(requests / elapsed, 1)},
+            'endpoints': endpoints,
+            'deliveries': deliveries,
+            'upstreams': upstreams,
+        }
+
+
+# =============================================================================
+# BACKEND LOCAL (--spawn)
+# =============================================================================
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def spawn_backend(args: argparse.Namespace) -> Iterator[None]:
+    """Upstreams falsos + gunicorn con una base y un runtime temporales."""
+    mp_profile, brevo_profile = profiles_from_args(args)
+    mp_server, _ = start_fake_mercadopago(mp_profile)
+    brevo_server, _ = start_fake_brevo(brevo_profile)
+    port = _free_port()
+    args.target = f"http://127.0.0.1:{port}"
+    args.mp_fake = f"http://127.0.0.1:{mp_server.server_port}"
+    args.brevo_fake = f"http://127.0.0.1:{brevo_server.server_port}"
+
+    with tempfile.TemporaryDirectory(prefix='load-test-') as runtime_dir:
+        env = {
+            **os.environ,
+            **base_urls(mp_server, brevo_server),
+            'PORT': str(port),
+            'SQLITE_PATH': str(Path(runtime_dir) / 'load.sqlite3'),
+            'PAYMENTS_RUNTIME_DIR': runtime_dir,
+            # Credenciales de mentira: nunca se usan las reales del entorno
+            'MP_ACCESS_TOKEN': 'TEST-load-test',
+            'EMAIL_HOST_PASSWORD': 'load-test',
+            'DEFAULT_FROM_EMAIL': 'load-test@example.com',
+            'MP_WEBHOOK_SECRET': args.webhook_secret,
+        }
+        migrate = subprocess.run([sys.executable, 'manage.py', 'migrate', '--noinput'], cwd=BACKEND_DIR, env=env,
+                                 capture_output=True, text=True)
+        if migrate.returncode:
+            sys.exit(f"migrate falló:\n{migrate.stdout}{migrate.stderr}")
+        log_path = Path(runtime_dir) / 'gunicorn.log'
+        with open(log_path, 'w') as log:
+            process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py'],
+                                       cwd=BACKEND_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+            try:
+                _wait_ready(args.target, process, log_path)
+                yield
+            finally:
+                process.terminate()
+                try:
+                    process.wait(timeout=30)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+                if args.backend_log:
+                    print(log_path.read_text(), file=sys.stderr)
+    mp_server.shutdown()
+    brevo_server.shutdown()
+
+
+def _wait_ready(target: str, process: subprocess.Popen, log_path: Path, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"gunicorn terminó al arrancar:\n{log_path.read_text()}")
+        try:
+            if httpx.get(f"{target}{API}/health/").status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    sys.exit(f"gunicorn no respondió en {timeout:.0f}s:\n{log_path.read_text()}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--spawn', action='store_true', help='levantar upstreams falsos y gunicorn')
+    parser.add_argument('--target', default='http://127.0.0.1:8000', help='URL del backend (sin --spawn)')
+    parser.add_argument('--mp-fake', default='http://127.0.0.1:8081', help='URL del MP falso (sin --spawn)')
+    parser.add_argument('--brevo-fake', default='http://127.0.0.1:8082', help='URL del Brevo falso (sin --spawn)')
+    parser.add_argument('--rps', type=float, default=10.0, help='compras nuevas por segundo')
+    parser.add_argument('--duration', type=float, default=30.0, help='segundos generando compras')
+    parser.add_argument('--webhooks', type=int, default=2, help='notificaciones de MP por pago')
+    parser.add_argument('--max-in-flight', type=int, default=200, help='compras en curso como máximo')
+    parser.add_argument('--timeout', type=float, default=30.0, help='timeout por request (segundos)')
+    parser.add_argument('--drain', type=float, default=60.0, help='segundos máximos esperando los emails')
+    parser.add_argument('--webhook-secret', default=os.environ.get('MP_WEBHOOK_SECRET', ''),
+                        help='clave para firmar los webhooks (default MP_WEBHOOK_SECRET)')
+    parser.add_argument('--backend-log', action='store_true', help='imprimir el log de gunicorn (con --spawn)')
+    add_profile_arguments(parser)
+    args = parser.parse_args()
+
+    load_test = LoadTest(args)
+    if args.spawn:
+        with spawn_backend(args):
+            elapsed = asyncio.run(load_test.run())
+            report = load_test.report(elapsed)
+    else:
+        elapsed = asyncio.run(load_test.run())
+        report = load_test.report(elapsed)
+    print(json.dumps(report, indent=2))
+    if report['deliveries']['duplicate_deliveries']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,29 @@
+"""
+ASGI config for ALEXCEL backend
+
+    uvicorn config.asgi:application --host 0.0.0.0 --port $PORT --workers 2
+
+create-preference, validate y webhook se sirven con las vistas async
+(payments/views_async.py); el resto de las rutas son las mismas de WSGI.
+"""
+
+import os
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+os.environ.setdefault('PAYMENTS_ASYNC_VIEWS', 'true')
+application = get_asgi_application()
+
+# Catálogo, bundles, adjuntos y emails: solo en procesos que sirven requests
+from payments.startup import warm_up  # noqa: E402
+
+warm_up()
+
+# Workers del outbox de emails y consumidor del inbox de webhooks
+from payments.inbox import start_consumer  # noqa: E402
+from payments.outbox import start_workers  # noqa: E402
+
+# Con gunicorn.conf.py los arranca post_worker_init en cada worker
+if os.environ.get('PAYMENTS_BACKGROUND_AUTOSTART', 'true').lower() == 'true':
+    start_workers()
+    start_consumer()
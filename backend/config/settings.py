@@ -38,6 +38,8 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'payments.middleware.RequestMetricsMiddleware',
+    'payments.middleware.ServerTimingMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -46,25 +48,92 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
             ],
+            # Templates compilados una vez por proceso (incluye los emails)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
 
 WSGI_APPLICATION = 'config.wsgi.application'
+ASGI_APPLICATION = 'config.asgi.application'
+
+# Vistas async para create-preference, validate y webhook (config/asgi.py
+# las activa; con WSGI quedan las sync de payments/views.py)
+PAYMENTS_ASYNC_VIEWS = os.getenv('PAYMENTS_ASYNC_VIEWS', 'False').lower() == 'true'
+
+# Directorio de estado local del proceso (locks, journal, bundles, métricas).
+# En Railway es efímero: solo guarda datos que se pueden reconstruir.
+PAYMENTS_RUNTIME_DIR = Path(os.getenv('PAYMENTS_RUNTIME_DIR', BASE_DIR / 'var'))
+
+# Catálogo de productos (JSON o TOML) y archivos que se entregan
+PAYMENTS_CATALOG_PATH = Path(os.getenv('PAYMENTS_CATALOG_PATH', BASE_DIR / 'catalog.json'))
+PAYMENTS_FILES_DIR = Path(os.getenv('PAYMENTS_FILES_DIR', BASE_DIR / 'files'))
+
+# Links de descarga firmados en vez de adjuntos (ver payments/downloads.py).
+# Requiere la URL pública del backend: sin DOWNLOAD_BASE_URL se adjuntan.
+PAYMENT_DOWNLOADS = {
+    'enabled': os.getenv('DOWNLOAD_LINKS', 'False').lower() == 'true',
+    'base_url': os.getenv('DOWNLOAD_BASE_URL', ''),
+    'secret': os.getenv('DOWNLOAD_TOKEN_SECRET', ''),  # vacío = SECRET_KEY
+    'ttl': int(os.getenv('DOWNLOAD_LINK_TTL', str(7 * 24 * 3600))),
+    'max_downloads': int(os.getenv('DOWNLOAD_MAX_PER_LINK', '0')),  # por archivo, contado en bytes; 0 = sin tope
+}
+
+# Un solo zip para los productos con varios archivos (ver payments/bundles.py)
+PAYMENT_BUNDLES = {
+    'enabled': os.getenv('PAYMENT_BUNDLES', 'True').lower() == 'true',
+    'compression_level': int(os.getenv('PAYMENT_BUNDLES_COMPRESSION', '9')),
+}
+
+# Emails de entrega (templates en payments/templates/payments/email/)
+PAYMENTS_EMAIL = {
+    'language': os.getenv('EMAIL_LANGUAGE', 'es'),  # es | en
+    'sender_name': os.getenv('EMAIL_SENDER_NAME', 'Datos con Alex'),
+}
 
 # Base de datos SQLite para Orders (Railway tiene almacenamiento efímero, pero funciona para logs)
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        # SQLITE_PATH: otra base para pruebas de carga (benchmarks/load_test.py)
+        'NAME': Path(os.getenv('SQLITE_PATH', BASE_DIR / 'db.sqlite3')),
+        # Varios gunicorn workers + threads del outbox escriben en paralelo:
+        # esperar el lock en vez de fallar con "database is locked"
+        'OPTIONS': {
+            'timeout': 20,
+        },
+        # Base de los tests en un archivo (no en memoria): las pruebas de
+        # concurrencia (payments/tests/) la comparten entre varios procesos
+        'TEST': {
+            'NAME': Path(os.getenv('SQLITE_TEST_PATH', BASE_DIR / 'db.sqlite3-test')),
+        },
     }
 }
 
+# Cachés compartidos entre gunicorn workers
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Consultas a Mercado Pago (ver payments/payment_cache.py)
+    'payments': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': str(PAYMENTS_RUNTIME_DIR / 'cache'),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('PAYMENTS_CACHE_MAX_ENTRIES', '10000')),
+        },
+    },
+}
+
 # Internationalization
 LANGUAGE_CODE = 'es-ar'
 TIME_ZONE = 'America/Argentina/Buenos_Aires'
@@ -104,8 +173,11 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'idempotency-key',
 ]
 
+CORS_EXPOSE_HEADERS = ['idempotent-replayed']
+
 # ==============================================================================
 # EMAIL CONFIGURATION - Gmail SMTP
 # ==============================================================================
@@ -130,6 +202,182 @@ if not EMAIL_HOST_USER:
 if not EMAIL_HOST_PASSWORD:
     _startup_logger.warning("⚠️ EMAIL_HOST_PASSWORD no configurado - El envío de emails fallará")
 
+# ==============================================================================
+# CLIENTES HTTP SALIENTES (uno por proceso, ver payments/clients.py)
+# ==============================================================================
+# Timeouts en segundos; pool_maxsize = conexiones keep-alive por host.
+# deadline = tiempo total de una llamada con reintentos; breaker_* = circuit
+# breaker por upstream (ver payments/resilience.py)
+OUTBOUND_HTTP = {
+    'mercadopago': {
+        'connect_timeout': float(os.environ.get('MP_CONNECT_TIMEOUT', '3.05')),
+        'read_timeout': float(os.environ.get('MP_READ_TIMEOUT', '10')),
+        'pool_maxsize': int(os.environ.get('MP_POOL_MAXSIZE', '10')),
+        'max_retries': int(os.environ.get('MP_MAX_RETRIES', '2')),
+        'deadline': float(os.environ.get('MP_DEADLINE', '15')),
+        'breaker_failures': int(os.environ.get('MP_BREAKER_FAILURES', '5')),
+        'breaker_reset_timeout': float(os.environ.get('MP_BREAKER_RESET_TIMEOUT', '30')),
+        # Solo para pruebas de carga / benchmarks contra un MP falso
+        'base_url': os.environ.get('MP_API_BASE_URL', 'https://api.mercadopago.com'),
+        # Conexiones simultáneas del cliente async (vistas ASGI)
+        'async_max_connections': int(os.environ.get('MP_ASYNC_MAX_CONNECTIONS', '100')),
+        'async_max_keepalive': int(os.environ.get('MP_ASYNC_MAX_KEEPALIVE', '20')),
+    },
+    'brevo': {
+        'connect_timeout': float(os.environ.get('BREVO_CONNECT_TIMEOUT', '3.05')),
+        'read_timeout': float(os.environ.get('BREVO_READ_TIMEOUT', '15')),
+        'pool_maxsize': int(os.environ.get('BREVO_POOL_MAXSIZE', '10')),
+        'deadline': float(os.environ.get('BREVO_DEADLINE', '20')),
+        'breaker_failures': int(os.environ.get('BREVO_BREAKER_FAILURES', '5')),
+        'breaker_reset_timeout': float(os.environ.get('BREVO_BREAKER_RESET_TIMEOUT', '60')),
+        # Solo para pruebas de carga contra un Brevo falso
+        'base_url': os.environ.get('BREVO_API_BASE_URL', 'https://api.sendinblue.com/v3'),
+    },
+}
+
+# ==============================================================================
+# OUTBOX DE EMAILS (ver payments/outbox.py)
+# ==============================================================================
+EMAIL_OUTBOX = {
+    'workers': int(os.environ.get('EMAIL_OUTBOX_WORKERS', '2')),  # threads por proceso (0 = desactivado)
+    'max_attempts': int(os.environ.get('EMAIL_OUTBOX_MAX_ATTEMPTS', '5')),
+    'backoff_base': float(os.environ.get('EMAIL_OUTBOX_BACKOFF_BASE', '30')),
+    'backoff_max': float(os.environ.get('EMAIL_OUTBOX_BACKOFF_MAX', '3600')),
+    'poll_interval': float(os.environ.get('EMAIL_OUTBOX_POLL_INTERVAL', '5')),
+    'lease_seconds': int(os.environ.get('EMAIL_OUTBOX_LEASE_SECONDS', '300')),
+    # Lotes por producto (message versions de Brevo): tamaño y espera máxima
+    'batch_size': int(os.environ.get('EMAIL_BATCH_SIZE', '50')),
+    'batch_window': float(os.environ.get('EMAIL_BATCH_WINDOW', '0.5')),
+}
+
+# ==============================================================================
+# TRACING DEL FLUJO DE PAGOS (ver payments/tracing.py)
+# ==============================================================================
+# TRACE_STAGE_LEVELS="validate=DEBUG,services=WARNING" ajusta el nivel por etapa
+PAYMENTS_TRACING = {
+    'level': os.environ.get('TRACE_LEVEL', 'INFO').upper(),
+    'stages': dict(
+        (stage.strip(), level.strip().upper())
+        for stage, _, level in (
+            item.partition('=') for item in os.environ.get('TRACE_STAGE_LEVELS', '').split(',') if '=' in item
+        )
+    ),
+    'debug_sample_rate': float(os.environ.get('TRACE_DEBUG_SAMPLE_RATE', '0.01')),
+    'queue_size': int(os.environ.get('TRACE_QUEUE_SIZE', '10000')),
+}
+
+# ==============================================================================
+# MÉTRICAS (ver payments/metrics.py, GET /api/payments/metrics/)
+# ==============================================================================
+# Cada proceso escribe su snapshot en PAYMENTS_RUNTIME_DIR/metrics/ cada
+# flush_interval segundos; el endpoint suma los de todos los workers
+PAYMENTS_METRICS = {
+    'enabled': os.environ.get('METRICS_ENABLED', 'True').lower() == 'true',
+    'flush_interval': float(os.environ.get('METRICS_FLUSH_INTERVAL', '5')),
+    # Acceso: `Authorization: Bearer <METRICS_TOKEN>` o una IP de
+    # METRICS_ALLOWED_IPS (p. ej. "10.0.0.0/8,127.0.0.1")
+    'token': os.environ.get('METRICS_TOKEN', ''),
+    'allowed_ips': tuple(ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if ip.strip()),
+}
+
+# ==============================================================================
+# SERVER-TIMING Y REQUESTS LENTOS (ver payments/timing.py)
+# ==============================================================================
+# SERVER_TIMING_ALLOW_ORIGIN: origen del frontend, para leer el desglose
+# desde JS (las DevTools lo muestran igual sin este header)
+SERVER_TIMING = {
+    'enabled': os.environ.get('SERVER_TIMING_ENABLED', 'True').lower() == 'true',
+    'slow_request_ms': float(os.environ.get('SLOW_REQUEST_MS', '1000')),
+    'timing_allow_origin': os.environ.get('SERVER_TIMING_ALLOW_ORIGIN', ''),
+}
+
+# ==============================================================================
+# PREFERENCIAS IDEMPOTENTES (ver payments/preference_cache.py)
+# ==============================================================================
+PREFERENCE_CACHE = {
+    'ttl': int(os.environ.get('PREFERENCE_CACHE_TTL', '600')),
+    'max_entries': int(os.environ.get('PREFERENCE_CACHE_MAX_ENTRIES', '1024')),
+}
+
+# ==============================================================================
+# LEDGER DE ÓRDENES (ver payments/ledger.py)
+# ==============================================================================
+ORDER_LEDGER = {
+    'enabled': os.environ.get('ORDER_LEDGER_ENABLED', 'True').lower() == 'true',
+    'batch_size': int(os.environ.get('ORDER_LEDGER_BATCH_SIZE', '200')),
+    'flush_interval': float(os.environ.get('ORDER_LEDGER_FLUSH_INTERVAL', '0.5')),
+}
+
+# ==============================================================================
+# JOURNAL DE EVENTOS DE PAGOS (ver payments/journal.py)
+# ==============================================================================
+PAYMENT_JOURNAL = {
+    'enabled': os.environ.get('PAYMENT_JOURNAL_ENABLED', 'True').lower() == 'true',
+    'flush_interval': float(os.environ.get('PAYMENT_JOURNAL_FLUSH_INTERVAL', '1')),
+    'segment_max_bytes': int(os.environ.get('PAYMENT_JOURNAL_SEGMENT_BYTES', str(8 * 1024 * 1024))),
+    'segment_max_age': int(os.environ.get('PAYMENT_JOURNAL_SEGMENT_AGE', '3600')),
+    'max_segments': int(os.environ.get('PAYMENT_JOURNAL_MAX_SEGMENTS', '168')),
+}
+
+# ==============================================================================
+# INBOX DE WEBHOOKS (ver payments/inbox.py)
+# ==============================================================================
+WEBHOOK_INBOX = {
+    'batch_size': int(os.environ.get('WEBHOOK_INBOX_BATCH_SIZE', '50')),
+    'lookup_concurrency': int(os.environ.get('WEBHOOK_INBOX_LOOKUP_CONCURRENCY', '4')),
+    # Desde cuántos pagos nuevos por lote se consultan con una búsqueda en bloque
+    'search_min_payments': int(os.environ.get('WEBHOOK_INBOX_SEARCH_MIN_PAYMENTS', '5')),
+    'max_attempts': int(os.environ.get('WEBHOOK_INBOX_MAX_ATTEMPTS', '8')),
+    'poll_interval': float(os.environ.get('WEBHOOK_INBOX_POLL_INTERVAL', '2')),
+}
+
+# ==============================================================================
+# CONCILIACIÓN CON MERCADO PAGO (ver payments/reconcile.py)
+# ==============================================================================
+PAYMENT_RECONCILE = {
+    'page_size': int(os.environ.get('RECONCILE_PAGE_SIZE', '100')),
+    'search_rate': float(os.environ.get('RECONCILE_SEARCH_RATE', '5')),
+    'redelivery_rate': float(os.environ.get('RECONCILE_REDELIVERY_RATE', '10')),
+    'concurrency': int(os.environ.get('RECONCILE_CONCURRENCY', '4')),
+}
+
+# ==============================================================================
+# FILTRO PREVIO DEL WEBHOOK (ver payments/webhook_guard.py)
+# ==============================================================================
+WEBHOOK_SECURITY = {
+    # Clave secreta de webhooks (panel de MP > Tus integraciones > Webhooks)
+    'secret': os.environ.get('MP_WEBHOOK_SECRET', ''),
+    'max_age': int(os.environ.get('MP_WEBHOOK_MAX_AGE', '0')),
+    'recent_ttl': int(os.environ.get('MP_WEBHOOK_RECENT_TTL', '300')),
+    # IPN legacy (?topic=payment&id=...) sin firma: al inbox como no verificado.
+    # Opt-in: con la clave configurada, cualquiera podría mandarlo
+    'legacy_ipn': os.environ.get('MP_WEBHOOK_LEGACY_IPN', 'false').lower() == 'true',
+}
+
+# ==============================================================================
+# IDEMPOTENCIA DE PAGOS (ver payments/idempotency.py)
+# ==============================================================================
+PAYMENTS_IDEMPOTENCY = {
+    'backend': os.environ.get('PAYMENTS_IDEMPOTENCY_BACKEND', 'payments.idempotency.DatabaseIdempotencyStore'),
+    'ttl': int(os.environ.get('PAYMENTS_IDEMPOTENCY_TTL', str(30 * 24 * 3600))),
+    'local_cache_size': int(os.environ.get('PAYMENTS_IDEMPOTENCY_CACHE_SIZE', '10000')),
+}
+
+# ==============================================================================
+# CACHÉ DE ESTADOS DE PAGO (ver payments/payment_cache.py)
+# ==============================================================================
+PAYMENT_STATUS_CACHE = {
+    'terminal_ttl': int(os.environ.get('PAYMENT_CACHE_TERMINAL_TTL', str(24 * 3600))),  # approved, rejected, ...
+    'pending_ttl': int(os.environ.get('PAYMENT_CACHE_PENDING_TTL', '10')),  # pending, in_process
+}
+
+# ==============================================================================
+# CACHÉS EN MEMORIA (por proceso)
+# ==============================================================================
+# Adjuntos pre-codificados en base64 (ver payments/services.py)
+ATTACHMENT_CACHE_MAX_ENTRIES = int(os.environ.get('ATTACHMENT_CACHE_MAX_ENTRIES', '32'))
+ATTACHMENT_CACHE_MAX_BYTES = int(os.environ.get('ATTACHMENT_CACHE_MAX_BYTES', str(32 * 1024 * 1024)))
+
 # ==============================================================================
 # LOGGING (para ver errores en Railway)
 # ==============================================================================
@@ -151,5 +399,9 @@ LOGGING = {
             'level': 'DEBUG',
             'propagate': False,
         },
+        # httpx loguea cada request en INFO (cliente async de MP)
+        'httpx': {
+            'level': 'WARNING',
+        },
     },
 }
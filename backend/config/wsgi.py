@@ -7,3 +7,17 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 application = get_wsgi_application()
+
+# Catálogo, bundles, adjuntos y emails: solo en procesos que sirven requests
+from payments.startup import warm_up  # noqa: E402
+
+warm_up()
+
+# Workers del outbox de emails y consumidor del inbox de webhooks
+from payments.inbox import start_consumer  # noqa: E402
+from payments.outbox import start_workers  # noqa: E402
+
+# Con gunicorn.conf.py los arranca post_worker_init en cada worker
+if os.environ.get('PAYMENTS_BACKGROUND_AUTOSTART', 'true').lower() == 'true':
+    start_workers()
+    start_consumer()
@@ -0,0 +1,135 @@
+"""
+Configuración de gunicorn para producción - Datos con Alex
+===========================================================
+    gunicorn -c gunicorn.conf.py
+
+- preload_app: el catálogo y los adjuntos codificados se cargan una vez
+  en el master al importar config/wsgi.py (payments/startup.py) y los
+  workers los comparten (copy-on-write)
+- Los threads de fondo (outbox, inbox) NO arrancan en el master: cada
+  worker los arranca en post_worker_init, junto con el precalentado de
+  las conexiones a Mercado Pago y Brevo
+- graceful_timeout: al reiniciar, cada worker termina los envíos en
+  curso antes de salir
+- max_requests + jitter: reciclar workers de a uno para acotar el
+  crecimiento de memoria
+
+VARIABLES DE ENTORNO:
+- PORT: puerto (Railway)
+- GUNICORN_WORKER_CLASS: gthread (default), sync o uvicorn (ASGI, vistas async)
+- WEB_CONCURRENCY: procesos (default: CPUs + 1, máximo GUNICORN_MAX_WORKERS)
+- GUNICORN_THREADS: threads por proceso con gthread (default 8)
+- GUNICORN_TIMEOUT / GUNICORN_GRACEFUL_TIMEOUT / GUNICORN_KEEPALIVE
+- GUNICORN_MAX_REQUESTS / GUNICORN_MAX_REQUESTS_JITTER
+- GUNICORN_PRELOAD: false para desactivar preload_app
+===========================================================
+"""
+
+import multiprocessing
+import os
+import threading
+
+# Con preload_app config/wsgi.py (o asgi.py) se importa en el master:
+# los threads de fondo los arranca post_worker_init en cada worker
+os.environ['PAYMENTS_BACKGROUND_AUTOSTART'] = 'false'
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+# =============================================================================
+# SERVIDOR
+# =============================================================================
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+_worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread').lower()
+_cpus = multiprocessing.cpu_count()
+
+if _worker_class == 'uvicorn':
+    # Un event loop por proceso atiende cientos de requests en vuelo
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    wsgi_app = 'config.asgi:application'
+    workers = _env_int('WEB_CONCURRENCY', min(_cpus, _env_int('GUNICORN_MAX_WORKERS', 8)))
+else:
+    # Las vistas esperan a MP (I/O): threads en vez de más procesos
+    worker_class = _worker_class
+    wsgi_app = 'config.wsgi:application'
+    workers = _env_int('WEB_CONCURRENCY', min(_cpus + 1, _env_int('GUNICORN_MAX_WORKERS', 8)))
+    threads = _env_int('GUNICORN_THREADS', 8) if _worker_class == 'gthread' else 1
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+# Una llamada a MP, reintentos incluidos, corta en su deadline (MP_DEADLINE, 15s)
+timeout = _env_int('GUNICORN_TIMEOUT', 60)
+# Tiempo para terminar requests y envíos de email en curso al reiniciar
+graceful_timeout = _env_int('GUNICORN_GRACEFUL_TIMEOUT', 30)
+keepalive = _env_int('GUNICORN_KEEPALIVE', 5)
+
+max_requests = _env_int('GUNICORN_MAX_REQUESTS', 2000)
+max_requests_jitter = _env_int('GUNICORN_MAX_REQUESTS_JITTER', 200)
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+# =============================================================================
+# HOOKS
+# =============================================================================
+
+def _close_db_connections():
+    from django.db import connections
+
+    connections.close_all()
+
+
+def when_ready(server):
+    # Nada de conexiones SQLite abiertas en el master: no se heredan al fork
+    if preload_app:
+        from payments import metrics
+
+        _close_db_connections()
+        # Snapshots de métricas de una ejecución anterior
+        metrics.reset_storage()
+    server.log.info(
+        f"[GUNICORN] {workers} worker(s) {worker_class}"
+        f"{f' x {threads} threads' if worker_class == 'gthread' else ''}, preload={preload_app}"
+    )
+
+
+def pre_fork(server, worker):
+    if preload_app:
+        _close_db_connections()
+
+
+def post_worker_init(worker):
+    from payments.clients import warm_clients
+    from payments.inbox import start_consumer
+    from payments.outbox import start_workers
+
+    start_workers()
+    start_consumer()
+
+    # En un thread: un upstream lento no demora que el worker acepte requests
+    def warm():
+        worker.log.info(f"[GUNICORN] Worker {worker.pid}: conexiones precalentadas {warm_clients()}")
+
+    threading.Thread(target=warm, name='warm-clients', daemon=True).start()
+
+
+def worker_exit(server, worker):
+    from payments import journal, ledger, metrics
+    from payments.inbox import stop_consumer
+    from payments.outbox import stop_workers
+
+    # Los threads terminan el envío/notificación en curso antes de salir
+    drain_timeout = max(graceful_timeout - 5, 1)
+    stop_workers(timeout=drain_timeout)
+    stop_consumer(timeout=drain_timeout)
+    ledger.stop_writer(timeout=2)
+    ledger.flush()
+    journal.close_journal()
+    metrics.flush()
+    server.log.info(f"[GUNICORN] Worker {worker.pid} drenado")
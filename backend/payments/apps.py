@@ -0,0 +1,30 @@
+"""
+Configuración de la app de pagos.
+
+ready() solo deja configurado el proceso (tracing, pragmas de SQLite): corre
+también en cada comando de manage.py. El precalentado de catálogo, bundles,
+adjuntos y emails es de los procesos que sirven requests
+(payments/startup.py, llamado desde config/wsgi.py y config/asgi.py).
+"""
+
+from django.apps import AppConfig
+
+
+def _configure_sqlite(sender, connection, **kwargs):
+    """WAL permite lecturas concurrentes mientras el outbox escribe."""
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode=WAL;')
+            cursor.execute('PRAGMA synchronous=NORMAL;')
+
+
+class PaymentsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'payments'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+        from .tracing import configure_tracing
+
+        configure_tracing()
+        connection_created.connect(_configure_sqlite, dispatch_uid='payments_sqlite_pragmas')
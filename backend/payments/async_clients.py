@@ -0,0 +1,113 @@
+"""
+Clientes HTTP async para las vistas ASGI - Datos con Alex
+==========================================================
+Versión no bloqueante (httpx.AsyncClient) de las llamadas a Mercado Pago
+que hacen los requests: consultar un pago y crear una preferencia.
+
+Con las vistas async (views_async.py) un solo proceso mantiene cientos de
+checkouts en vuelo mientras espera a MP, en vez de un request por worker.
+
+- Un AsyncClient por event loop (keep-alive + pool de conexiones)
+- Mismos timeouts, base_url, reintentos de GET y circuit breaker que el
+  cliente sync (settings.OUTBOUND_HTTP['mercadopago'], payments/resilience.py)
+- Mismo formato de respuesta que el SDK: {"status": http, "response": json}
+
+Brevo no tiene versión async: los emails los envían los workers del
+outbox, fuera del request.
+==========================================================
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import uuid
+import weakref
+from typing import Any
+
+import httpx
+
+from . import metrics, resilience
+from .clients import get_upstream_config, mp_failed
+
+logger = logging.getLogger(__name__)
+
+_clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient] = weakref.WeakKeyDictionary()
+
+
+def get_mp_async_client() -> httpx.AsyncClient:
+    """AsyncClient de MP del event loop actual."""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        config = get_upstream_config('mercadopago')
+        max_connections = config.get('async_max_connections', 100)
+        # Pocas conexiones ociosas: httpcore recorre todo el pool en cada
+        # request y con cientos de keep-alive ese recorrido domina la CPU
+        max_keepalive = min(config.get('async_max_keepalive', 20), max_connections)
+        client = httpx.AsyncClient(
+            base_url=config['base_url'],
+            timeout=httpx.Timeout(config['read_timeout'], connect=config['connect_timeout']),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_keepalive),
+            headers={
+                'Authorization': f"Bearer {os.getenv('MP_ACCESS_TOKEN', '')}",
+                'Accept': 'application/json',
+            },
+        )
+        _clients[loop] = client
+        logger.info(f"[CLIENTS] Cliente async Mercado Pago inicializado (pid={os.getpid()}, max_conn={max_connections})")
+    return client
+
+
+async def aclose_clients() -> None:
+    """Cierra el cliente del event loop actual (shutdown de ASGI)."""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+
+def _as_sdk_response(response: httpx.Response) -> dict[str, Any]:
+    result: dict[str, Any] = {"status": response.status_code, "response": None}
+    if response.status_code != 204 and response.content:
+        try:
+            result["response"] = response.json()
+        except ValueError:
+            logger.error(f"[MP_HTTP] Respuesta no-JSON de {response.request.method} {response.request.url} (HTTP {response.status_code})")
+            result["response"] = {"message": "Invalid JSON in response body"}
+    return result
+
+
+def _attempt_timeout(config: dict[str, Any]) -> httpx.Timeout:
+    return httpx.Timeout(resilience.remaining_timeout(config['read_timeout']), connect=config['connect_timeout'])
+
+
+async def amp_payment_get(payment_id: str) -> dict[str, Any]:
+    """payment.get no bloqueante. Reintenta 429/5xx como el cliente sync."""
+    config = get_upstream_config('mercadopago')
+    client = get_mp_async_client()
+
+    async def attempt() -> dict[str, Any]:
+        response = await client.get(f"/v1/payments/{payment_id}", timeout=_attempt_timeout(config))
+        return _as_sdk_response(response)
+
+    with metrics.stage_timer('mp_payment_get'):
+        return await resilience.acall('mercadopago', attempt, config, idempotent=True, failed=mp_failed)
+
+
+async def amp_preference_create(preference_data: dict[str, Any]) -> dict[str, Any]:
+    """preference.create no bloqueante (sin reintentos: no es idempotente)."""
+    config = get_upstream_config('mercadopago')
+    client = get_mp_async_client()
+
+    async def attempt() -> dict[str, Any]:
+        response = await client.post(
+            "/checkout/preferences",
+            json=preference_data,
+            headers={'x-idempotency-key': uuid.uuid4().hex},
+            timeout=_attempt_timeout(config),
+        )
+        return _as_sdk_response(response)
+
+    with metrics.stage_timer('mp_preference_create'):
+        return await resilience.acall('mercadopago', attempt, config, failed=mp_failed)
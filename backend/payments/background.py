@@ -0,0 +1,119 @@
+"""
+Workers en segundo plano - Datos con Alex
+==========================================
+Pool de threads daemon que ejecutan una tarea en loop dentro de cada
+proceso (gunicorn worker o manage.py).
+
+La tarea devuelve True si procesó algo (se vuelve a llamar enseguida)
+o False si no había trabajo (el thread duerme hasta poll_interval o
+hasta que alguien llame a wake()).
+
+exclusive_process_lock() permite que una sola tarea a la vez (entre
+todos los procesos) haga un trabajo que debe ser secuencial.
+==========================================
+"""
+
+from __future__ import annotations
+
+import os
+import logging
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Iterator
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin locks entre procesos
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class WorkerPool:
+    """Pool de threads que drena una cola persistente."""
+
+    def __init__(self, name: str, task: Callable[[], bool], concurrency: int = 1, poll_interval: float = 5.0):
+        self.name = name
+        self.task = task
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads: list[threading.Thread] = []
+        self._pid: int | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._pid == os.getpid() and any(t.is_alive() for t in self._threads)
+
+    def start(self) -> None:
+        """Arranca los threads (idempotente; re-arranca después de un fork)."""
+        with self._lock:
+            if self.running:
+                return
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._threads = [
+                threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=True)
+                for i in range(self.concurrency)
+            ]
+            for thread in self._threads:
+                thread.start()
+            logger.info(f"[WORKERS] {self.name}: {self.concurrency} worker(s) iniciados (pid={self._pid})")
+
+    def wake(self) -> None:
+        self._wakeup.set()
+
+    def stop(self, timeout: float | None = None) -> None:
+        """Pide a los threads que terminen y espera hasta `timeout` segundos."""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout)
+
+    def _run(self) -> None:
+        try:
+            while not self._stopping.is_set():
+                close_old_connections()
+                try:
+                    did_work = self.task()
+                except Exception:
+                    logger.exception(f"[WORKERS] {self.name}: error no controlado en la tarea")
+                    did_work = False
+                if not did_work:
+                    self._wakeup.wait(self.poll_interval)
+                    self._wakeup.clear()
+        finally:
+            connection.close()
+
+
+@contextmanager
+def exclusive_process_lock(name: str) -> Iterator[bool]:
+    """
+    Lock no bloqueante entre procesos (fcntl.flock).
+
+    Entrega True si este proceso obtuvo el lock y False si otro lo tiene.
+    Sin fcntl siempre entrega True (solo hay coordinación dentro del proceso).
+    """
+    if fcntl is None:
+        yield True
+        return
+
+    lock_dir = Path(settings.PAYMENTS_RUNTIME_DIR) / 'locks'
+    lock_dir.mkdir(parents=True, exist_ok=True)
+    with open(lock_dir / f"{name}.lock", 'a+') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,243 @@
+"""
+Bundles de productos con varios archivos - Datos con Alex
+==========================================================
+Un producto con más de un archivo (p. ej. pack-productividad) se entrega
+como un único zip en vez de un adjunto (o un link) por archivo.
+
+- El zip es determinístico: mismas entradas en el mismo orden, fechas y
+  permisos fijos, así que los mismos archivos dan siempre los mismos bytes
+- Se guarda en PAYMENTS_RUNTIME_DIR/bundles/<producto>-<clave>.zip, donde
+  la clave es el SHA-256 del contenido de los archivos fuente: solo se
+  vuelve a armar cuando cambia alguno. La clave sale del (mtime, tamaño)
+  actual de cada archivo, así que los workers y el comando coinciden
+- Se arma al iniciar el servidor (payments/startup.py) o con
+  `python manage.py build_bundles`
+
+El email (adjunto o link) y las descargas usan el bundle como
+`<producto>.zip`.
+==========================================================
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+import threading
+import zipfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from django.conf import settings
+
+from .catalog import Product, get_catalog
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAYMENT_BUNDLES: dict[str, Any] = {
+    'enabled': True,
+    'compression_level': 9,
+}
+
+# Fecha fija de las entradas del zip (la mínima del formato)
+ZIP_EPOCH = (1980, 1, 1, 0, 0, 0)
+
+
+def get_bundles_config() -> dict[str, Any]:
+    config = dict(DEFAULT_PAYMENT_BUNDLES)
+    config.update(getattr(settings, 'PAYMENT_BUNDLES', {}))
+    return config
+
+
+def bundles_dir() -> Path:
+    return Path(settings.PAYMENTS_RUNTIME_DIR) / 'bundles'
+
+
+@dataclass(frozen=True)
+class Bundle:
+    product_id: str
+    name: str
+    path: str
+    key: str
+    size: int
+    source_bytes: int
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"name": self.name, "path": self.path, "key": self.key[:16],
+                "size": self.size, "source_bytes": self.source_bytes}
+
+
+# =============================================================================
+# ARMADO
+# =============================================================================
+
+# Hash de cada archivo fuente, validado contra (mtime, tamaño) del archivo en
+# disco al momento de pedir la clave (no los del catálogo, que son los del
+# inicio del proceso): un archivo reemplazado da otra clave en todos los
+# procesos, incluido `manage.py build_bundles`
+_hashes: dict[str, tuple[tuple[int, int], str]] = {}
+_hashes_lock = threading.Lock()
+
+
+def _file_sha256(path: str, signature: tuple[int, int]) -> str:
+    with _hashes_lock:
+        cached = _hashes.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    with _hashes_lock:
+        _hashes[path] = (signature, digest.hexdigest())
+    return digest.hexdigest()
+
+
+def bundle_key(product: Product) -> str:
+    """SHA-256 de los nombres y contenidos de los archivos del producto. Lanza OSError si falta uno."""
+    digest = hashlib.sha256(b'bundle-v1')
+    for product_file in product.files:
+        stat = os.stat(product_file.path)
+        file_hash = _file_sha256(product_file.path, (stat.st_mtime_ns, stat.st_size))
+        digest.update(f"{product_file.name}\0{file_hash}\0".encode())
+    return digest.hexdigest()
+
+
+def _write_zip(product: Product, target: Path, compression_level: int) -> None:
+    tmp = target.with_name(f".tmp-{os.getpid()}-{target.name}")
+    try:
+        with zipfile.ZipFile(tmp, 'w', compression=zipfile.ZIP_DEFLATED, compresslevel=compression_level) as zf:
+            for product_file in product.files:
+                info = zipfile.ZipInfo(product_file.name, date_time=ZIP_EPOCH)
+                info.compress_type = zipfile.ZIP_DEFLATED
+                info.create_system = 3            # unix, en cualquier plataforma
+                info.external_attr = 0o644 << 16
+                with open(product_file.path, 'rb') as src, zf.open(info, 'w') as dst:
+                    for chunk in iter(lambda: src.read(1024 * 1024), b''):
+                        dst.write(chunk)
+        # Dos workers armando el mismo bundle escriben los mismos bytes
+        os.replace(tmp, target)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def build_bundle(product: Product, force: bool = False) -> tuple[Bundle, bool]:
+    """Bundle del producto: (bundle, armado_ahora). Lanza OSError si falta un archivo."""
+    config = get_bundles_config()
+    key = bundle_key(product)
+    directory = bundles_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    target = directory / f"{product.id}-{key[:16]}.zip"
+
+    built = False
+    if force or not target.exists():
+        _write_zip(product, target, config['compression_level'])
+        built = True
+        _prune_bundles(product, directory)
+
+    bundle = Bundle(
+        product_id=product.id,
+        name=f"{product.id}.zip",
+        path=str(target),
+        key=key,
+        size=target.stat().st_size,
+        source_bytes=sum(os.stat(f.path).st_size for f in product.files),
+    )
+    return bundle, built
+
+
+def _prune_bundles(product: Product, directory: Path) -> None:
+    """
+    Borra los bundles del producto que ya no corresponden a sus archivos.
+    La clave se recalcula acá (no la del armado) para no borrar el zip
+    vigente si un archivo cambió mientras se escribía.
+    """
+    try:
+        current = f"{product.id}-{bundle_key(product)[:16]}.zip"
+    except OSError:
+        return
+    pattern = re.compile(rf"{re.escape(product.id)}-[0-9a-f]{{16}}\.zip")
+    for old in directory.glob(f"{product.id}-*.zip"):
+        if old.name != current and pattern.fullmatch(old.name):
+            old.unlink(missing_ok=True)
+
+
+# =============================================================================
+# BUNDLES DEL PROCESO
+# =============================================================================
+
+_lock = threading.Lock()
+_bundles: dict[str, Bundle] = {}
+_built = 0
+
+
+def build_bundles(force: bool = False) -> dict[str, Bundle]:
+    """Arma (o valida) los bundles de todos los productos con varios archivos."""
+    global _bundles, _built
+    if not get_bundles_config()['enabled']:
+        return {}
+    bundles = {}
+    for product in get_catalog():
+        if len(product.files) < 2:
+            continue
+        if not product.ready:
+            logger.warning(f"[BUNDLES] {product.id}: faltan archivos, se entrega sin bundle")
+            continue
+        try:
+            bundle, built = build_bundle(product, force=force)
+        except OSError:
+            logger.exception(f"[BUNDLES] Error armando el bundle de {product.id}")
+            continue
+        bundles[product.id] = bundle
+        if built:
+            logger.info(f"[BUNDLES] {bundle.name}: {bundle.source_bytes} → {bundle.size} bytes")
+            with _lock:
+                _built += 1
+    with _lock:
+        _bundles = bundles
+    return bundles
+
+
+def get_bundle(product: Product) -> Bundle | None:
+    """Bundle vigente del producto (None si tiene un solo archivo o está desactivado)."""
+    if len(product.files) < 2 or not get_bundles_config()['enabled'] or not product.ready:
+        return None
+    bundle = _bundles.get(product.id)
+    try:
+        if bundle is not None and bundle.key == bundle_key(product) and os.path.exists(bundle.path):
+            return bundle
+        bundle, _ = build_bundle(product)
+    except OSError:
+        logger.exception(f"[BUNDLES] Error armando el bundle de {product.id}")
+        return None
+    with _lock:
+        _bundles[product.id] = bundle
+    return bundle
+
+
+def delivery_files(product: Product) -> list[tuple[str, str, bool]]:
+    """(nombre, ruta, existe) de lo que se entrega: el bundle o los archivos sueltos."""
+    bundle = get_bundle(product)
+    if bundle is not None:
+        return [(bundle.name, bundle.path, True)]
+    return [(f.name, f.path, f.exists) for f in product.files]
+
+
+def resolve_download(product: Product, filename: str) -> tuple[str, str] | None:
+    """(nombre, ruta) de un archivo descargable del producto: el bundle o uno suelto."""
+    if filename == f"{product.id}.zip":
+        bundle = get_bundle(product)
+        return (bundle.name, bundle.path) if bundle is not None else None
+    product_file = next((f for f in product.files if f.name == filename), None)
+    return (product_file.name, product_file.path) if product_file is not None else None
+
+
+def bundle_stats() -> dict[str, Any]:
+    return {
+        "enabled": get_bundles_config()['enabled'],
+        "directory": str(bundles_dir()),
+        "built_by_this_process": _built,
+        "bundles": {product_id: bundle.as_dict() for product_id, bundle in _bundles.items()},
+    }
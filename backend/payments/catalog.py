@@ -0,0 +1,207 @@
+"""
+Catálogo de productos del servidor - Datos con Alex
+====================================================
+Única fuente de verdad de los productos: ids, títulos, precios y archivos.
+Se lee una vez por proceso desde settings.PAYMENTS_CATALOG_PATH (JSON o
+TOML) y queda en memoria con todo precalculado:
+
+- El item de Mercado Pago de cada producto (create_preference no arma dicts
+  ni confía en el título/precio que manda el cliente)
+- Las rutas absolutas y la metadata (existe, tamaño, mtime) de cada archivo
+  (send_product_email y los diagnósticos no tocan el disco por request)
+
+Un producto que no está en el catálogo no se puede comprar ni entregar.
+Para tomar cambios del archivo sin reiniciar: reload_catalog().
+====================================================
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterator
+
+from django.conf import settings
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11: solo JSON
+    tomllib = None
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogError(Exception):
+    """El archivo de catálogo no existe o es inválido."""
+
+
+@dataclass(frozen=True)
+class ProductFile:
+    name: str
+    path: str
+    exists: bool
+    size: int
+    mtime_ns: int
+
+    def as_dict(self) -> dict[str, Any]:
+        return {"filename": self.name, "path": self.path, "exists": self.exists, "size": self.size}
+
+
+@dataclass(frozen=True)
+class Product:
+    id: str
+    title: str
+    price: float
+    currency: str
+    files: tuple[ProductFile, ...]
+    # Item listo para preference_data["items"] (solo lectura)
+    mp_item: dict[str, Any]
+
+    @property
+    def file_paths(self) -> list[str]:
+        return [f.path for f in self.files]
+
+    @property
+    def ready(self) -> bool:
+        return bool(self.files) and all(f.exists for f in self.files)
+
+
+class Catalog:
+    """Productos indexados por id, con los diagnósticos precalculados."""
+
+    def __init__(self, products: list[Product], source: str) -> None:
+        self.source = source
+        self._products = {p.id: p for p in products}
+        self.all_ready = all(p.ready for p in products)
+        self.summary = {
+            "source": source,
+            "products": [
+                {
+                    "id": p.id,
+                    "title": p.title,
+                    "price": p.price,
+                    "ready": p.ready,
+                    "all_files_exist": p.ready,
+                    "files": [f.as_dict() for f in p.files],
+                }
+                for p in products
+            ],
+        }
+
+    def get(self, product_id: str) -> Product | None:
+        return self._products.get(product_id)
+
+    def __contains__(self, product_id: str) -> bool:
+        return product_id in self._products
+
+    def __iter__(self) -> Iterator[Product]:
+        return iter(self._products.values())
+
+    def __len__(self) -> int:
+        return len(self._products)
+
+
+# =============================================================================
+# CARGA
+# =============================================================================
+
+def _read_source(path: Path) -> dict[str, Any]:
+    try:
+        if path.suffix == '.toml':
+            if tomllib is None:
+                raise CatalogError(f"Catálogo TOML requiere Python 3.11+: {path}")
+            with open(path, 'rb') as f:
+                return tomllib.load(f)
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except OSError as e:
+        raise CatalogError(f"No se pudo leer el catálogo {path}: {e}") from e
+    except ValueError as e:
+        raise CatalogError(f"Catálogo inválido {path}: {e}") from e
+
+
+def _file_metadata(base_dir: Path, name: str) -> ProductFile:
+    path = base_dir / name
+    try:
+        stat = path.stat()
+        return ProductFile(name, str(path), True, stat.st_size, stat.st_mtime_ns)
+    except OSError:
+        return ProductFile(name, str(path), False, 0, 0)
+
+
+def load_catalog(path: str | Path | None = None, files_dir: str | Path | None = None) -> Catalog:
+    path = Path(path or settings.PAYMENTS_CATALOG_PATH)
+    base_dir = Path(files_dir or settings.PAYMENTS_FILES_DIR)
+    data = _read_source(path)
+    currency = data.get('currency', 'ARS')
+
+    products: list[Product] = []
+    seen: set[str] = set()
+    for raw in data.get('products', []):
+        try:
+            product_id = str(raw['id'])
+            title = str(raw['title'])
+            price = round(float(raw['price']), 2)
+            filenames = list(raw['files'])
+        except (KeyError, TypeError, ValueError) as e:
+            raise CatalogError(f"Producto inválido en {path}: {raw!r} ({e})") from e
+        if product_id in seen:
+            raise CatalogError(f"Producto duplicado en {path}: {product_id}")
+        if price <= 0:
+            raise CatalogError(f"Precio inválido para {product_id}: {price}")
+        seen.add(product_id)
+
+        product_currency = raw.get('currency', currency)
+        products.append(Product(
+            id=product_id,
+            title=title,
+            price=price,
+            currency=product_currency,
+            files=tuple(_file_metadata(base_dir, name) for name in filenames),
+            mp_item={
+                "id": product_id,
+                "title": title,
+                "currency_id": product_currency,
+                "unit_price": price,
+                "quantity": 1,
+                "description": raw.get('description', f"Archivo Excel: {title}"),
+                "category_id": "learnings",
+            },
+        ))
+
+    catalog = Catalog(products, source=str(path))
+    for product in catalog:
+        for missing in (f for f in product.files if not f.exists):
+            logger.warning(f"[CATALOG] {product.id}: archivo no encontrado {missing.path}")
+    return catalog
+
+
+_catalog: Catalog | None = None
+_lock = threading.Lock()
+
+
+def get_catalog() -> Catalog:
+    """Catálogo del proceso (se carga la primera vez)."""
+    global _catalog
+    if _catalog is None:
+        with _lock:
+            if _catalog is None:
+                _catalog = load_catalog()
+                logger.info(f"[CATALOG] {len(_catalog)} producto(s) cargados desde {_catalog.source}")
+    return _catalog
+
+
+def reload_catalog() -> Catalog:
+    """Vuelve a leer el archivo (y la metadata de los archivos) de disco."""
+    global _catalog
+    catalog = load_catalog()
+    with _lock:
+        _catalog = catalog
+    return catalog
+
+
+def get_product(product_id: str) -> Product | None:
+    return get_catalog().get(product_id)
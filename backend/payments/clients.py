@@ -0,0 +1,260 @@
+"""
+Clientes HTTP salientes compartidos - Datos con Alex
+=====================================================
+Un único cliente por proceso (gunicorn worker) para cada upstream:
+
+- Mercado Pago: SDK oficial con un HttpClient que reutiliza una
+  requests.Session (keep-alive + pool de conexiones)
+- Brevo: un único ApiClient / TransactionalEmailsApi (pool urllib3)
+
+Así evitamos un handshake TLS nuevo en cada consulta o envío.
+
+Todas las llamadas pasan por payments/resilience.py (deadline, reintentos
+con backoff y jitter, circuit breaker).
+
+CONFIGURACIÓN (settings.OUTBOUND_HTTP, ver config/settings.py):
+- connect_timeout / read_timeout: deadlines por upstream (segundos)
+- pool_maxsize: conexiones persistentes por host
+- max_retries: reintentos de las consultas (idempotentes) ante errores
+  transitorios; crear preferencias y enviar emails no se reintenta
+- deadline: tiempo total de una llamada, reintentos incluidos
+- breaker_failures / breaker_reset_timeout: circuit breaker por upstream
+- base_url: URL base de la API de MP y de Brevo (para apuntar a los
+  upstreams falsos de benchmarks/fake_upstreams.py en pruebas de carga)
+
+Los clientes async (httpx) de las vistas ASGI viven en async_clients.py.
+=====================================================
+"""
+
+from __future__ import annotations
+
+import os
+import logging
+import threading
+from typing import Any
+
+import mercadopago
+import requests
+import sib_api_v3_sdk
+from django.conf import settings
+from mercadopago.config import RequestOptions
+from mercadopago.http import HttpClient
+from requests.adapters import HTTPAdapter
+
+from . import metrics, resilience
+
+logger = logging.getLogger(__name__)
+
+MP_DEFAULT_BASE_URL = 'https://api.mercadopago.com'
+BREVO_DEFAULT_BASE_URL = 'https://api.sendinblue.com/v3'
+
+DEFAULT_OUTBOUND_HTTP: dict[str, dict[str, Any]] = {
+    'mercadopago': {
+        'connect_timeout': 3.05, 'read_timeout': 10.0, 'pool_maxsize': 10, 'max_retries': 2,
+        'base_url': MP_DEFAULT_BASE_URL,
+        'deadline': 15.0, 'backoff_base': 0.2, 'backoff_max': 2.0,
+        'breaker_failures': 5, 'breaker_reset_timeout': 30.0,
+    },
+    'brevo': {
+        'connect_timeout': 3.05, 'read_timeout': 15.0, 'pool_maxsize': 10, 'max_retries': 0,
+        'base_url': BREVO_DEFAULT_BASE_URL,
+        'deadline': 20.0, 'backoff_base': 0.5, 'backoff_max': 5.0,
+        'breaker_failures': 5, 'breaker_reset_timeout': 60.0,
+    },
+}
+
+RETRY_STATUS = tuple(sorted(resilience.TRANSIENT_STATUS))
+
+
+def get_upstream_config(upstream: str) -> dict[str, Any]:
+    """Configuración efectiva de un upstream (defaults + settings)."""
+    config = dict(DEFAULT_OUTBOUND_HTTP[upstream])
+    config.update(getattr(settings, 'OUTBOUND_HTTP', {}).get(upstream, {}))
+    return config
+
+
+# =============================================================================
+# MERCADO PAGO
+# =============================================================================
+
+class PooledHttpClient(HttpClient):
+    """
+    HttpClient del SDK de MP que reutiliza una sola requests.Session.
+
+    El cliente por defecto del SDK crea una Session nueva por request
+    (sin keep-alive). Este mantiene las conexiones abiertas entre llamadas.
+    """
+
+    def __init__(
+        self,
+        connect_timeout: float,
+        read_timeout: float,
+        pool_maxsize: int,
+        base_url: str = MP_DEFAULT_BASE_URL,
+    ):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.base_url = base_url.rstrip('/')
+        self.session = requests.Session()
+        # Sin reintentos de urllib3: los hace resilience.call (con deadline y jitter)
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def request(self, method, url, maxretries=None, **kwargs):
+        # Los reintentos los define el adapter; ignoramos los del SDK
+        kwargs.pop('retry_on', None)
+        kwargs.pop('backoff_factor', None)
+        kwargs['timeout'] = (self.connect_timeout, resilience.remaining_timeout(self.read_timeout))
+        if self.base_url != MP_DEFAULT_BASE_URL and url.startswith(MP_DEFAULT_BASE_URL):
+            url = self.base_url + url[len(MP_DEFAULT_BASE_URL):]
+
+        api_result = self.session.request(method, url, **kwargs)
+        response = {"status": api_result.status_code, "response": None}
+        if api_result.status_code != 204 and api_result.content:
+            try:
+                response["response"] = api_result.json()
+            except ValueError:
+                logger.error(f"[MP_HTTP] Respuesta no-JSON de {method} {url} (HTTP {api_result.status_code})")
+                response["response"] = {"message": "Invalid JSON in response body"}
+        return response
+
+    def close(self) -> None:
+        self.session.close()
+
+
+# =============================================================================
+# REGISTRO DE CLIENTES POR PROCESO
+# =============================================================================
+
+_lock = threading.Lock()
+_clients: dict[str, Any] = {}
+_clients_pid: int | None = None
+
+
+def _ensure_process() -> None:
+    """Descarta clientes heredados de otro proceso (fork con preload_app)."""
+    global _clients_pid
+    if _clients_pid != os.getpid():
+        _clients.clear()
+        _clients_pid = os.getpid()
+
+
+def get_mp_sdk() -> mercadopago.SDK:
+    with _lock:
+        _ensure_process()
+        if 'mercadopago' not in _clients:
+            config = get_upstream_config('mercadopago')
+            http_client = PooledHttpClient(
+                connect_timeout=config['connect_timeout'],
+                read_timeout=config['read_timeout'],
+                pool_maxsize=config['pool_maxsize'],
+                base_url=config['base_url'],
+            )
+            request_options = RequestOptions(connection_timeout=config['read_timeout'])
+            _clients['mercadopago'] = mercadopago.SDK(
+                os.getenv('MP_ACCESS_TOKEN', ''),
+                http_client=http_client,
+                request_options=request_options,
+            )
+            logger.info(f"[CLIENTS] SDK Mercado Pago inicializado (pid={os.getpid()}, pool={config['pool_maxsize']})")
+        return _clients['mercadopago']
+
+
+def get_brevo_api() -> sib_api_v3_sdk.TransactionalEmailsApi:
+    with _lock:
+        _ensure_process()
+        if 'brevo' not in _clients:
+            config = get_upstream_config('brevo')
+            configuration = sib_api_v3_sdk.Configuration()
+            configuration.host = config['base_url'].rstrip('/')
+            configuration.api_key['api-key'] = os.environ.get('EMAIL_HOST_PASSWORD', '').strip()
+            configuration.connection_pool_maxsize = config['pool_maxsize']
+            api_client = sib_api_v3_sdk.ApiClient(configuration)
+            _clients['brevo'] = sib_api_v3_sdk.TransactionalEmailsApi(api_client)
+            logger.info(f"[CLIENTS] Cliente Brevo inicializado (pid={os.getpid()}, pool={config['pool_maxsize']})")
+        return _clients['brevo']
+
+
+def close_clients() -> None:
+    """Cierra las conexiones abiertas del proceso actual."""
+    with _lock:
+        sdk = _clients.pop('mercadopago', None)
+        if sdk is not None and isinstance(getattr(sdk, 'http_client', None), PooledHttpClient):
+            sdk.http_client.close()
+        brevo = _clients.pop('brevo', None)
+        if brevo is not None:
+            brevo.api_client.rest_client.pool_manager.clear()
+
+
+def warm_clients() -> dict[str, bool]:
+    """
+    Crea los clientes del proceso y abre una conexión a cada upstream
+    (gunicorn post_worker_init), para que el primer pago no pague el
+    handshake TLS. Un upstream caído solo se loguea.
+    """
+    mp_config = get_upstream_config('mercadopago')
+    brevo_config = get_upstream_config('brevo')
+
+    def warm_mercadopago() -> None:
+        get_mp_sdk().http_client.session.head(mp_config['base_url'], timeout=mp_config['connect_timeout'])
+
+    def warm_brevo() -> None:
+        api_client = get_brevo_api().api_client
+        api_client.rest_client.pool_manager.request(
+            'HEAD', api_client.configuration.host, timeout=brevo_config['connect_timeout'], retries=False,
+        )
+
+    targets = {'mercadopago': warm_mercadopago, 'brevo': warm_brevo}
+    warmed = {}
+    for name, open_connection in targets.items():
+        try:
+            open_connection()
+            warmed[name] = True
+        except Exception as e:
+            warmed[name] = False
+            logger.warning(f"[CLIENTS] No se pudo precalentar {name}: {type(e).__name__}: {e}")
+    return warmed
+
+
+# =============================================================================
+# LLAMADAS A UPSTREAMS
+# =============================================================================
+
+def mp_failed(response: dict[str, Any]) -> bool:
+    """Respuesta del SDK de MP que indica un upstream con problemas (429/5xx)."""
+    return response.get('status') in resilience.TRANSIENT_STATUS
+
+
+def mp_payment_get(payment_id: str) -> dict[str, Any]:
+    with metrics.stage_timer('mp_payment_get'):
+        return resilience.call(
+            'mercadopago', lambda: get_mp_sdk().payment().get(payment_id),
+            get_upstream_config('mercadopago'), idempotent=True, failed=mp_failed,
+        )
+
+
+def mp_payment_search(filters: dict[str, Any]) -> dict[str, Any]:
+    return resilience.call(
+        'mercadopago', lambda: get_mp_sdk().payment().search(filters=filters),
+        get_upstream_config('mercadopago'), idempotent=True, failed=mp_failed,
+    )
+
+
+def mp_preference_create(preference_data: dict[str, Any]) -> dict[str, Any]:
+    # Sin reintentos: un POST repetido crearía otra preferencia
+    with metrics.stage_timer('mp_preference_create'):
+        return resilience.call(
+            'mercadopago', lambda: get_mp_sdk().preference().create(preference_data),
+            get_upstream_config('mercadopago'), failed=mp_failed,
+        )
+
+
+def brevo_send_transac_email(send_smtp_email: sib_api_v3_sdk.SendSmtpEmail) -> Any:
+    # Sin reintentos: un envío repetido duplica el email (reintenta el outbox)
+    config = get_upstream_config('brevo')
+    with metrics.stage_timer('brevo_send'):
+        return resilience.call('brevo', lambda: get_brevo_api().send_transac_email(
+            send_smtp_email,
+            _request_timeout=(config['connect_timeout'], resilience.remaining_timeout(config['read_timeout'])),
+        ), config)
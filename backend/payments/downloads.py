@@ -0,0 +1,343 @@
+"""
+Links de descarga firmados - Datos con Alex
+============================================
+En vez de adjuntar los archivos al email (base64: +33% de tamaño, y un
+rebote o un email demasiado grande deja al comprador sin nada), el email
+lleva un link por archivo:
+
+    /api/payments/download/<token>/<archivo>
+
+- El token es (payment_id, product_id, vencimiento) firmado con HMAC-SHA256
+  (settings.PAYMENT_DOWNLOADS['secret'], por defecto SECRET_KEY): no se
+  guarda nada en la base y no se puede fabricar ni extender
+- Tope opcional de descargas de cada archivo por token (`max_downloads`),
+  contado en bytes en el caché compartido 'payments': cada GET suma los
+  bytes que pide (un rango, lo que mide el rango) y el archivo deja de
+  servirse cuando el token consumió max_downloads × tamaño. Partir una
+  descarga en rangos no la abarata; una descarga cortada más su
+  reanudación cuenta algo más de una. Bajo concurrencia el conteo es
+  aproximado (el caché no suma atómicamente entre procesos)
+- Los archivos salen con FileResponse: con gunicorn (wsgi.file_wrapper) se
+  envían con sendfile, sin copiarlos a memoria
+- Range (un rango por request), ETag / Last-Modified y requests
+  condicionales (304)
+============================================
+"""
+
+from __future__ import annotations
+
+import base64
+import hashlib
+import hmac
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import FileResponse, HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+
+from .bundles import resolve_download
+from .catalog import get_product
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAYMENT_DOWNLOADS: dict[str, Any] = {
+    'enabled': False,          # emails con links en vez de adjuntos
+    'base_url': '',            # URL pública del backend (los links son absolutos)
+    'secret': '',              # vacío = SECRET_KEY
+    'ttl': 7 * 24 * 3600,      # validez de un link
+    'max_downloads': 0,        # de cada archivo por token (0 = sin tope)
+}
+
+TOKEN_VERSION = 'v1'
+SIGNATURE_LENGTH = 22          # base64url de 128 bits
+
+
+def get_downloads_config() -> dict[str, Any]:
+    config = dict(DEFAULT_PAYMENT_DOWNLOADS)
+    config.update(getattr(settings, 'PAYMENT_DOWNLOADS', {}))
+    return config
+
+
+def links_enabled() -> bool:
+    """Los emails llevan links solo si hay una URL pública configurada."""
+    config = get_downloads_config()
+    return bool(config['enabled'] and config['base_url'])
+
+
+class DownloadTokenError(Exception):
+    """Token inválido (403) o vencido (410)."""
+
+    def __init__(self, message: str, status: int = 403) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+@dataclass(frozen=True)
+class DownloadGrant:
+    token: str
+    payment_id: str
+    product_id: str
+    expires_at: int
+
+
+# =============================================================================
+# TOKENS
+# =============================================================================
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _signature(payload: str) -> str:
+    secret = get_downloads_config()['secret'] or settings.SECRET_KEY
+    digest = hmac.new(secret.encode(), f"{TOKEN_VERSION}.{payload}".encode(), hashlib.sha256).digest()
+    return _b64encode(digest)[:SIGNATURE_LENGTH]
+
+
+def make_token(payment_id: Any, product_id: str, ttl: int | None = None) -> str:
+    """Token de descarga de los archivos de un producto para un pago."""
+    expires_at = int(time.time()) + int(ttl if ttl is not None else get_downloads_config()['ttl'])
+    payload = _b64encode(f"{payment_id}|{product_id}|{expires_at}".encode())
+    return f"{TOKEN_VERSION}.{payload}.{_signature(payload)}"
+
+
+def verify_token(token: str) -> DownloadGrant:
+    """Valida firma y vencimiento. Lanza DownloadTokenError."""
+    try:
+        version, payload, signature = token.split('.')
+    except ValueError:
+        raise DownloadTokenError('Link de descarga inválido')
+    if version != TOKEN_VERSION or not hmac.compare_digest(signature, _signature(payload)):
+        raise DownloadTokenError('Link de descarga inválido')
+    try:
+        payment_id, product_id, expires_at = _b64decode(payload).decode().split('|')
+        expires_at = int(expires_at)
+    except ValueError:
+        raise DownloadTokenError('Link de descarga inválido')
+    if expires_at < time.time():
+        raise DownloadTokenError('El link de descarga venció', status=410)
+    return DownloadGrant(token, payment_id, product_id, expires_at)
+
+
+def download_url(token: str, filename: str) -> str:
+    base_url = get_downloads_config()['base_url'].rstrip('/')
+    return f"{base_url}/api/payments/download/{token}/{quote(filename)}"
+
+
+# =============================================================================
+# CONTADORES
+# =============================================================================
+
+class _Counters:
+    """Contadores por proceso."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.served = 0
+        self.partial = 0
+        self.not_modified = 0
+        self.rejected = 0
+        self.limit_reached = 0
+
+    def incr(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+
+_counters = _Counters()
+
+
+def _count_key(token: str, filename: str) -> str:
+    return f"downloads:bytes:{hashlib.sha256(f'{token}/{filename}'.encode()).hexdigest()[:32]}"
+
+
+def _bytes_served(grant: DownloadGrant, filename: str) -> int:
+    try:
+        return caches['payments'].get(_count_key(grant.token, filename), 0)
+    except Exception:
+        logger.exception("[DOWNLOADS] Error leyendo el contador de descargas")
+        return 0
+
+
+def _record_download(grant: DownloadGrant, filename: str, length: int) -> None:
+    cache = caches['payments']
+    key = _count_key(grant.token, filename)
+    try:
+        if not cache.add(key, length, max(grant.expires_at - int(time.time()), 1)):
+            cache.incr(key, length)
+    except Exception:
+        logger.exception("[DOWNLOADS] Error actualizando el contador de descargas")
+
+
+def downloads_stats() -> dict[str, Any]:
+    config = get_downloads_config()
+    return {
+        "links_enabled": links_enabled(),
+        "ttl": config['ttl'],
+        "max_downloads": config['max_downloads'],
+        "served": _counters.served,
+        "partial": _counters.partial,
+        "not_modified": _counters.not_modified,
+        "rejected": _counters.rejected,
+        "limit_reached": _counters.limit_reached,
+        "scope": "por proceso",
+    }
+
+
+# =============================================================================
+# SERVIR ARCHIVOS
+# =============================================================================
+
+class DownloadResponse(FileResponse):
+    # Solo se usa si el servidor no tiene sendfile (p. ej. ASGI)
+    block_size = 64 * 1024
+
+
+class _RangeFile:
+    """Archivo limitado a [start, start + length) (rangos que no llegan al final)."""
+
+    def __init__(self, f, start: int, length: int) -> None:
+        self._file = f
+        self._file.seek(start)
+        self._remaining = length
+
+    def read(self, size: int = -1) -> bytes:
+        if self._remaining <= 0:
+            return b''
+        size = self._remaining if size < 0 else min(size, self._remaining)
+        data = self._file.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def _parse_range(header: str, size: int) -> tuple[int, int] | None:
+    """
+    (inicio, fin) inclusivos de un header `Range: bytes=...` de un solo
+    rango. None si no aplica (se responde el archivo completo). Lanza
+    ValueError si el rango no es satisfacible.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in spec:
+        return None
+    start_text, _, end_text = spec.strip().partition('-')
+    try:
+        start = int(start_text) if start_text else None
+        end = int(end_text) if end_text else None
+    except ValueError:
+        return None
+    if start is None:
+        if not end:
+            raise ValueError('rango vacío')
+        return max(size - end, 0), size - 1
+    if start >= size or (end is not None and end < start):
+        raise ValueError('rango fuera del archivo')
+    return start, size - 1 if end is None else min(end, size - 1)
+
+
+def serve_download(request, grant: DownloadGrant, filename: str) -> HttpResponse:
+    """Respuesta para GET/HEAD de un archivo del producto del token."""
+    config = get_downloads_config()
+    product = get_product(grant.product_id)
+    # El bundle (<producto>.zip) o uno de los archivos del producto
+    resolved = resolve_download(product, filename) if product else None
+    if resolved is None:
+        _counters.incr('rejected')
+        return JsonResponse({'success': False, 'error': 'Archivo no encontrado'}, status=404)
+    name, path = resolved
+
+    try:
+        f = open(path, 'rb')
+    except OSError:
+        logger.error(f"[DOWNLOADS] Archivo del catálogo no disponible: {path}")
+        _counters.incr('rejected')
+        return JsonResponse({'success': False, 'error': 'Archivo no disponible'}, status=404)
+
+    try:
+        stat = os.fstat(f.fileno())
+        size = stat.st_size
+        etag = f'"{stat.st_mtime_ns:x}-{size:x}"'
+        last_modified = int(stat.st_mtime)
+
+        conditional = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if conditional is not None:
+            f.close()
+            _counters.incr('not_modified')
+            return conditional
+
+        byte_range = None
+        range_header = request.headers.get('Range')
+        if_range = request.headers.get('If-Range')
+        if range_header and (not if_range or if_range == etag
+                             or parse_http_date_safe(if_range) == last_modified):
+            try:
+                byte_range = _parse_range(range_header, size)
+            except ValueError:
+                f.close()
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f"bytes */{size}"
+                return response
+
+        start, end = byte_range or (0, size - 1)
+        length = end - start + 1
+        if request.method == 'GET' and config['max_downloads']:
+            # En bytes: cualquier rango cuenta, no solo los que empiezan en 0
+            if _bytes_served(grant, filename) >= config['max_downloads'] * max(size, 1):
+                f.close()
+                _counters.incr('limit_reached')
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Se alcanzó el máximo de descargas de este link',
+                }, status=410)
+            _record_download(grant, filename, max(length, 1))
+        if request.method == 'HEAD':
+            f.close()
+            response = HttpResponse(status=206 if byte_range else 200, content_type='application/octet-stream')
+        elif byte_range is None:
+            response = DownloadResponse(f, as_attachment=True, filename=name)
+        elif end == size - 1:
+            # Hasta el final: archivo real posicionado en `start` (sendfile)
+            f.seek(start)
+            response = DownloadResponse(f, as_attachment=True, filename=name, status=206)
+        else:
+            response = DownloadResponse(_RangeFile(f, start, length), as_attachment=True,
+                                        filename=name, status=206)
+    except Exception:
+        f.close()
+        raise
+
+    response['Content-Length'] = str(length)
+    if byte_range:
+        response['Content-Range'] = f"bytes {start}-{end}/{size}"
+        _counters.incr('partial')
+    else:
+        _counters.incr('served')
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Cache-Control'] = 'private, no-transform'
+    return response
+
+
+def handle_download(request, token: str, filename: str) -> HttpResponse:
+    """Valida el token y sirve el archivo (vista download_file)."""
+    try:
+        grant = verify_token(token)
+    except DownloadTokenError as e:
+        _counters.incr('rejected')
+        return JsonResponse({'success': False, 'error': str(e)}, status=e.status)
+    return serve_download(request, grant, filename)
@@ -0,0 +1,290 @@
+"""
+Plantillas de email por producto - Datos con Alex
+==================================================
+El cuerpo y el asunto del email de entrega son templates de Django
+(payments/templates/payments/email/), cargados con el cached loader:
+
+- delivery.<idioma>.html / delivery_subject.<idioma>.txt
+- Un producto puede tener su propio texto en
+  payments/email/<product_id>/delivery.<idioma>.html (y _subject)
+
+Cada producto tiene un esqueleto precalculado (MessageSkeleton): asunto,
+remitente, adjuntos codificados y el HTML renderizado una sola vez,
+partido en fragmentos estáticos alrededor de los datos del cliente. Un
+envío solo completa el nombre del cliente (y el token de descarga) y une
+los fragmentos.
+
+Con links de descarga activos (payments/downloads.py) el email lleva un
+link firmado por archivo en vez de los adjuntos. Los productos con varios
+archivos se entregan como un solo zip (payments/bundles.py).
+
+Los esqueletos se arman al iniciar el servidor (payments/startup.py) o en
+el primer envío, y se vuelven a armar cuando cambia el catálogo
+(reload_catalog()) o cuando cambia en disco alguno de los archivos del
+producto: cada esqueleto guarda el (mtime, tamaño) de sus archivos fuente y
+get_skeleton() los compara en cada envío, así que un archivo reemplazado se
+vuelve a codificar (vía el caché de adjuntos, que valida lo mismo) sin
+reiniciar el proceso.
+==================================================
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Any
+
+import sib_api_v3_sdk
+from django.conf import settings
+from django.template.loader import select_template
+from django.utils.html import escape
+
+from .bundles import delivery_files
+from .catalog import Catalog, Product, get_catalog
+from .downloads import download_url, get_downloads_config, links_enabled
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAYMENTS_EMAIL: dict[str, Any] = {
+    'language': 'es',
+    'sender_name': 'Datos con Alex',
+}
+
+# Marcadores de los datos del cliente en el render del esqueleto (sin
+# caracteres que el autoescape o quote() modifiquen)
+CUSTOMER_NAME_MARKER = 'xCUSTOMERxNAMEx'
+DOWNLOAD_TOKEN_MARKER = 'xDOWNLOADxTOKENx'
+_MARKERS = re.compile(f"({CUSTOMER_NAME_MARKER}|{DOWNLOAD_TOKEN_MARKER})")
+
+# Envíos en lote (message versions de Brevo): los datos de cada cliente van
+# en los params de su versión y Brevo los reemplaza en el HTML compartido
+BATCH_PLACEHOLDERS = {
+    CUSTOMER_NAME_MARKER: '{{ params.name }}',
+    DOWNLOAD_TOKEN_MARKER: '{{ params.token }}',
+}
+
+
+def get_email_config() -> dict[str, Any]:
+    config = dict(DEFAULT_PAYMENTS_EMAIL)
+    config.update(getattr(settings, 'PAYMENTS_EMAIL', {}))
+    return config
+
+
+def _template_names(product_id: str, name: str, language: str) -> list[str]:
+    """Override del producto, template general y, si falta, el del idioma default."""
+    names = [f"payments/email/{product_id}/{name}.{language}", f"payments/email/{name}.{language}"]
+    if language != DEFAULT_PAYMENTS_EMAIL['language']:
+        names.append(f"payments/email/{name}.{DEFAULT_PAYMENTS_EMAIL['language']}")
+    return names
+
+
+@dataclass(frozen=True)
+class MessageSkeleton:
+    """Todo lo que no depende del cliente en el email de un producto."""
+
+    product_id: str
+    language: str
+    subject: str
+    sender: dict[str, str]
+    # HTML renderizado: fragmentos estáticos intercalados con los marcadores
+    html_parts: tuple[str, ...]
+    # True: links de descarga (attachments vacío); False: adjuntos
+    uses_links: bool
+    attachments: tuple[dict[str, str], ...]
+    file_count: int
+    missing_files: tuple[str, ...]
+    # (ruta, mtime_ns, tamaño) de los archivos fuente al armarlo
+    sources: tuple[tuple[str, int, int], ...] = ()
+
+    @property
+    def deliverable(self) -> bool:
+        """Hay al menos un archivo para entregar."""
+        return len(self.missing_files) < self.file_count
+
+    def render_html(self, customer_name: str, download_token: str = '') -> str:
+        values = {CUSTOMER_NAME_MARKER: escape(customer_name), DOWNLOAD_TOKEN_MARKER: download_token}
+        return ''.join([values.get(part, part) for part in self.html_parts])
+
+    def build(
+        self,
+        recipient_email: str,
+        customer_name: str,
+        download_token: str = '',
+    ) -> sib_api_v3_sdk.SendSmtpEmail:
+        message = sib_api_v3_sdk.SendSmtpEmail(
+            to=[{"email": recipient_email, "name": customer_name}],
+            sender=self.sender,
+            subject=self.subject,
+            html_content=self.render_html(customer_name, download_token),
+        )
+        if self.attachments:
+            message.attachment = list(self.attachments)
+        return message
+
+    def build_batch(self, recipients: list[tuple[str, str, str]]) -> sib_api_v3_sdk.SendSmtpEmail:
+        """
+        Un solo request para varios clientes: (email, nombre, token) por
+        versión. El HTML y los adjuntos viajan una vez. Los nombres se pasan
+        tal cual: solo entran al lote los que no necesitan escaparse en HTML
+        (ver services.send_product_emails).
+        """
+        message = sib_api_v3_sdk.SendSmtpEmail(
+            sender=self.sender,
+            subject=self.subject,
+            html_content=''.join([BATCH_PLACEHOLDERS.get(part, part) for part in self.html_parts]),
+            message_versions=[
+                sib_api_v3_sdk.SendSmtpEmailMessageVersions(
+                    to=[{"email": email, "name": name}],
+                    params={'name': name, 'token': token},
+                )
+                for email, name, token in recipients
+            ],
+        )
+        if self.attachments:
+            message.attachment = list(self.attachments)
+        return message
+
+
+def render_delivery_html(
+    product: Product,
+    customer_name: str,
+    language: str | None = None,
+    download_token: str | None = None,
+) -> str:
+    """Render completo del template (sin esqueleto): diagnósticos y benchmarks."""
+    config = get_email_config()
+    language = language or config['language']
+    template = select_template([f"{n}.html" for n in _template_names(product.id, 'delivery', language)])
+    download_links = None
+    if download_token is not None:
+        download_links = [
+            {'name': name, 'url': download_url(download_token, name)}
+            for name, _, exists in delivery_files(product) if exists
+        ]
+    return template.render({
+        'product': product,
+        'customer_name': customer_name,
+        'sender_name': config['sender_name'],
+        'download_links': download_links,
+        'link_days': max(get_downloads_config()['ttl'] // 86400, 1),
+    })
+
+
+def _source_signatures(product: Product) -> tuple[tuple[str, int, int], ...]:
+    """(ruta, mtime_ns, tamaño) actuales de los archivos del producto; (ruta, -1, -1) si falta."""
+    signatures = []
+    for product_file in product.files:
+        try:
+            stat = os.stat(product_file.path)
+        except OSError:
+            signatures.append((product_file.path, -1, -1))
+        else:
+            signatures.append((product_file.path, stat.st_mtime_ns, stat.st_size))
+    return tuple(signatures)
+
+
+def build_skeleton(product: Product, language: str | None = None) -> MessageSkeleton:
+    from .services import get_encoded_attachment
+
+    config = get_email_config()
+    language = language or config['language']
+    uses_links = links_enabled()
+    context = {'product': product, 'sender_name': config['sender_name']}
+
+    subject_template = select_template([f"{n}.txt" for n in _template_names(product.id, 'delivery_subject', language)])
+    subject = subject_template.render(context).strip()
+    html = render_delivery_html(
+        product, CUSTOMER_NAME_MARKER, language,
+        download_token=DOWNLOAD_TOKEN_MARKER if uses_links else None,
+    )
+
+    # Antes de leerlos: si un archivo cambia mientras tanto, el próximo envío
+    # vuelve a armar el esqueleto
+    sources = _source_signatures(product)
+    # Productos con varios archivos: un solo zip (payments/bundles.py)
+    files = delivery_files(product)
+    attachments, missing = [], []
+    for name, path, exists in files:
+        if uses_links:
+            # El archivo se sirve desde disco: alcanza con que exista
+            if not exists:
+                missing.append(path)
+            continue
+        attachment = get_encoded_attachment(path, name)
+        if attachment is not None:
+            attachments.append(attachment)
+        else:
+            missing.append(path)
+
+    return MessageSkeleton(
+        product_id=product.id,
+        language=language,
+        subject=subject,
+        sender={"email": os.environ.get('DEFAULT_FROM_EMAIL', '').strip(), "name": config['sender_name']},
+        html_parts=tuple(_MARKERS.split(html)),
+        uses_links=uses_links,
+        attachments=tuple(attachments),
+        file_count=len(files),
+        missing_files=tuple(missing),
+        sources=sources,
+    )
+
+
+# =============================================================================
+# ESQUELETOS DEL PROCESO
+# =============================================================================
+
+_lock = threading.Lock()
+_skeletons: dict[str, MessageSkeleton] = {}
+_skeletons_catalog: Catalog | None = None
+
+
+def prerender_email_templates() -> int:
+    """Arma los esqueletos de todos los productos. Retorna cuántos están completos."""
+    global _skeletons, _skeletons_catalog
+    catalog = get_catalog()
+    skeletons = {product.id: build_skeleton(product) for product in catalog}
+    with _lock:
+        _skeletons = skeletons
+        _skeletons_catalog = catalog
+    for skeleton in skeletons.values():
+        for path in skeleton.missing_files:
+            logger.warning(f"[EMAILS] {skeleton.product_id}: adjunto no encontrado {path}")
+    return sum(1 for s in skeletons.values() if not s.missing_files)
+
+
+def get_skeleton(product_id: str) -> MessageSkeleton | None:
+    """Esqueleto del producto (None si no está en el catálogo)."""
+    if _skeletons_catalog is not get_catalog():
+        prerender_email_templates()
+    skeleton = _skeletons.get(product_id)
+    if skeleton is None:
+        return None
+    product = get_catalog().get(product_id)
+    if product is not None and _source_signatures(product) != skeleton.sources:
+        # Un archivo se reemplazó, apareció o se borró desde que se armó
+        skeleton = build_skeleton(product, skeleton.language)
+        with _lock:
+            _skeletons[product_id] = skeleton
+        logger.info(f"[EMAILS] {product_id}: archivos cambiados en disco, esqueleto rearmado")
+    return skeleton
+
+
+def email_template_stats() -> dict[str, Any]:
+    config = get_email_config()
+    return {
+        "language": config['language'],
+        "delivery": "links" if links_enabled() else "attachments",
+        "products": {
+            product_id: {
+                "subject": skeleton.subject,
+                "attachments": len(skeleton.attachments),
+                "missing_files": list(skeleton.missing_files),
+                "html_bytes": sum(len(p) for p in skeleton.html_parts),
+            }
+            for product_id, skeleton in _skeletons.items()
+        },
+    }
@@ -0,0 +1,195 @@
+"""
+Store de idempotencia de pagos - Datos con Alex
+================================================
+Reemplaza al antiguo set en memoria `_processed_payments`.
+
+- claim(payment_id): operación atómica; solo el primer llamador gana,
+  aunque el redirect y el webhook caigan en workers distintos
+- Backend por defecto en la base de datos (SQLite compartida entre
+  procesos y persistente entre redeploys)
+- Caché LRU/TTL en memoria por delante: los pagos ya reclamados se
+  rechazan sin consultar la base
+- Las entradas vencen (ttl) y se purgan periódicamente
+
+El backend es configurable con settings.PAYMENTS_IDEMPOTENCY['backend'].
+================================================
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from datetime import timedelta
+from typing import Any
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .cache import BoundedCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_IDEMPOTENCY: dict[str, Any] = {
+    'backend': 'payments.idempotency.DatabaseIdempotencyStore',
+    'ttl': 30 * 24 * 3600,          # un pago reclamado se recuerda 30 días
+    'local_cache_size': 10_000,     # entradas del caché en memoria por proceso
+    'local_cache_ttl': 3600,
+    'purge_interval': 3600,         # segundos entre purgas de entradas vencidas
+}
+
+
+def get_idempotency_config() -> dict[str, Any]:
+    config = dict(DEFAULT_IDEMPOTENCY)
+    config.update(getattr(settings, 'PAYMENTS_IDEMPOTENCY', {}))
+    return config
+
+
+class IdempotencyStore:
+    """Interfaz de los stores de idempotencia."""
+
+    def __init__(self, ttl: float, **options: Any) -> None:
+        self.ttl = ttl
+
+    def claim(self, key: str, source: str = '') -> bool:
+        """Reclama `key`. True si este llamador es el primero (debe procesar)."""
+        raise NotImplementedError
+
+    def is_claimed(self, key: str) -> bool:
+        raise NotImplementedError
+
+    def release(self, key: str) -> None:
+        """Libera un reclamo (p. ej. si el procesamiento falló antes de completarse)."""
+        raise NotImplementedError
+
+    def purge_expired(self) -> int:
+        return 0
+
+    def stats(self) -> dict[str, Any]:
+        return {"backend": type(self).__name__}
+
+
+class InMemoryIdempotencyStore(IdempotencyStore):
+    """Store por proceso (desarrollo/tests). No coordina entre workers."""
+
+    def __init__(self, ttl: float, local_cache_size: int = 10_000, **options: Any) -> None:
+        super().__init__(ttl)
+        self._claims = BoundedCache('idempotency', max_entries=local_cache_size, ttl=ttl)
+        self._lock = threading.Lock()
+
+    def claim(self, key: str, source: str = '') -> bool:
+        with self._lock:
+            if key in self._claims:
+                return False
+            self._claims.set(key, source)
+            return True
+
+    def is_claimed(self, key: str) -> bool:
+        return key in self._claims
+
+    def release(self, key: str) -> None:
+        self._claims.delete(key)
+
+    def stats(self) -> dict[str, Any]:
+        return {"backend": type(self).__name__, "local_cache": self._claims.stats()}
+
+
+class DatabaseIdempotencyStore(IdempotencyStore):
+    """
+    Store sobre la tabla processed_payments.
+
+    El INSERT con payment_id único es el reclamo atómico entre procesos.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        local_cache_size: int = 10_000,
+        local_cache_ttl: float = 3600,
+        purge_interval: float = 3600,
+        **options: Any,
+    ) -> None:
+        super().__init__(ttl)
+        # Solo se cachean reclamos confirmados: un "no reclamado" siempre se
+        # verifica en la base para no perder el reclamo de otro worker.
+        self._local = BoundedCache('idempotency', max_entries=local_cache_size, ttl=min(local_cache_ttl, ttl))
+        self.purge_interval = purge_interval
+        self._next_purge = 0.0
+
+    def claim(self, key: str, source: str = '') -> bool:
+        from .models import ProcessedPayment
+
+        if key in self._local:
+            return False
+        self._maybe_purge()
+
+        now = timezone.now()
+        expires_at = now + timedelta(seconds=self.ttl)
+        try:
+            ProcessedPayment.objects.create(payment_id=key, source=source, claimed_at=now, expires_at=expires_at)
+            claimed = True
+        except IntegrityError:
+            # Ya existe: solo se puede re-reclamar si la entrada venció
+            claimed = bool(ProcessedPayment.objects.filter(payment_id=key, expires_at__lte=now).update(
+                source=source, claimed_at=now, expires_at=expires_at,
+            ))
+
+        self._local.set(key, True)
+        return claimed
+
+    def is_claimed(self, key: str) -> bool:
+        from .models import ProcessedPayment
+
+        if key in self._local:
+            return True
+        claimed = ProcessedPayment.objects.filter(payment_id=key, expires_at__gt=timezone.now()).exists()
+        if claimed:
+            self._local.set(key, True)
+        return claimed
+
+    def release(self, key: str) -> None:
+        from .models import ProcessedPayment
+
+        self._local.delete(key)
+        ProcessedPayment.objects.filter(payment_id=key).delete()
+
+    def purge_expired(self) -> int:
+        from .models import ProcessedPayment
+
+        deleted, _ = ProcessedPayment.objects.filter(expires_at__lte=timezone.now()).delete()
+        if deleted:
+            logger.info(f"[IDEMPOTENCY] {deleted} reclamo(s) vencido(s) purgado(s)")
+        return deleted
+
+    def stats(self) -> dict[str, Any]:
+        return {"backend": type(self).__name__, "local_cache": self._local.stats()}
+
+    def _maybe_purge(self) -> None:
+        if time.monotonic() < self._next_purge:
+            return
+        self._next_purge = time.monotonic() + self.purge_interval
+        try:
+            self.purge_expired()
+        except Exception:
+            logger.exception("[IDEMPOTENCY] Error purgando reclamos vencidos")
+
+
+# =============================================================================
+# STORE POR PROCESO
+# =============================================================================
+
+_store: IdempotencyStore | None = None
+_store_lock = threading.Lock()
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                config = get_idempotency_config()
+                backend = import_string(config.pop('backend'))
+                _store = backend(**config)
+    return _store
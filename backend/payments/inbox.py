@@ -0,0 +1,391 @@
+"""
+Inbox de webhooks de Mercado Pago - Datos con Alex
+===================================================
+El webhook solo guarda la notificación cruda (WebhookNotification) y
+responde 200 en milisegundos. Un consumidor en segundo plano la procesa:
+
+1. Toma un lote de notificaciones pendientes, en orden de llegada
+   (un solo consumidor activo a la vez entre todos los procesos)
+2. Extrae tipo y payment_id; descarta lo que no es un pago
+3. Descarta notificaciones repetidas (mismo notification_id, en el lote
+   o ya procesada antes) y agrupa las del mismo payment_id en una sola
+   consulta
+4. Consulta a MP en bloque: MP no tiene un GET de varios pagos, así que
+   con `search_min_payments` o más pagos nuevos en el lote se hace una
+   búsqueda (/v1/payments/search por date_last_updated) que trae todos
+   de una vez. Los que no aparecen en estado terminal, y los pagos ya
+   reclamados (una notificación nueva suele ser un reembolso o un
+   contracargo que el ledger tiene que ver), se consultan uno por uno
+   en paralelo acotado
+5. process_payment con cada pago (ledger + encolado del email)
+6. Errores transitorios (MP caído, etc.) se reintentan con backoff. Con
+   el circuit breaker de MP abierto el consumidor no toma lotes
+
+Replay: `python manage.py replay_webhooks` vuelve a poner notificaciones
+guardadas en la cola (p. ej. después de una caída).
+===================================================
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import random
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count
+from django.utils import timezone
+
+from . import resilience
+from .background import WorkerPool, exclusive_process_lock
+from .clients import mp_payment_search
+from .idempotency import get_idempotency_store
+from .models import WebhookNotification
+from .payment_cache import TERMINAL_STATUSES, invalidate_payment, store_payment
+from .processing import process_payment
+from .reconcile import format_mp_date
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WEBHOOK_INBOX: dict[str, Any] = {
+    'batch_size': 50,
+    'lookup_concurrency': 4,   # consultas a MP en paralelo por lote
+    'search_min_payments': 5,  # pagos nuevos por lote desde los que se busca en bloque
+    'search_page_size': 100,
+    'search_max_pages': 3,
+    'search_margin': 300,      # segundos de ventana antes de la notificación más vieja
+    'max_attempts': 8,
+    'backoff_base': 15,
+    'backoff_max': 1800,
+    'poll_interval': 2,
+    'lease_seconds': 300,
+}
+
+# Headers que vale la pena guardar (firma y trazabilidad de MP)
+STORED_HEADERS = ('HTTP_X_SIGNATURE', 'HTTP_X_REQUEST_ID', 'CONTENT_TYPE', 'HTTP_USER_AGENT')
+
+# Resultados de process_payment que conviene reintentar
+RETRYABLE_OUTCOMES = frozenset({'mp_error', 'mp_exception', 'mp_unavailable', 'enqueue_failed'})
+
+
+def get_inbox_config() -> dict[str, Any]:
+    config = dict(DEFAULT_WEBHOOK_INBOX)
+    config.update(getattr(settings, 'WEBHOOK_INBOX', {}))
+    return config
+
+
+# =============================================================================
+# RECEPCIÓN (camino del request: solo un INSERT)
+# =============================================================================
+
+def store_notification(request) -> WebhookNotification:
+    """Guarda la notificación cruda y despierta al consumidor."""
+    notification = WebhookNotification.objects.create(
+        raw_body=request.body.decode('utf-8', errors='replace') if request.body else '',
+        query_string=request.META.get('QUERY_STRING', ''),
+        headers={key: request.META[key] for key in STORED_HEADERS if key in request.META},
+    )
+    start_consumer()
+    _consumer.wake()
+    return notification
+
+
+def defer_payment(payment_id: str, source: str, delay: float = 0) -> WebhookNotification:
+    """
+    Deja un pago en el inbox para procesarlo cuando MP vuelva a responder
+    (validate con el circuit breaker de MP abierto). Si el pago ya tiene
+    una notificación pendiente, no se duplica.
+    """
+    pending = WebhookNotification.objects.filter(
+        payment_id=payment_id, status=WebhookNotification.STATUS_RECEIVED,
+    ).first()
+    if pending is not None:
+        return pending
+    notification = WebhookNotification.objects.create(
+        raw_body=json.dumps({'type': 'payment', 'data': {'id': payment_id}}),
+        headers={'DEFERRED_FROM': source},
+        notification_type='payment',
+        payment_id=payment_id,
+        next_attempt_at=timezone.now() + timedelta(seconds=delay),
+    )
+    start_consumer()
+    return notification
+
+
+async def astore_notification(request) -> WebhookNotification:
+    """Versión async de store_notification (vistas ASGI)."""
+    notification = await WebhookNotification.objects.acreate(
+        raw_body=request.body.decode('utf-8', errors='replace') if request.body else '',
+        query_string=request.META.get('QUERY_STRING', ''),
+        headers={key: request.META[key] for key in STORED_HEADERS if key in request.META},
+    )
+    start_consumer()
+    _consumer.wake()
+    return notification
+
+
+# =============================================================================
+# PARSEO
+# =============================================================================
+
+def parse_notification(notification: WebhookNotification) -> tuple[str, str, str]:
+    """
+    Extrae (notification_id, tipo, payment_id) del body o del query string.
+
+    Soporta el formato Webhooks ({"type": "payment", "data": {"id": ...}})
+    y el IPN legacy (?topic=payment&id=...).
+    """
+    try:
+        body = json.loads(notification.raw_body) if notification.raw_body else {}
+        if not isinstance(body, dict):
+            body = {}
+    except json.JSONDecodeError:
+        body = {}
+    query = {k: v[0] for k, v in parse_qs(notification.query_string).items()}
+    return parse_payload(body, query)
+
+
+def parse_payload(body: dict[str, Any], query: dict[str, str]) -> tuple[str, str, str]:
+    """(notification_id, tipo, payment_id) de un body JSON ya decodificado y el query string."""
+    notification_type = body.get('type') or query.get('type') or query.get('topic') or ''
+    data = body.get('data') if isinstance(body.get('data'), dict) else {}
+    payment_id = data.get('id') or body.get('data.id') or query.get('data.id') or ''
+    if not payment_id and query.get('topic') == 'payment':
+        payment_id = query.get('id', '')
+    notification_id = str(body.get('id') or '')
+    return notification_id, str(notification_type), str(payment_id)
+
+
+# =============================================================================
+# CONSUMIDOR
+# =============================================================================
+
+def _backoff_seconds(attempts: int, config: dict[str, Any]) -> float:
+    delay = min(config['backoff_max'], config['backoff_base'] * (2 ** max(attempts - 1, 0)))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def _claim_batch(config: dict[str, Any]) -> list[WebhookNotification]:
+    now = timezone.now()
+
+    # Notificaciones que quedaron en 'processing' (proceso caído a mitad de lote)
+    WebhookNotification.objects.filter(
+        status=WebhookNotification.STATUS_PROCESSING,
+        updated_at__lt=now - timedelta(seconds=config['lease_seconds']),
+    ).update(status=WebhookNotification.STATUS_RECEIVED, updated_at=now)
+
+    ids = list(WebhookNotification.objects.filter(
+        status=WebhookNotification.STATUS_RECEIVED, next_attempt_at__lte=now,
+    ).order_by('id').values_list('id', flat=True)[:config['batch_size']])
+    if not ids:
+        return []
+
+    # Solo hay un consumidor activo (exclusive_process_lock), no hace falta
+    # más coordinación que marcar el lote como 'processing'
+    WebhookNotification.objects.filter(
+        id__in=ids, status=WebhookNotification.STATUS_RECEIVED,
+    ).update(status=WebhookNotification.STATUS_PROCESSING, updated_at=now)
+    return list(WebhookNotification.objects.filter(
+        id__in=ids, status=WebhookNotification.STATUS_PROCESSING,
+    ).order_by('id'))
+
+
+def _finish(notification: WebhookNotification, status: str, outcome: str, error: str = '') -> None:
+    now = timezone.now()
+    WebhookNotification.objects.filter(id=notification.id).update(
+        status=status,
+        outcome=outcome,
+        last_error=error,
+        notification_id=notification.notification_id,
+        notification_type=notification.notification_type,
+        payment_id=notification.payment_id,
+        processed_at=now,
+        updated_at=now,
+    )
+
+
+def _retry_or_fail(notification: WebhookNotification, outcome: str, error: str, config: dict[str, Any]) -> None:
+    attempts = notification.attempts + 1
+    now = timezone.now()
+    if attempts >= config['max_attempts']:
+        WebhookNotification.objects.filter(id=notification.id).update(
+            status=WebhookNotification.STATUS_FAILED, attempts=attempts, outcome=outcome,
+            last_error=error, payment_id=notification.payment_id,
+            notification_type=notification.notification_type, updated_at=now,
+        )
+        logger.critical(f"[INBOX] ❌ Notificación #{notification.id} (payment {notification.payment_id}) FALLIDA tras {attempts} intentos: {error}")
+        return
+    delay = _backoff_seconds(attempts, config)
+    WebhookNotification.objects.filter(id=notification.id).update(
+        status=WebhookNotification.STATUS_RECEIVED, attempts=attempts, outcome=outcome,
+        last_error=error, payment_id=notification.payment_id,
+        notification_type=notification.notification_type,
+        next_attempt_at=now + timedelta(seconds=delay), updated_at=now,
+    )
+    logger.warning(f"[INBOX] Notificación #{notification.id} reintenta en {delay:.0f}s ({outcome}: {error})")
+
+
+def _already_processed_ids(batch: list[WebhookNotification]) -> set[str]:
+    """notification_id del lote que ya se procesaron en un lote anterior."""
+    notification_ids = {n.notification_id for n in batch if n.notification_id}
+    if not notification_ids:
+        return set()
+    return set(WebhookNotification.objects.filter(
+        notification_id__in=notification_ids, status=WebhookNotification.STATUS_PROCESSED,
+    ).exclude(id__in=[n.id for n in batch]).values_list('notification_id', flat=True))
+
+
+def _search_payments(payment_ids: set[str], since: datetime, config: dict[str, Any]) -> dict[str, dict[str, Any]]:
+    """
+    Consulta en bloque: los pagos actualizados desde `since`, con una
+    búsqueda por página en vez de un GET por pago. Retorna, en el formato
+    de payment.get, los de `payment_ids` que aparecen en estado terminal
+    (la búsqueda puede ir unos segundos atrasada: un estado no terminal se
+    vuelve a consultar con GET). Un error deja que se consulten uno por uno.
+    """
+    found: dict[str, dict[str, Any]] = {}
+    offset = 0
+    try:
+        for _ in range(config['search_max_pages']):
+            response = mp_payment_search({
+                'range': 'date_last_updated',
+                'begin_date': format_mp_date(since),
+                'end_date': 'NOW',
+                'sort': 'date_last_updated',
+                'criteria': 'desc',
+                'limit': config['search_page_size'],
+                'offset': offset,
+            })
+            if response.get('status') != 200:
+                logger.warning(f"[INBOX] Búsqueda en bloque: HTTP {response.get('status')}, se consulta uno por uno")
+                break
+            results = (response.get('response') or {}).get('results') or []
+            for payment in results:
+                payment_id = str(payment.get('id'))
+                if payment_id in payment_ids and payment.get('status') in TERMINAL_STATUSES:
+                    found[payment_id] = {'status': 200, 'response': payment}
+            if payment_ids <= found.keys() or len(results) < config['search_page_size']:
+                break
+            offset += len(results)
+    except Exception as e:
+        logger.warning(f"[INBOX] Búsqueda en bloque falló ({type(e).__name__}: {e}), se consulta uno por uno")
+    return found
+
+
+def _process_unique_payment(payment_id: str, prefetched: dict[str, Any] | None) -> dict[str, Any]:
+    try:
+        if prefetched is not None:
+            store_payment(payment_id, prefetched)
+        return process_payment(payment_id, source='webhook', payment_response=prefetched)
+    finally:
+        # Thread del executor: no dejar conexiones abiertas
+        connection.close()
+
+
+def process_inbox_batch() -> bool:
+    """Tarea del consumidor. Retorna True si procesó al menos una notificación."""
+    config = get_inbox_config()
+    if resilience.is_open('mercadopago'):
+        # Cada consulta fallaría al instante y gastaría un intento: esperar
+        return False
+    with exclusive_process_lock('webhook-inbox') as acquired:
+        if not acquired:
+            return False  # otro proceso está consumiendo
+        batch = _claim_batch(config)
+        if not batch:
+            return False
+
+        # 1-3. PARSEAR Y DEDUPLICAR
+        for notification in batch:
+            notification.notification_id, notification.notification_type, notification.payment_id = (
+                parse_notification(notification)
+            )
+        seen_notifications = _already_processed_ids(batch)
+        primary: dict[str, list[WebhookNotification]] = {}
+        for notification in batch:
+            notification_id, payment_id = notification.notification_id, notification.payment_id
+            if notification.notification_type != 'payment':
+                _finish(notification, WebhookNotification.STATUS_IGNORED, 'not_payment')
+            elif not payment_id:
+                _finish(notification, WebhookNotification.STATUS_IGNORED, 'no_payment_id')
+            elif notification_id and notification_id in seen_notifications:
+                _finish(notification, WebhookNotification.STATUS_DUPLICATE, 'duplicate_notification')
+            else:
+                primary.setdefault(payment_id, []).append(notification)
+            if notification_id:
+                seen_notifications.add(notification_id)
+
+        # 4. CONSULTAS A MP: en bloque los pagos nuevos, de a uno los ya reclamados
+        if primary:
+            idempotency = get_idempotency_store()
+            claimed = {payment_id for payment_id in primary if idempotency.is_claimed(payment_id)}
+            for payment_id in claimed:
+                # El caché tiene el estado con el que se entregó: ver el actual
+                invalidate_payment(payment_id)
+            new = set(primary) - claimed
+            prefetched: dict[str, dict[str, Any]] = {}
+            if len(new) >= config['search_min_payments']:
+                oldest = min(n.received_at for payment_id in new for n in primary[payment_id])
+                prefetched = _search_payments(new, oldest - timedelta(seconds=config['search_margin']), config)
+                logger.info(f"[INBOX] Búsqueda en bloque: {len(prefetched)}/{len(new)} pago(s) nuevos resueltos")
+
+            payment_ids = list(primary)
+            with ThreadPoolExecutor(max_workers=config['lookup_concurrency'], thread_name_prefix='inbox-mp') as pool:
+                results = dict(zip(payment_ids, pool.map(
+                    lambda payment_id: _process_unique_payment(payment_id, prefetched.get(payment_id)), payment_ids,
+                )))
+
+            # 5. REGISTRAR RESULTADOS
+            for payment_id, notifications in primary.items():
+                result = results[payment_id]
+                first, duplicates = notifications[0], notifications[1:]
+                if result['outcome'] in RETRYABLE_OUTCOMES:
+                    _retry_or_fail(first, result['outcome'], str(result.get('error') or result.get('mp_http_status') or ''), config)
+                else:
+                    _finish(first, WebhookNotification.STATUS_PROCESSED, result['outcome'])
+                    logger.info(f"[INBOX] Notificación #{first.id} payment {payment_id}: {result['outcome']}")
+                for duplicate in duplicates:
+                    _finish(duplicate, WebhookNotification.STATUS_DUPLICATE, 'duplicate_in_batch')
+
+        return True
+
+
+def replay_notifications(queryset) -> int:
+    """Vuelve a encolar notificaciones guardadas. Retorna cuántas."""
+    now = timezone.now()
+    replayed = queryset.exclude(status=WebhookNotification.STATUS_PROCESSING).update(
+        status=WebhookNotification.STATUS_RECEIVED, attempts=0, next_attempt_at=now,
+        outcome='', last_error='', updated_at=now,
+    )
+    if replayed:
+        _consumer.wake()
+    return replayed
+
+
+def inbox_stats() -> dict[str, Any]:
+    counts = {status: 0 for status, _ in WebhookNotification.STATUS_CHOICES}
+    for row in WebhookNotification.objects.values('status').order_by().annotate(n=Count('id')):
+        counts[row['status']] = row['n']
+    return {"consumer_running": _consumer.running, "notifications": counts}
+
+
+_inbox_config = get_inbox_config()
+_consumer = WorkerPool(
+    'webhook-inbox',
+    process_inbox_batch,
+    concurrency=1,
+    poll_interval=_inbox_config['poll_interval'],
+)
+
+
+def start_consumer() -> None:
+    _consumer.start()
+
+
+def stop_consumer(timeout: float | None = None) -> None:
+    _consumer.stop(timeout)
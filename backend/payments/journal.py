@@ -0,0 +1,335 @@
+"""
+Journal de eventos de pagos - Datos con Alex
+=============================================
+Registro local append-only de lo que le pasa a cada pago (preferencia
+creada, pago consultado, email encolado/enviado, ...), para no depender
+del buffer de logs de Railway cuando algo sale mal.
+
+- record_event() solo agrega el evento a un buffer en memoria (no toca
+  disco ni formatea en el request)
+- Un thread escribe el buffer en lote, cada `flush_interval` segundos o
+  cuando junta `batch_size` eventos
+- Cada proceso escribe su propio segmento JSONL
+  (PAYMENTS_RUNTIME_DIR/journal/<inicio_ms>-<pid>.jsonl); al superar
+  `segment_max_bytes` o `segment_max_age` se cierra y se comprime (.gz)
+- Se conservan los últimos `max_segments` segmentos comprimidos
+- query() lee segmentos activos y comprimidos, filtrando por payment_id,
+  rango de tiempo y tipo de evento
+
+Consultar desde la terminal:
+    python manage.py query_journal --payment-id 123456789
+=============================================
+"""
+
+from __future__ import annotations
+
+import atexit
+import gzip
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Iterator
+
+from django.conf import settings
+
+from .background import WorkerPool
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOURNAL: dict[str, Any] = {
+    'enabled': True,
+    'buffer_size': 10000,         # eventos en memoria antes de descartar
+    'batch_size': 500,
+    'flush_interval': 1.0,
+    'segment_max_bytes': 8 * 1024 * 1024,
+    'segment_max_age': 3600,
+    'max_segments': 168,
+}
+
+ACTIVE_SUFFIX = '.jsonl'
+ARCHIVED_SUFFIX = '.jsonl.gz'
+
+
+def get_journal_config() -> dict[str, Any]:
+    config = dict(DEFAULT_JOURNAL)
+    config.update(getattr(settings, 'PAYMENT_JOURNAL', {}))
+    return config
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _segment_info(path: Path) -> tuple[int, int] | None:
+    """(inicio_ms, pid) desde el nombre del segmento."""
+    stem = path.name.split('.', 1)[0]
+    try:
+        start_ms, pid = stem.split('-')
+        return int(start_ms), int(pid)
+    except ValueError:
+        return None
+
+
+class Journal:
+    """Journal append-only de un directorio (un segmento activo por proceso)."""
+
+    def __init__(self, directory: str | Path, **options: Any) -> None:
+        config = {**DEFAULT_JOURNAL, **options}
+        self.directory = Path(directory)
+        self.batch_size = int(config['batch_size'])
+        self.segment_max_bytes = int(config['segment_max_bytes'])
+        self.segment_max_age = float(config['segment_max_age'])
+        self.max_segments = int(config['max_segments'])
+        self._buffer: deque[dict[str, Any]] = deque()
+        self._buffer_size = int(config['buffer_size'])
+        self._buffer_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._file = None
+        self._segment: Path | None = None
+        self._segment_started = 0.0
+        self._segment_bytes = 0
+        self._pid: int | None = None
+        self.written = 0
+        self.dropped = 0
+        self.segments_archived = 0
+
+    # -------------------------------------------------------------------------
+    # Escritura
+    # -------------------------------------------------------------------------
+
+    def append(self, event: dict[str, Any]) -> bool:
+        """Agrega un evento al buffer. False si el buffer está lleno."""
+        with self._buffer_lock:
+            if len(self._buffer) >= self._buffer_size:
+                self.dropped += 1
+                return False
+            self._buffer.append(event)
+            return True
+
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    def flush(self) -> int:
+        """Escribe todo el buffer al segmento activo. Retorna cuántos eventos."""
+        with self._write_lock:
+            total = 0
+            while True:
+                with self._buffer_lock:
+                    batch = [self._buffer.popleft() for _ in range(min(self.batch_size, len(self._buffer)))]
+                if not batch:
+                    break
+                data = ''.join(json.dumps(e, default=str, ensure_ascii=False) + '\n' for e in batch).encode('utf-8')
+                self._open_segment()
+                self._file.write(data)
+                self._file.flush()
+                self._segment_bytes += len(data)
+                total += len(batch)
+                if self._should_rotate():
+                    self._rotate()
+            if total == 0 and self._file is not None and self._should_rotate():
+                self._rotate()
+            self.written += total
+            return total
+
+    def _open_segment(self) -> None:
+        if self._pid != os.getpid():
+            # Después de un fork el archivo heredado es del padre
+            self._file = None
+            self._pid = os.getpid()
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._archive_orphans()
+        if self._file is None:
+            self._segment_started = time.time()
+            self._segment = self.directory / f"{int(self._segment_started * 1000)}-{self._pid}{ACTIVE_SUFFIX}"
+            self._file = open(self._segment, 'ab')
+            self._segment_bytes = self._file.tell()
+
+    def _should_rotate(self) -> bool:
+        return (
+            self._segment_bytes >= self.segment_max_bytes
+            or time.time() - self._segment_started >= self.segment_max_age
+        )
+
+    def _rotate(self) -> None:
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        self._archive(self._segment)
+        self._segment = None
+        self._enforce_retention()
+
+    def _archive(self, path: Path) -> None:
+        """Comprime un segmento cerrado (conserva su mtime para las consultas)."""
+        target = path.with_name(path.name[:-len(ACTIVE_SUFFIX)] + ARCHIVED_SUFFIX)
+        try:
+            stat = path.stat()
+            tmp = target.with_name('.tmp-' + target.name)
+            with open(path, 'rb') as src, gzip.open(tmp, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+            os.utime(tmp, (stat.st_atime, stat.st_mtime))
+            os.replace(tmp, target)
+            path.unlink()
+            self.segments_archived += 1
+        except OSError:
+            logger.exception(f"[JOURNAL] No se pudo comprimir {path.name}")
+
+    def _archive_orphans(self) -> None:
+        """Segmentos activos de procesos que ya no existen."""
+        for path in self.directory.glob(f"*{ACTIVE_SUFFIX}"):
+            info = _segment_info(path)
+            if info and info[1] != os.getpid() and not _pid_alive(info[1]):
+                self._archive(path)
+
+    def _enforce_retention(self) -> None:
+        archived = sorted(
+            (p for p in self.directory.glob(f"*{ARCHIVED_SUFFIX}") if _segment_info(p)),
+            key=_segment_info,
+        )
+        for path in archived[:max(len(archived) - self.max_segments, 0)]:
+            path.unlink(missing_ok=True)
+
+    def close(self) -> None:
+        self.flush()
+        with self._write_lock:
+            if self._file is not None and self._pid == os.getpid():
+                self._file.close()
+                self._file = None
+
+    # -------------------------------------------------------------------------
+    # Consultas
+    # -------------------------------------------------------------------------
+
+    def segments(self, since: float | None = None, until: float | None = None) -> list[Path]:
+        """Segmentos (activos y comprimidos) que pueden tener eventos en el rango."""
+        if not self.directory.exists():
+            return []
+        selected = []
+        for path in self.directory.iterdir():
+            if not path.name.endswith((ACTIVE_SUFFIX, ARCHIVED_SUFFIX)) or path.name.startswith('.'):
+                continue
+            info = _segment_info(path)
+            if info is None:
+                continue
+            if until is not None and info[0] / 1000 > until:
+                continue
+            try:
+                if since is not None and path.stat().st_mtime < since:
+                    continue
+            except OSError:
+                continue
+            selected.append((info, path))
+        return [path for _, path in sorted(selected)]
+
+    def query(
+        self,
+        payment_id: str | None = None,
+        since: float | None = None,
+        until: float | None = None,
+        event: str | None = None,
+    ) -> Iterator[dict[str, Any]]:
+        """Eventos que cumplen los filtros (timestamps en segundos epoch)."""
+        needle = f'"payment_id": "{payment_id}"'.encode() if payment_id else None
+        for path in self.segments(since, until):
+            opener = gzip.open if path.name.endswith(ARCHIVED_SUFFIX) else open
+            try:
+                with opener(path, 'rb') as f:
+                    for line in f:
+                        # Filtro barato antes de parsear el JSON
+                        if needle is not None and needle not in line:
+                            continue
+                        try:
+                            entry = json.loads(line)
+                        except ValueError:
+                            continue  # línea a medio escribir por otro proceso
+                        if payment_id is not None and str(entry.get('payment_id')) != str(payment_id):
+                            continue
+                        ts = entry.get('ts', 0)
+                        if since is not None and ts < since:
+                            continue
+                        if until is not None and ts > until:
+                            continue
+                        if event is not None and entry.get('event') != event:
+                            continue
+                        yield entry
+            except (OSError, EOFError):
+                logger.warning(f"[JOURNAL] No se pudo leer el segmento {path.name}")
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "directory": str(self.directory),
+            "pending": self.pending(),
+            "written": self.written,
+            "dropped": self.dropped,
+            "segments_archived": self.segments_archived,
+            "active_segment": self._segment.name if self._segment and self._pid == os.getpid() else None,
+        }
+
+
+# =============================================================================
+# JOURNAL DEL PROCESO
+# =============================================================================
+
+_config = get_journal_config()
+_journal = Journal(Path(settings.PAYMENTS_RUNTIME_DIR) / 'journal', **_config)
+
+
+def _flush_task() -> bool:
+    try:
+        _journal.flush()
+    except OSError:
+        logger.exception("[JOURNAL] Error escribiendo eventos")
+    return False
+
+
+_pool = WorkerPool('payment-journal', _flush_task, concurrency=1, poll_interval=_config['flush_interval'])
+
+
+def get_journal() -> Journal:
+    return _journal
+
+
+def record_event(event_type: str, payment_id: Any, details: dict[str, Any] | None = None) -> None:
+    """Agrega un evento al journal (no bloquea: solo encola en memoria)."""
+    if not _config['enabled']:
+        return
+    _pool.start()
+    if _journal.append({'ts': round(time.time(), 3), 'event': event_type,
+                        'payment_id': str(payment_id), **(details or {})}):
+        if _journal.pending() >= _journal.batch_size:
+            _pool.wake()
+
+
+def query_events(
+    payment_id: str | None = None,
+    since: float | None = None,
+    until: float | None = None,
+    event: str | None = None,
+) -> list[dict[str, Any]]:
+    """Eventos del journal (de todos los procesos), en orden de segmento."""
+    _journal.flush()
+    return list(_journal.query(payment_id=payment_id, since=since, until=until, event=event))
+
+
+def journal_stats() -> dict[str, Any]:
+    return {"enabled": _config['enabled'], "writer_running": _pool.running, **_journal.stats()}
+
+
+@atexit.register
+def close_journal() -> None:
+    _pool.stop(timeout=2)
+    try:
+        _journal.close()
+    except OSError:
+        logger.exception("[JOURNAL] Error cerrando el journal")
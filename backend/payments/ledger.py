@@ -0,0 +1,226 @@
+"""
+Ledger local de órdenes - Datos con Alex
+=========================================
+Registra cada compra en la tabla `orders` (modelo Order):
+
+- create_preference: datos del cliente, producto y preference_id
+- pago_exitoso / webhook (processing.py): payment_id y estado de MP
+
+Las escrituras no bloquean el request: se encolan en memoria y un thread
+las aplica en lote con un upsert por external_reference (INSERT ... ON
+CONFLICT DO UPDATE). Varias actualizaciones de la misma orden dentro de
+un lote se combinan en una sola fila.
+
+Mercado Pago sigue siendo la fuente de verdad: si el proceso muere con
+escrituras pendientes, el próximo webhook o validate las repone.
+
+get_terminal_order() permite a validate responder desde la fila local
+cuando el pago ya está en un estado terminal, sin consultar a MP.
+=========================================
+"""
+
+from __future__ import annotations
+
+import atexit
+import logging
+import threading
+from decimal import Decimal, InvalidOperation
+from typing import Any
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from .background import WorkerPool
+from .models import Order
+from .payment_cache import TERMINAL_STATUSES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ORDER_LEDGER: dict[str, Any] = {
+    'enabled': True,
+    'batch_size': 200,
+    'flush_interval': 0.5,   # latencia máxima de una escritura
+    'max_pending': 10000,
+}
+
+# Campos que actualiza cada tipo de escritura cuando la orden ya existe
+PREFERENCE_FIELDS = (
+    'first_name', 'last_name', 'document', 'email', 'course_id', 'course_title',
+    'price', 'preference_id', 'updated_at',
+)
+PAYMENT_FIELDS = ('payment_id', 'status', 'status_detail', 'updated_at')
+
+
+def get_ledger_config() -> dict[str, Any]:
+    config = dict(DEFAULT_ORDER_LEDGER)
+    config.update(getattr(settings, 'ORDER_LEDGER', {}))
+    return config
+
+
+def _decimal(value: Any) -> Decimal:
+    try:
+        return Decimal(str(value or 0)).quantize(Decimal('0.01'))
+    except (InvalidOperation, ValueError):
+        return Decimal('0.00')
+
+
+class _Writer:
+    """Cola de escrituras pendientes, agrupadas por tipo y por orden."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        # {tipo: {external_reference: campos}} (dict: conserva el orden)
+        self._pending: dict[str, dict[str, dict[str, Any]]] = {'preference': {}, 'payment': {}}
+        self.written = 0
+        self.batches = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def __len__(self) -> int:
+        return sum(len(rows) for rows in self._pending.values())
+
+    def add(self, kind: str, external_reference: str, fields: dict[str, Any], max_pending: int) -> bool:
+        with self._lock:
+            rows = self._pending[kind]
+            if external_reference not in rows and len(self) >= max_pending:
+                self.dropped += 1
+                return False
+            rows.setdefault(external_reference, {}).update(fields)
+            return True
+
+    def take(self) -> dict[str, dict[str, dict[str, Any]]]:
+        with self._lock:
+            pending = self._pending
+            self._pending = {'preference': {}, 'payment': {}}
+        return pending
+
+    def flush(self, batch_size: int) -> int:
+        pending = self.take()
+        written = 0
+        # Primero las preferencias: un pago de la misma orden en el mismo
+        # lote actualiza la fila recién creada en vez de crear una incompleta
+        for kind, update_fields in (('preference', PREFERENCE_FIELDS), ('payment', PAYMENT_FIELDS)):
+            rows = [Order(external_reference=ref, **fields) for ref, fields in pending[kind].items()]
+            for start in range(0, len(rows), batch_size):
+                chunk = rows[start:start + batch_size]
+                try:
+                    Order.objects.bulk_create(
+                        chunk,
+                        update_conflicts=True,
+                        unique_fields=['external_reference'],
+                        update_fields=list(update_fields),
+                    )
+                    written += len(chunk)
+                    self.batches += 1
+                except Exception:
+                    self.errors += 1
+                    logger.exception(f"[LEDGER] Error escribiendo {len(chunk)} orden(es) ({kind})")
+        self.written += written
+        return written
+
+
+_config = get_ledger_config()
+_writer = _Writer()
+
+
+def _flush_task() -> bool:
+    if len(_writer):
+        _writer.flush(_config['batch_size'])
+    # Siempre esperar flush_interval: así las escrituras se agrupan
+    return False
+
+
+_pool = WorkerPool('order-ledger', _flush_task, concurrency=1, poll_interval=_config['flush_interval'])
+
+
+def _enqueue(kind: str, external_reference: str, fields: dict[str, Any]) -> None:
+    if not _config['enabled'] or not external_reference:
+        return
+    _pool.start()
+    if not _writer.add(kind, external_reference, fields, _config['max_pending']):
+        logger.warning(f"[LEDGER] Cola llena, se descarta la escritura de la orden {external_reference}")
+    elif len(_writer) >= _config['batch_size']:
+        _pool.wake()
+
+
+# =============================================================================
+# API
+# =============================================================================
+
+def record_preference(
+    external_reference: str,
+    preference_id: str,
+    customer: dict[str, str],
+    course_id: str,
+    course_title: str,
+    price: Any,
+) -> None:
+    """Orden creada en create_preference (estado pending)."""
+    _enqueue('preference', str(external_reference), {
+        'first_name': customer.get('first_name', '')[:100],
+        'last_name': customer.get('last_name', '')[:100],
+        'document': customer.get('document', '')[:20],
+        'email': customer.get('email', ''),
+        'course_id': course_id,
+        'course_title': course_title,
+        'price': _decimal(price),
+        'preference_id': preference_id,
+    })
+
+
+def record_payment(payment_id: str, payment_data: dict[str, Any]) -> None:
+    """Estado de un pago según Mercado Pago (pago_exitoso / webhook)."""
+    metadata = payment_data.get('metadata') or {}
+    external_reference = payment_data.get('external_reference') or f"mp-{payment_id}"
+    _enqueue('payment', str(external_reference), {
+        'payment_id': str(payment_id),
+        'status': str(payment_data.get('status') or 'pending')[:20],
+        'status_detail': str(payment_data.get('status_detail') or '')[:100],
+        # Solo se usan si la orden no existía (preferencia anterior al ledger)
+        'first_name': str(metadata.get('customer_first_name', ''))[:100],
+        'last_name': str(metadata.get('customer_last_name', ''))[:100],
+        'email': str(metadata.get('customer_email', '')),
+        'course_id': str(metadata.get('course_id', '')),
+        'course_title': str(metadata.get('course_title', '')),
+        'price': _decimal(payment_data.get('transaction_amount') or metadata.get('price')),
+    })
+
+
+def get_terminal_order(payment_id: str) -> Order | None:
+    """Orden local del pago si ya está en un estado terminal."""
+    return (
+        Order.objects.filter(payment_id=payment_id, status__in=TERMINAL_STATUSES)
+        .only('id', 'payment_id', 'status', 'status_detail', 'price', 'email', 'course_id')
+        .first()
+    )
+
+
+def flush() -> int:
+    """Escribe ya todo lo pendiente (tests, shutdown, management commands)."""
+    return _writer.flush(_config['batch_size'])
+
+
+def ledger_stats() -> dict[str, Any]:
+    return {
+        "enabled": _config['enabled'],
+        "writer_running": _pool.running,
+        "pending": len(_writer),
+        "written": _writer.written,
+        "batches": _writer.batches,
+        "dropped": _writer.dropped,
+        "errors": _writer.errors,
+    }
+
+
+def stop_writer(timeout: float | None = None) -> None:
+    _pool.stop(timeout)
+
+
+@atexit.register
+def _flush_at_exit() -> None:
+    if len(_writer):
+        try:
+            close_old_connections()
+            flush()
+        except Exception:
+            logger.exception("[LEDGER] Error escribiendo órdenes pendientes al salir")
@@ -0,0 +1,41 @@
+"""
+Arma los bundles zip de los productos con varios archivos.
+
+Uso:
+    python manage.py build_bundles            # solo los que cambiaron
+    python manage.py build_bundles --force    # rearmar todos
+
+Los bundles también se arman al iniciar cada proceso; este comando sirve
+para prepararlos en el deploy o después de reemplazar archivos.
+"""
+
+from django.core.management.base import BaseCommand
+
+from payments.bundles import build_bundle
+from payments.catalog import reload_catalog
+
+
+class Command(BaseCommand):
+    help = "Arma los bundles zip determinísticos de los productos con varios archivos."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help="Rearmar aunque no haya cambios")
+
+    def handle(self, *args, **options):
+        # Metadata fresca de los archivos (pudieron cambiar desde que arrancó el proceso)
+        catalog = reload_catalog()
+        built = 0
+        for product in catalog:
+            if len(product.files) < 2:
+                continue
+            if not product.ready:
+                missing = [f.name for f in product.files if not f.exists]
+                self.stderr.write(self.style.WARNING(f"{product.id}: faltan archivos {missing}"))
+                continue
+            bundle, rebuilt = build_bundle(product, force=options['force'])
+            built += rebuilt
+            state = "armado" if rebuilt else "sin cambios"
+            self.stdout.write(
+                f"{bundle.name}: {state} ({bundle.source_bytes} → {bundle.size} bytes, clave {bundle.key[:16]})"
+            )
+        self.stdout.write(self.style.SUCCESS(f"{built} bundle(s) armados"))
@@ -0,0 +1,53 @@
+"""
+Procesa el outbox de emails desde la línea de comandos.
+
+Uso:
+    python manage.py process_outbox              # worker en primer plano (Ctrl+C para salir)
+    python manage.py process_outbox --once       # drena lo pendiente y termina
+    python manage.py process_outbox --retry PAYMENT_ID   # reencola una entrega fallida
+    python manage.py process_outbox --status     # resumen de entregas por estado
+"""
+
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from payments import outbox
+
+
+class Command(BaseCommand):
+    help = "Procesa el outbox de emails (entregas de productos pendientes)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drena las entregas vencidas y termina")
+        parser.add_argument('--retry', metavar='PAYMENT_ID', help="Reencola una entrega en estado failed")
+        parser.add_argument('--status', action='store_true', help="Muestra el resumen del outbox")
+
+    def handle(self, *args, **options):
+        if options['status']:
+            self.stdout.write(json.dumps(outbox.outbox_stats(), indent=2))
+            return
+
+        if options['retry']:
+            if outbox.retry_delivery(options['retry']):
+                self.stdout.write(self.style.SUCCESS(f"Entrega {options['retry']} reencolada"))
+            else:
+                self.stdout.write(self.style.WARNING(f"No hay entrega fallida para {options['retry']}"))
+            if not options['once']:
+                return
+
+        if options['once']:
+            processed = 0
+            while outbox.process_next_delivery():
+                processed += 1
+            self.stdout.write(self.style.SUCCESS(f"{processed} entrega(s) procesada(s)"))
+            return
+
+        outbox.start_workers()
+        self.stdout.write("Workers del outbox corriendo (Ctrl+C para salir)...")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            outbox.stop_workers(timeout=30)
@@ -0,0 +1,57 @@
+"""
+Consulta el journal local de eventos de pagos.
+
+Uso:
+    python manage.py query_journal --payment-id 123456789
+    python manage.py query_journal --since 2026-01-20T10:00 --until 2026-01-20T12:00
+    python manage.py query_journal --event EMAIL_FAILED --since 2026-01-20
+
+Imprime una línea JSON por evento (de todos los procesos, incluidos los
+segmentos comprimidos).
+"""
+
+import json
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from payments.journal import get_journal
+
+
+def _parse_timestamp(value: str, option: str) -> float:
+    parsed = parse_datetime(value)
+    if parsed is None:
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f"Fecha inválida para --{option}: {value}")
+        parsed = datetime.combine(day, time.min)
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed.timestamp()
+
+
+class Command(BaseCommand):
+    help = "Consulta el journal de eventos de pagos por payment_id y/o rango de tiempo."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--payment-id', help="Solo eventos de este pago (o order_id)")
+        parser.add_argument('--since', help="Desde (ISO 8601)")
+        parser.add_argument('--until', help="Hasta (ISO 8601)")
+        parser.add_argument('--event', help="Solo este tipo de evento (p. ej. EMAIL_FAILED)")
+        parser.add_argument('--limit', type=int, default=0, help="Máximo de eventos a mostrar")
+
+    def handle(self, *args, **options):
+        since = _parse_timestamp(options['since'], 'since') if options['since'] else None
+        until = _parse_timestamp(options['until'], 'until') if options['until'] else None
+
+        shown = 0
+        for entry in get_journal().query(
+            payment_id=options['payment_id'], since=since, until=until, event=options['event'],
+        ):
+            self.stdout.write(json.dumps(entry, ensure_ascii=False))
+            shown += 1
+            if options['limit'] and shown >= options['limit']:
+                break
+        self.stderr.write(f"{shown} evento(s)")
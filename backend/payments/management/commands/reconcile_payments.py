@@ -0,0 +1,121 @@
+"""
+Concilia los pagos aprobados de Mercado Pago con las entregas por email.
+
+Uso:
+    python manage.py reconcile_payments                      # últimos 3 días
+    python manage.py reconcile_payments --since 2026-01-20T00:00 --until 2026-01-21T00:00
+    python manage.py reconcile_payments --dry-run -v 2       # solo contar (y listar los faltantes)
+    python manage.py reconcile_payments --resume             # retomar desde el checkpoint
+    python manage.py reconcile_payments --retry-failed       # reencolar también las entregas fallidas
+
+Los pagos aprobados sin entrega se encolan en el outbox (mismo camino que
+el webhook). Ver payments/reconcile.py.
+"""
+
+import json
+from datetime import timedelta
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from payments import outbox
+from payments.reconcile import ReconcileState, Reconciler, default_checkpoint_path, format_mp_date
+
+
+class Command(BaseCommand):
+    help = "Busca pagos aprobados en Mercado Pago sin entrega por email y los entrega."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="Pagos creados desde (ISO 8601)")
+        parser.add_argument('--until', help="Pagos creados hasta (ISO 8601). Default: ahora")
+        parser.add_argument('--days', type=int, default=3, help="Sin --since: días hacia atrás (default 3)")
+        parser.add_argument('--resume', action='store_true', help="Retomar la conciliación del checkpoint")
+        parser.add_argument('--checkpoint', help="Archivo de checkpoint (default: PAYMENTS_RUNTIME_DIR/reconcile/)")
+        parser.add_argument('--dry-run', action='store_true', help="Solo contar: no encola ni guarda checkpoint")
+        parser.add_argument('--retry-failed', action='store_true', help="Reencolar también las entregas en failed")
+        parser.add_argument('--concurrency', type=int, help="Threads de reentrega")
+        parser.add_argument('--rate', type=float, dest='redelivery_rate', help="Entregas encoladas por segundo")
+        parser.add_argument('--search-rate', type=float, help="Requests por segundo a la búsqueda de MP")
+        parser.add_argument('--page-size', type=int, help="Pagos por página de la búsqueda")
+        parser.add_argument('--max-pages', type=int, help="Cortar después de N páginas (se retoma con --resume)")
+        parser.add_argument('--deliver', action='store_true', help="Enviar los emails encolados en este proceso")
+
+    def _parse_date(self, option, value):
+        parsed = parse_datetime(value)
+        if parsed is None:
+            raise CommandError(f"Fecha inválida para --{option}: {value}")
+        return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+    def _state(self, options, checkpoint):
+        if options['resume']:
+            state = ReconcileState.load(checkpoint)
+            if state is None:
+                raise CommandError(f"No hay checkpoint en {checkpoint}")
+            if state.finished:
+                self.stdout.write(f"La conciliación {state.begin_date} → {state.end_date} ya había terminado")
+            return state
+        until = self._parse_date('until', options['until']) if options['until'] else timezone.now()
+        if options['since']:
+            since = self._parse_date('since', options['since'])
+        else:
+            since = until - timedelta(days=options['days'])
+        if since >= until:
+            raise CommandError("--since debe ser anterior a --until")
+        begin_date, end_date = format_mp_date(since), format_mp_date(until)
+        return ReconcileState(begin_date=begin_date, end_date=end_date, cursor=begin_date)
+
+    def handle(self, *args, **options):
+        checkpoint = Path(options['checkpoint']) if options['checkpoint'] else default_checkpoint_path()
+        state = self._state(options, checkpoint)
+        verbosity = options['verbosity']
+
+        def on_page(state, missing_ids):
+            if verbosity >= 2 and missing_ids:
+                self.stdout.write(f"  sin entrega: {', '.join(missing_ids)}")
+            if verbosity >= 1:
+                self.stdout.write(
+                    f"Página {state.pages}: {state.counts.get('scanned', 0)} revisados, "
+                    f"{state.counts.get('missing', 0)} sin entrega"
+                )
+
+        reconciler = Reconciler(
+            state,
+            checkpoint=checkpoint,
+            dry_run=options['dry_run'],
+            retry_failed=options['retry_failed'],
+            on_page=on_page,
+            concurrency=options['concurrency'],
+            redelivery_rate=options['redelivery_rate'],
+            search_rate=options['search_rate'],
+            page_size=options['page_size'],
+        )
+        try:
+            reconciler.run(max_pages=options['max_pages'])
+        except RuntimeError as e:
+            raise CommandError(f"{e} (retomar con --resume)")
+        finally:
+            # enqueue_delivery arranca workers del outbox en este proceso:
+            # que terminen el envío en curso antes de salir
+            outbox.stop_workers(timeout=30)
+
+        if options['deliver'] and not options['dry_run']:
+            sent = 0
+            while outbox.process_next_delivery():
+                sent += 1
+            self.stdout.write(f"{sent} entrega(s) procesada(s) en este proceso")
+
+        self.stdout.write(json.dumps({
+            'begin_date': state.begin_date,
+            'end_date': state.end_date,
+            'finished': state.finished,
+            'pages': state.pages,
+            **state.counts,
+        }, indent=2))
+        if not state.finished:
+            self.stdout.write(self.style.WARNING("Conciliación incompleta: retomar con --resume"))
+        elif options['dry_run']:
+            self.stdout.write(self.style.SUCCESS("Dry run terminado (no se encoló nada)"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Conciliación terminada"))
@@ -0,0 +1,61 @@
+"""
+Vuelve a procesar notificaciones de Mercado Pago guardadas en el inbox.
+
+Uso:
+    python manage.py replay_webhooks --status failed
+    python manage.py replay_webhooks --since 2026-01-20T10:00 --until 2026-01-20T12:00
+    python manage.py replay_webhooks --payment-id 123456789
+    python manage.py replay_webhooks --status failed --process   # y procesarlas ahora
+
+Reprocesar es seguro: el store de idempotencia evita emails duplicados.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from payments import inbox
+from payments.models import WebhookNotification
+
+
+class Command(BaseCommand):
+    help = "Reencola notificaciones del inbox de webhooks (replay después de una caída)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--status', action='append', help="Estado a reencolar (repetible). Default: failed")
+        parser.add_argument('--since', help="Recibidas desde (ISO 8601)")
+        parser.add_argument('--until', help="Recibidas hasta (ISO 8601)")
+        parser.add_argument('--payment-id', help="Solo notificaciones de este pago")
+        parser.add_argument('--process', action='store_true', help="Procesar el inbox en este proceso al terminar")
+        parser.add_argument('--dry-run', action='store_true', help="Solo mostrar cuántas se reencolarían")
+
+    def handle(self, *args, **options):
+        queryset = WebhookNotification.objects.all()
+        if options['payment_id']:
+            queryset = queryset.filter(payment_id=options['payment_id'])
+        if options['status'] or not options['payment_id']:
+            queryset = queryset.filter(status__in=options['status'] or [WebhookNotification.STATUS_FAILED])
+        for option, lookup in (('since', 'received_at__gte'), ('until', 'received_at__lte')):
+            if options[option]:
+                value = parse_datetime(options[option])
+                if value is None:
+                    raise CommandError(f"Fecha inválida para --{option}: {options[option]}")
+                if timezone.is_naive(value):
+                    value = timezone.make_aware(value)
+                queryset = queryset.filter(**{lookup: value})
+
+        if options['dry_run']:
+            self.stdout.write(f"{queryset.count()} notificación(es) se reencolarían")
+            return
+
+        replayed = inbox.replay_notifications(queryset)
+        self.stdout.write(self.style.SUCCESS(f"{replayed} notificación(es) reencolada(s)"))
+
+        if options['process']:
+            batches = 0
+            while inbox.process_inbox_batch():
+                batches += 1
+            if batches:
+                self.stdout.write(self.style.SUCCESS(f"Inbox procesado ({batches} lote(s))"))
+            else:
+                self.stdout.write("Nada procesado aquí: el consumidor de otro proceso (o de este) ya se encarga")
@@ -0,0 +1,426 @@
+"""
+Métricas estilo Prometheus - Datos con Alex
+============================================
+Registro en memoria de contadores e histogramas, agregado entre los
+gunicorn workers a través de archivos:
+
+- Cada proceso acumula sus valores en memoria (un lock por métrica, sin
+  I/O en el request)
+- Un thread por proceso escribe el snapshot en
+  PAYMENTS_RUNTIME_DIR/metrics/<pid>.json cada `flush_interval` segundos
+  (solo si cambió algo), y al salir
+- /api/payments/metrics/ suma los archivos de todos los procesos y
+  responde en el formato de texto de Prometheus. Los de procesos muertos
+  (workers reciclados) se pliegan en archive.json, así los contadores no
+  bajan cuando gunicorn recicla un worker
+- Después de un fork (gunicorn con preload) el hijo empieza en cero: lo
+  contado por el master queda solo en el archivo del master
+
+Un scrape lee un JSON chico por proceso. Los valores de los otros
+workers pueden tener hasta `flush_interval` segundos de atraso.
+
+Uso:
+    with metrics.stage_timer('mp_payment_get'):
+        ...
+    metrics.APPROVED.inc(source='webhook')
+============================================
+"""
+
+from __future__ import annotations
+
+import atexit
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Iterable
+
+from django.conf import settings
+
+from . import timing
+from .background import exclusive_process_lock
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PAYMENTS_METRICS: dict[str, Any] = {
+    'enabled': True,
+    'flush_interval': 5.0,
+    # Acceso al endpoint: bearer token y/o IPs o redes (CIDR) permitidas.
+    # Sin ninguno de los dos solo responde con DEBUG
+    'token': '',
+    'allowed_ips': (),
+}
+
+# Segundos: de un hit de caché (ms) a una llamada a MP con reintentos
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0)
+
+# Etapas de payments_stage_duration_seconds
+STAGES = ('request_parse', 'mp_preference_create', 'mp_payment_get', 'attachment_load', 'brevo_send')
+
+ARCHIVE_FILE = 'archive.json'
+
+
+def get_metrics_config() -> dict[str, Any]:
+    config = dict(DEFAULT_PAYMENTS_METRICS)
+    config.update(getattr(settings, 'PAYMENTS_METRICS', {}))
+    return config
+
+
+def metrics_dir() -> Path:
+    return Path(settings.PAYMENTS_RUNTIME_DIR) / 'metrics'
+
+
+def _label_key(labelnames: tuple[str, ...], labels: dict[str, Any]) -> str:
+    """`a="x",b="y"`: clave de la serie en el snapshot y en la salida."""
+    parts = []
+    for name in labelnames:
+        value = str(labels.get(name, '')).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+        parts.append(f'{name}="{value}"')
+    return ','.join(parts)
+
+
+# =============================================================================
+# MÉTRICAS
+# =============================================================================
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Iterable[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values: dict[str, Any] = {}
+        _registry.append(self)
+
+    def reset(self) -> None:
+        # Lock nuevo: el heredado del padre puede haber quedado tomado
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def snapshot(self) -> dict[str, Any]:
+        with self._lock:
+            return {key: list(value) if isinstance(value, list) else value for key, value in self._values.items()}
+
+
+class Counter(_Metric):
+    """Contador monótono (por combinación de labels)."""
+
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        if not _state.enabled:
+            return
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+        _state.touch()
+
+
+class Histogram(_Metric):
+    """Histograma de buckets fijos: [conteo por bucket..., +Inf, suma]."""
+
+    kind = 'histogram'
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Iterable[str] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any) -> None:
+        if not _state.enabled:
+            return
+        key = _label_key(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+        _state.touch()
+
+    def time(self, **labels: Any) -> '_Timer':
+        """Context manager que observa la duración del bloque (con o sin error)."""
+        return _Timer(self, labels)
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: dict[str, Any]) -> None:
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self) -> '_Timer':
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        duration = time.perf_counter() - self.started
+        self.histogram.observe(duration, **self.labels)
+        if 'stage' in self.labels:
+            # Desglose del request en curso (Server-Timing, payments/timing.py)
+            timing.record(self.labels['stage'], duration)
+
+
+# =============================================================================
+# ESCRITURA DEL SNAPSHOT DEL PROCESO
+# =============================================================================
+
+class _State:
+    """Estado por proceso: si hay cambios sin escribir y el thread que los escribe."""
+
+    def __init__(self) -> None:
+        config = get_metrics_config()
+        self.enabled = bool(config['enabled'])
+        self.flush_interval = float(config['flush_interval'])
+        self.dirty = False
+        self.pid: int | None = None
+        self.lock = threading.Lock()
+
+    def touch(self) -> None:
+        self.dirty = True
+        if self.pid != os.getpid():
+            self.start_flusher()
+
+    def start_flusher(self) -> None:
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+            self.pid = os.getpid()
+            threading.Thread(target=self._run, name='metrics-flush', daemon=True).start()
+
+    def _run(self) -> None:
+        pid = os.getpid()
+        while self.pid == pid:
+            time.sleep(self.flush_interval)
+            try:
+                flush()
+            except Exception:
+                logger.exception("[METRICS] Error escribiendo el snapshot de métricas")
+
+
+_registry: list[_Metric] = []
+_state = _State()
+
+
+def _snapshot() -> dict[str, Any]:
+    return {metric.name: metric.snapshot() for metric in _registry}
+
+
+def _write_json(path: Path, data: dict[str, Any]) -> None:
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(data, separators=(',', ':')))
+    os.replace(tmp, path)
+
+
+def flush() -> None:
+    """Escribe el snapshot de este proceso si cambió desde la última vez."""
+    if not _state.enabled or not _state.dirty:
+        return
+    _state.dirty = False
+    directory = metrics_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    _write_json(directory / f"{os.getpid()}.json", _snapshot())
+
+
+def _after_fork_in_child() -> None:
+    for metric in _registry:
+        metric.reset()
+    _state.lock = threading.Lock()
+    _state.dirty = False
+    _state.pid = None
+
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+atexit.register(flush)
+
+
+# =============================================================================
+# AGREGACIÓN ENTRE PROCESOS
+# =============================================================================
+
+def _read_json(path: Path) -> dict[str, Any] | None:
+    try:
+        return json.loads(path.read_text())
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def _merge(total: dict[str, Any], snapshot: dict[str, Any]) -> None:
+    for name, series in snapshot.items():
+        target = total.setdefault(name, {})
+        for key, value in series.items():
+            current = target.get(key)
+            if current is None:
+                target[key] = list(value) if isinstance(value, list) else value
+            elif isinstance(value, list):
+                if len(current) == len(value):   # buckets distintos: archivo de otra versión
+                    target[key] = [a + b for a, b in zip(current, value)]
+            else:
+                target[key] = current + value
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _process_files(directory: Path) -> dict[int, Path]:
+    return {int(path.stem): path for path in directory.glob('*.json') if path.stem.isdigit()}
+
+
+def _fold_dead_processes(directory: Path) -> None:
+    """
+    Suma los snapshots de procesos muertos a archive.json y los borra.
+
+    El archivo se anota en `folded` antes de borrarse: un scrape que lo vea
+    todavía no lo cuenta dos veces.
+    """
+    files = _process_files(directory)
+    dead = {pid: path for pid, path in files.items() if pid != os.getpid() and not _pid_alive(pid)}
+    archive = _read_json(directory / ARCHIVE_FILE) or {'metrics': {}, 'folded': []}
+    folded = [pid for pid in archive['folded'] if pid in files]
+    pending = {pid: path for pid, path in dead.items() if pid not in folded}
+    if not pending and len(folded) == len(archive['folded']):
+        return
+    for pid, path in pending.items():
+        snapshot = _read_json(path)
+        if snapshot is not None:
+            _merge(archive['metrics'], snapshot)
+        folded.append(pid)
+    archive['folded'] = folded
+    _write_json(directory / ARCHIVE_FILE, archive)
+    for path in pending.values():
+        path.unlink(missing_ok=True)
+
+
+def collect() -> tuple[dict[str, Any], int]:
+    """(valores sumados de todos los procesos, cantidad de procesos leídos)."""
+    _state.dirty = True
+    flush()
+    directory = metrics_dir()
+    with exclusive_process_lock('metrics') as acquired:
+        if acquired:
+            _fold_dead_processes(directory)
+    files = _process_files(directory)
+    archive = _read_json(directory / ARCHIVE_FILE) or {'metrics': {}, 'folded': []}
+    folded = set(archive['folded'])
+    total: dict[str, Any] = {}
+    _merge(total, archive['metrics'])
+    processes = 0
+    for pid, path in sorted(files.items()):
+        if pid in folded:
+            continue
+        snapshot = _read_json(path)
+        if snapshot is not None:
+            _merge(total, snapshot)
+            processes += 1
+    return total, processes
+
+
+def reset_storage() -> None:
+    """Borra los snapshots de otros procesos (master de gunicorn al arrancar)."""
+    directory = metrics_dir()
+    if not directory.exists():
+        return
+    for path in directory.glob('*.json'):
+        if path.stem != str(os.getpid()):
+            path.unlink(missing_ok=True)
+    _state.dirty = True
+
+
+# =============================================================================
+# FORMATO DE TEXTO DE PROMETHEUS
+# =============================================================================
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _series(name: str, key: str, extra: str = '') -> str:
+    labels = ','.join(part for part in (key, extra) if part)
+    return f"{name}{{{labels}}}" if labels else name
+
+
+def render() -> str:
+    total, processes = collect()
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for key, value in sorted(total.get(metric.name, {}).items()):
+            if metric.kind == 'counter':
+                lines.append(f"{_series(metric.name, key)} {_format_value(value)}")
+                continue
+            if len(value) != len(metric.buckets) + 2:
+                continue
+            cumulative = 0
+            bounds = [*(str(bound) for bound in metric.buckets), '+Inf']
+            for bound, count in zip(bounds, value):
+                cumulative += count
+                le = f'le="{bound}"'
+                lines.append(f"{_series(metric.name + '_bucket', key, le)} {cumulative}")
+            lines.append(f"{_series(metric.name + '_sum', key)} {_format_value(value[-1])}")
+            lines.append(f"{_series(metric.name + '_count', key)} {cumulative}")
+    lines.append("# HELP payments_metrics_processes Procesos con snapshot vigente en este scrape")
+    lines.append("# TYPE payments_metrics_processes gauge")
+    lines.append(f"payments_metrics_processes {processes}")
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_enabled() -> bool:
+    return _state.enabled
+
+
+# =============================================================================
+# MÉTRICAS DEL FLUJO DE PAGOS
+# =============================================================================
+
+STAGE_SECONDS = Histogram(
+    'payments_stage_duration_seconds', "Duración de cada etapa del flujo de pagos", ('stage',),
+)
+REQUEST_SECONDS = Histogram(
+    'payments_request_duration_seconds', "Duración total de los requests a /api/payments/", ('view', 'status'),
+)
+APPROVED = Counter(
+    'payments_approved_total', "Pagos aprobados con la entrega encolada", ('source',),
+)
+DUPLICATES_SKIPPED = Counter(
+    'payments_duplicates_skipped_total', "Pagos o notificaciones repetidas que no se reprocesaron", ('source',),
+)
+EMAILS_SENT = Counter(
+    'payments_emails_sent_total', "Emails de entrega enviados",
+)
+EMAIL_FAILURES = Counter(
+    'payments_email_failures_total', "Envíos de email fallidos (retry: se reintenta; dead_letter: no)", ('outcome',),
+)
+CACHE_HITS = Counter(
+    'payments_cache_hits_total', "Hits por caché", ('cache',),
+)
+CACHE_MISSES = Counter(
+    'payments_cache_misses_total', "Misses por caché", ('cache',),
+)
+
+
+def stage_timer(stage: str) -> _Timer:
+    """Mide una etapa de STAGES en payments_stage_duration_seconds."""
+    return STAGE_SECONDS.time(stage=stage)
+
+
+def metrics_stats() -> dict[str, Any]:
+    return {
+        "enabled": _state.enabled,
+        "directory": str(metrics_dir()),
+        "flush_interval": _state.flush_interval,
+        "flusher_running": _state.pid == os.getpid(),
+    }
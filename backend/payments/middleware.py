@@ -0,0 +1,107 @@
+"""
+Middleware del módulo de pagos - Datos con Alex
+================================================
+- RequestMetricsMiddleware: duración total de cada request a las rutas de
+  payments (payments_request_duration_seconds, por vista y clase de status)
+- ServerTimingMiddleware: header Server-Timing con el desglose por etapa
+  y evento `slow_request` para los requests lentos (payments/timing.py)
+
+Los dos funcionan igual con las vistas sync (WSGI) y async (ASGI).
+================================================
+"""
+
+from __future__ import annotations
+
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+
+from . import metrics, timing
+from .tracing import get_tracer
+
+timing_trace = get_tracer('timing')
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        started = time.perf_counter()
+        response = self.get_response(request)
+        _observe(request, response, started)
+        return response
+
+    async def __acall__(self, request):
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        _observe(request, response, started)
+        return response
+
+
+def _observe(request, response, started: float) -> None:
+    match = getattr(request, 'resolver_match', None)
+    if match is None or match.app_name != 'payments':
+        return
+    metrics.REQUEST_SECONDS.observe(
+        time.perf_counter() - started, view=match.url_name, status=f"{response.status_code // 100}xx",
+    )
+
+
+class ServerTimingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response) -> None:
+        self.get_response = get_response
+        self.config = timing.get_server_timing_config()
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.config['enabled']:
+            return self.get_response(request)
+        request_timing, token = timing.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            timing.finish(token)
+        self._annotate(request, response, request_timing)
+        return response
+
+    async def __acall__(self, request):
+        if not self.config['enabled']:
+            return await self.get_response(request)
+        request_timing, token = timing.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            timing.finish(token)
+        self._annotate(request, response, request_timing)
+        return response
+
+    def _annotate(self, request, response, request_timing: timing.RequestTiming) -> None:
+        # La vista recién se conoce después de resolver la URL
+        match = getattr(request, 'resolver_match', None)
+        if match is None or match.app_name != 'payments' or match.url_name not in self.config['views']:
+            return
+        total = request_timing.elapsed()
+        response['Server-Timing'] = request_timing.header(total)
+        if self.config['timing_allow_origin']:
+            response['Timing-Allow-Origin'] = self.config['timing_allow_origin']
+        duration_ms = round(total * 1000, 1)
+        if duration_ms >= self.config['slow_request_ms']:
+            timing_trace.warning(
+                'slow_request', view=match.url_name, method=request.method, status=response.status_code,
+                duration_ms=duration_ms, spans=request_timing.summary_ms(),
+                payment_id=request.GET.get('payment_id') or request.GET.get('data.id') or None,
+            )
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:10
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmailDelivery',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payment_id', models.CharField(max_length=100, unique=True, verbose_name='ID de pago MP')),
+                ('email', models.EmailField(max_length=254, verbose_name='Email')),
+                ('first_name', models.CharField(max_length=100, verbose_name='Nombre')),
+                ('course_id', models.CharField(max_length=100, verbose_name='ID del curso')),
+                ('course_title', models.CharField(max_length=255, verbose_name='Título del curso')),
+                ('status', models.CharField(choices=[('queued', 'En cola'), ('sending', 'Enviando'), ('sent', 'Enviado'), ('failed', 'Fallido')], default='queued', max_length=20, verbose_name='Estado')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Intentos')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Próximo intento')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Último error')),
+                ('source', models.CharField(blank=True, default='', max_length=20, verbose_name='Origen (validate/webhook)')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Fecha de actualización')),
+                ('sent_at', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de envío')),
+            ],
+            options={
+                'verbose_name': 'Entrega por email',
+                'verbose_name_plural': 'Entregas por email',
+                'db_table': 'email_deliveries',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='email_deliv_status_due_idx')],
+            },
+        ),
+    ]
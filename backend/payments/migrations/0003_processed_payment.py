@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:12
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0002_email_delivery'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessedPayment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payment_id', models.CharField(max_length=100, unique=True, verbose_name='ID de pago MP')),
+                ('source', models.CharField(blank=True, default='', max_length=20, verbose_name='Origen (validate/webhook)')),
+                ('claimed_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Fecha de reclamo')),
+                ('expires_at', models.DateTimeField(db_index=True, verbose_name='Vencimiento')),
+            ],
+            options={
+                'verbose_name': 'Pago procesado',
+                'verbose_name_plural': 'Pagos procesados',
+                'db_table': 'processed_payments',
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:15
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0003_processed_payment'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WebhookNotification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('raw_body', models.TextField(blank=True, default='', verbose_name='Body crudo')),
+                ('query_string', models.TextField(blank=True, default='', verbose_name='Query string')),
+                ('headers', models.JSONField(blank=True, default=dict, verbose_name='Headers relevantes')),
+                ('notification_id', models.CharField(blank=True, db_index=True, default='', max_length=100, verbose_name='ID de notificación MP')),
+                ('notification_type', models.CharField(blank=True, default='', max_length=50, verbose_name='Tipo')),
+                ('payment_id', models.CharField(blank=True, db_index=True, default='', max_length=100, verbose_name='ID de pago MP')),
+                ('status', models.CharField(choices=[('received', 'Recibida'), ('processing', 'Procesando'), ('processed', 'Procesada'), ('ignored', 'Ignorada'), ('duplicate', 'Duplicada'), ('failed', 'Fallida')], default='received', max_length=20, verbose_name='Estado')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='Intentos')),
+                ('next_attempt_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Próximo intento')),
+                ('outcome', models.CharField(blank=True, default='', max_length=30, verbose_name='Resultado')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Último error')),
+                ('received_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Fecha de recepción')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Fecha de actualización')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de procesamiento')),
+            ],
+            options={
+                'verbose_name': 'Notificación de webhook',
+                'verbose_name_plural': 'Notificaciones de webhook',
+                'db_table': 'webhook_notifications',
+                'ordering': ['id'],
+                'indexes': [models.Index(fields=['status', 'next_attempt_at'], name='webhook_notif_status_due_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('payments', '0004_webhook_notification'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='external_reference',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='Referencia externa (MP)'),
+        ),
+        migrations.AddField(
+            model_name='order',
+            name='status_detail',
+            field=models.CharField(blank=True, default='', max_length=100, verbose_name='Detalle del estado MP'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['payment_id'], name='orders_payment_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['preference_id'], name='orders_preference_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['email'], name='orders_email_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status'], name='orders_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at'], name='orders_created_at_idx'),
+        ),
+    ]
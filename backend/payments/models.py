@@ -2,10 +2,13 @@
 Modelos para el sistema de pagos de ALEXCEL.
 
 Este módulo define el modelo Order para registrar todas las compras
-de cursos, vinculadas con los pagos de Mercado Pago.
+de cursos, vinculadas con los pagos de Mercado Pago, el outbox
+EmailDelivery con el estado de cada entrega por email, el registro
+de idempotencia ProcessedPayment y el inbox WebhookNotification.
 """
 
 from django.db import models
+from django.utils import timezone
 
 
 class Order(models.Model):
@@ -13,7 +16,8 @@ class Order(models.Model):
     Modelo que representa una orden de compra de un curso.
     
     Se crea cuando el usuario inicia el proceso de pago y se actualiza
-    cuando Mercado Pago confirma el estado del pago.
+    cuando Mercado Pago confirma el estado del pago. Las escrituras son
+    upserts en lote por external_reference (ver payments/ledger.py).
     """
     
     # Información del cliente
@@ -49,6 +53,13 @@ class Order(models.Model):
     )
     
     # Información de Mercado Pago
+    external_reference = models.CharField(
+        max_length=64,
+        unique=True,
+        null=True,
+        blank=True,
+        verbose_name="Referencia externa (MP)"
+    )
     payment_id = models.CharField(
         max_length=100,
         null=True,
@@ -77,6 +88,12 @@ class Order(models.Model):
         default='pending',
         verbose_name="Estado"
     )
+    status_detail = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        verbose_name="Detalle del estado MP"
+    )
     
     # Timestamps
     created_at = models.DateTimeField(
@@ -93,6 +110,265 @@ class Order(models.Model):
         verbose_name = 'Orden'
         verbose_name_plural = 'Órdenes'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['payment_id'], name='orders_payment_id_idx'),
+            models.Index(fields=['preference_id'], name='orders_preference_id_idx'),
+            models.Index(fields=['email'], name='orders_email_idx'),
+            models.Index(fields=['status'], name='orders_status_idx'),
+            models.Index(fields=['created_at'], name='orders_created_at_idx'),
+        ]
     
     def __str__(self):
         return f"Order #{self.id} - {self.first_name} {self.last_name} - {self.status}"
+
+
+class EmailDelivery(models.Model):
+    """
+    Outbox de entregas por email (una fila por pago aprobado).
+
+    Las vistas encolan la entrega y responden al instante; los workers
+    en segundo plano (payments/outbox.py) envían el email con reintentos.
+    """
+
+    STATUS_QUEUED = 'queued'
+    STATUS_SENDING = 'sending'
+    STATUS_SENT = 'sent'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'En cola'),
+        (STATUS_SENDING, 'Enviando'),
+        (STATUS_SENT, 'Enviado'),
+        (STATUS_FAILED, 'Fallido'),
+    ]
+
+    payment_id = models.CharField(
+        max_length=100,
+        unique=True,
+        verbose_name="ID de pago MP"
+    )
+
+    # Datos necesarios para armar el email
+    email = models.EmailField(
+        verbose_name="Email"
+    )
+    first_name = models.CharField(
+        max_length=100,
+        verbose_name="Nombre"
+    )
+    course_id = models.CharField(
+        max_length=100,
+        verbose_name="ID del curso"
+    )
+    course_title = models.CharField(
+        max_length=255,
+        verbose_name="Título del curso"
+    )
+
+    # Estado de la entrega
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_QUEUED,
+        verbose_name="Estado"
+    )
+    attempts = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Intentos"
+    )
+    next_attempt_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name="Próximo intento"
+    )
+    last_error = models.TextField(
+        blank=True,
+        default='',
+        verbose_name="Último error"
+    )
+    source = models.CharField(
+        max_length=20,
+        blank=True,
+        default='',
+        verbose_name="Origen (validate/webhook)"
+    )
+
+    # Timestamps
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name="Fecha de creación"
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Fecha de actualización"
+    )
+    sent_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Fecha de envío"
+    )
+
+    class Meta:
+        db_table = 'email_deliveries'
+        verbose_name = 'Entrega por email'
+        verbose_name_plural = 'Entregas por email'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='email_deliv_status_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"Delivery {self.payment_id} → {self.email} - {self.status}"
+
+
+class ProcessedPayment(models.Model):
+    """
+    Registro de idempotencia: un payment_id "reclamado" ya fue procesado.
+
+    Compartido entre gunicorn workers y persistente entre redeploys
+    (ver payments/idempotency.py). Las filas vencidas se purgan.
+    """
+
+    payment_id = models.CharField(
+        max_length=100,
+        unique=True,
+        verbose_name="ID de pago MP"
+    )
+    source = models.CharField(
+        max_length=20,
+        blank=True,
+        default='',
+        verbose_name="Origen (validate/webhook)"
+    )
+    claimed_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name="Fecha de reclamo"
+    )
+    expires_at = models.DateTimeField(
+        db_index=True,
+        verbose_name="Vencimiento"
+    )
+
+    class Meta:
+        db_table = 'processed_payments'
+        verbose_name = 'Pago procesado'
+        verbose_name_plural = 'Pagos procesados'
+
+    def __str__(self):
+        return f"Processed {self.payment_id} ({self.source})"
+
+
+class WebhookNotification(models.Model):
+    """
+    Inbox de notificaciones de Mercado Pago.
+
+    El webhook guarda la notificación cruda y responde 200 al instante;
+    el consumidor en segundo plano (payments/inbox.py) la procesa en orden.
+    """
+
+    STATUS_RECEIVED = 'received'
+    STATUS_PROCESSING = 'processing'
+    STATUS_PROCESSED = 'processed'
+    STATUS_IGNORED = 'ignored'
+    STATUS_DUPLICATE = 'duplicate'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_RECEIVED, 'Recibida'),
+        (STATUS_PROCESSING, 'Procesando'),
+        (STATUS_PROCESSED, 'Procesada'),
+        (STATUS_IGNORED, 'Ignorada'),
+        (STATUS_DUPLICATE, 'Duplicada'),
+        (STATUS_FAILED, 'Fallida'),
+    ]
+
+    # Notificación cruda (tal cual llegó)
+    raw_body = models.TextField(
+        blank=True,
+        default='',
+        verbose_name="Body crudo"
+    )
+    query_string = models.TextField(
+        blank=True,
+        default='',
+        verbose_name="Query string"
+    )
+    headers = models.JSONField(
+        default=dict,
+        blank=True,
+        verbose_name="Headers relevantes"
+    )
+
+    # Datos extraídos al procesar
+    notification_id = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        db_index=True,
+        verbose_name="ID de notificación MP"
+    )
+    notification_type = models.CharField(
+        max_length=50,
+        blank=True,
+        default='',
+        verbose_name="Tipo"
+    )
+    payment_id = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        db_index=True,
+        verbose_name="ID de pago MP"
+    )
+
+    # Estado del procesamiento
+    status = models.CharField(
+        max_length=20,
+        choices=STATUS_CHOICES,
+        default=STATUS_RECEIVED,
+        verbose_name="Estado"
+    )
+    attempts = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Intentos"
+    )
+    next_attempt_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name="Próximo intento"
+    )
+    outcome = models.CharField(
+        max_length=30,
+        blank=True,
+        default='',
+        verbose_name="Resultado"
+    )
+    last_error = models.TextField(
+        blank=True,
+        default='',
+        verbose_name="Último error"
+    )
+
+    # Timestamps
+    received_at = models.DateTimeField(
+        auto_now_add=True,
+        db_index=True,
+        verbose_name="Fecha de recepción"
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name="Fecha de actualización"
+    )
+    processed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name="Fecha de procesamiento"
+    )
+
+    class Meta:
+        db_table = 'webhook_notifications'
+        verbose_name = 'Notificación de webhook'
+        verbose_name_plural = 'Notificaciones de webhook'
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='webhook_notif_status_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"Webhook #{self.id} - payment {self.payment_id or '?'} - {self.status}"
@@ -0,0 +1,297 @@
+"""
+Outbox de emails - Datos con Alex
+==================================
+Entrega asíncrona y persistente de los productos por email.
+
+FLUJO:
+1. pago_exitoso / webhook encolan una EmailDelivery (status=queued) y responden
+2. Los workers en segundo plano toman la fila (status=sending) y llaman
+   a send_product_email. Las entregas pendientes del mismo producto se
+   juntan y salen en un solo request a Brevo (send_product_emails), sin
+   que ninguna espere más de batch_window segundos
+3. Éxito → sent. Error → se reprograma con backoff exponencial + jitter.
+   Al superar max_attempts queda en failed (dead-letter) para soporte.
+
+La toma de filas es un UPDATE condicional (status=queued → sending), así
+que es atómica aunque varios procesos compartan la base SQLite.
+==================================
+"""
+
+from __future__ import annotations
+
+import logging
+import random
+import time
+from datetime import timedelta
+from types import SimpleNamespace
+from typing import Any
+
+from django.conf import settings
+from django.db import IntegrityError
+from django.db.models import Count, F
+from django.utils import timezone
+
+from . import metrics, resilience
+from .background import WorkerPool
+from .journal import record_event
+from .models import EmailDelivery
+from .services import email_batch_stats, send_product_email, send_product_emails
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_OUTBOX: dict[str, Any] = {
+    'workers': 2,
+    'max_attempts': 5,
+    'backoff_base': 30,      # segundos antes del 2° intento
+    'backoff_max': 3600,     # tope del backoff
+    'poll_interval': 5,      # segundos entre chequeos si la cola está vacía
+    'lease_seconds': 300,    # una fila en 'sending' más vieja que esto se reencola
+    'batch_size': 50,        # entregas del mismo producto por request a Brevo (1 = sin lotes)
+    'batch_window': 0.5,     # espera máxima (s) de una entrega para juntar un lote
+}
+
+# Cada cuánto se buscan más entregas del mismo producto mientras se arma un lote
+BATCH_POLL_INTERVAL = 0.1
+
+
+def get_outbox_config() -> dict[str, Any]:
+    config = dict(DEFAULT_OUTBOX)
+    config.update(getattr(settings, 'EMAIL_OUTBOX', {}))
+    return config
+
+
+# =============================================================================
+# ENCOLADO
+# =============================================================================
+
+def enqueue_delivery(payment_id: str, order: Any, source: str = '') -> tuple[EmailDelivery, bool]:
+    """
+    Encola la entrega de un pago aprobado.
+
+    Idempotente por payment_id: si ya existe una entrega se devuelve la
+    existente. Retorna (delivery, created).
+    """
+    defaults = {
+        'email': order.email,
+        'first_name': order.first_name,
+        'course_id': order.course_id,
+        'course_title': order.course_title,
+        'source': source,
+    }
+    try:
+        delivery, created = EmailDelivery.objects.get_or_create(payment_id=payment_id, defaults=defaults)
+    except IntegrityError:
+        # Otro proceso la creó entre el SELECT y el INSERT
+        delivery, created = EmailDelivery.objects.get(payment_id=payment_id), False
+
+    if created:
+        logger.info(f"[OUTBOX] Entrega encolada: payment={payment_id} → {order.email} ({source})")
+        start_workers()
+        _workers.wake()
+    return delivery, created
+
+
+def get_delivery(payment_id: str) -> EmailDelivery | None:
+    return EmailDelivery.objects.filter(payment_id=payment_id).first()
+
+
+def retry_delivery(payment_id: str) -> bool:
+    """Reencola una entrega fallida (uso de soporte). Retorna True si se reencoló."""
+    updated = EmailDelivery.objects.filter(
+        payment_id=payment_id, status=EmailDelivery.STATUS_FAILED,
+    ).update(status=EmailDelivery.STATUS_QUEUED, attempts=0, next_attempt_at=timezone.now(), updated_at=timezone.now())
+    if updated:
+        _workers.wake()
+    return bool(updated)
+
+
+# =============================================================================
+# PROCESAMIENTO
+# =============================================================================
+
+def _backoff_seconds(attempts: int, config: dict[str, Any]) -> float:
+    """Backoff exponencial con jitter ("equal jitter")."""
+    delay = min(config['backoff_max'], config['backoff_base'] * (2 ** max(attempts - 1, 0)))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def _release_expired_leases(config: dict[str, Any]) -> None:
+    """Reencola entregas que quedaron en 'sending' (worker caído a mitad de envío)."""
+    cutoff = timezone.now() - timedelta(seconds=config['lease_seconds'])
+    released = EmailDelivery.objects.filter(
+        status=EmailDelivery.STATUS_SENDING, updated_at__lt=cutoff,
+    ).update(status=EmailDelivery.STATUS_QUEUED, updated_at=timezone.now())
+    if released:
+        logger.warning(f"[OUTBOX] {released} entrega(s) con lease vencido reencoladas")
+
+
+def claim_next_delivery() -> EmailDelivery | None:
+    """Toma atómicamente la próxima entrega pendiente (queued → sending)."""
+    now = timezone.now()
+    candidates = EmailDelivery.objects.filter(
+        status=EmailDelivery.STATUS_QUEUED, next_attempt_at__lte=now,
+    ).order_by('next_attempt_at', 'id').values_list('id', flat=True)[:5]
+
+    for delivery_id in candidates:
+        claimed = EmailDelivery.objects.filter(
+            id=delivery_id, status=EmailDelivery.STATUS_QUEUED,
+        ).update(status=EmailDelivery.STATUS_SENDING, attempts=F('attempts') + 1, updated_at=now)
+        if claimed:
+            return EmailDelivery.objects.get(id=delivery_id)
+    return None
+
+
+def claim_companions(first: EmailDelivery, config: dict[str, Any]) -> list[EmailDelivery]:
+    """
+    Toma más entregas pendientes del mismo producto que `first` para
+    enviarlas en el mismo request, hasta batch_size. Sigue buscando hasta
+    batch_window segundos desde que `first` quedó lista para enviarse: una
+    venta suelta no espera más que eso, y una entrega que ya esperó en la
+    cola sale sin demora.
+    """
+    limit = config['batch_size'] - 1
+    if limit <= 0:
+        return []
+    deadline = max(first.created_at, first.next_attempt_at) + timedelta(seconds=config['batch_window'])
+    claimed: list[int] = []
+    while True:
+        now = timezone.now()
+        candidates = EmailDelivery.objects.filter(
+            status=EmailDelivery.STATUS_QUEUED, next_attempt_at__lte=now, course_id=first.course_id,
+        ).order_by('next_attempt_at', 'id').values_list('id', flat=True)[:limit - len(claimed)]
+        for delivery_id in candidates:
+            if EmailDelivery.objects.filter(
+                id=delivery_id, status=EmailDelivery.STATUS_QUEUED,
+            ).update(status=EmailDelivery.STATUS_SENDING, attempts=F('attempts') + 1, updated_at=now):
+                claimed.append(delivery_id)
+        if len(claimed) >= limit or now >= deadline:
+            break
+        time.sleep(min(BATCH_POLL_INTERVAL, (deadline - now).total_seconds()))
+    return list(EmailDelivery.objects.filter(id__in=claimed).order_by('id'))
+
+
+def _order_for(delivery: EmailDelivery) -> SimpleNamespace:
+    return SimpleNamespace(
+        id=delivery.payment_id,
+        email=delivery.email,
+        first_name=delivery.first_name,
+        course_id=delivery.course_id,
+        course_title=delivery.course_title,
+    )
+
+
+def deliver(delivery: EmailDelivery) -> bool:
+    """Envía una entrega ya tomada y registra el resultado."""
+    error = ''
+    try:
+        sent = send_product_email(_order_for(delivery))
+        if not sent:
+            error = 'send_product_email retornó False (ver logs de services)'
+    except Exception as e:
+        logger.exception(f"[OUTBOX] Excepción enviando payment={delivery.payment_id}")
+        sent, error = False, f"{type(e).__name__}: {e}"
+    return _record_result(delivery, sent, error, get_outbox_config())
+
+
+def deliver_batch(deliveries: list[EmailDelivery]) -> int:
+    """Envía varias entregas ya tomadas en lote. Retorna cuántas se entregaron."""
+    error = 'send_product_emails: no enviado (ver logs de services)'
+    try:
+        results = send_product_emails([_order_for(delivery) for delivery in deliveries])
+    except Exception as e:
+        logger.exception(f"[OUTBOX] Excepción enviando un lote de {len(deliveries)} entrega(s)")
+        results, error = {}, f"{type(e).__name__}: {e}"
+    logger.info(f"[OUTBOX] Lote de {len(deliveries)} entrega(s) de {deliveries[0].course_id}")
+
+    config = get_outbox_config()
+    delivered = 0
+    for delivery in deliveries:
+        sent = results.get(delivery.payment_id, False)
+        delivered += _record_result(delivery, sent, '' if sent else error, config)
+    return delivered
+
+
+def _record_result(delivery: EmailDelivery, sent: bool, error: str, config: dict[str, Any]) -> bool:
+    now = timezone.now()
+    if sent:
+        EmailDelivery.objects.filter(id=delivery.id).update(
+            status=EmailDelivery.STATUS_SENT, sent_at=now, last_error='', updated_at=now,
+        )
+        logger.info(f"[OUTBOX] ✅ Entregado payment={delivery.payment_id} → {delivery.email} (intento {delivery.attempts})")
+        record_event("EMAIL_SENT", delivery.payment_id, {"attempt": delivery.attempts, "course_id": delivery.course_id})
+        metrics.EMAILS_SENT.inc()
+        return True
+
+    if delivery.attempts >= config['max_attempts']:
+        EmailDelivery.objects.filter(id=delivery.id).update(
+            status=EmailDelivery.STATUS_FAILED, last_error=error, updated_at=now,
+        )
+        logger.critical(
+            f"[OUTBOX] ❌ DEAD-LETTER payment={delivery.payment_id} → {delivery.email} "
+            f"tras {delivery.attempts} intentos: {error}"
+        )
+        record_event("EMAIL_FAILED", delivery.payment_id, {"attempt": delivery.attempts, "error": error})
+        metrics.EMAIL_FAILURES.inc(outcome='dead_letter')
+        return False
+
+    delay = _backoff_seconds(delivery.attempts, config)
+    EmailDelivery.objects.filter(id=delivery.id).update(
+        status=EmailDelivery.STATUS_QUEUED,
+        last_error=error,
+        next_attempt_at=now + timedelta(seconds=delay),
+        updated_at=now,
+    )
+    logger.warning(
+        f"[OUTBOX] Reintento programado payment={delivery.payment_id} en {delay:.0f}s "
+        f"(intento {delivery.attempts}/{config['max_attempts']}): {error}"
+    )
+    record_event("EMAIL_RETRY", delivery.payment_id, {"attempt": delivery.attempts, "delay": round(delay), "error": error})
+    metrics.EMAIL_FAILURES.inc(outcome='retry')
+    return False
+
+
+def process_next_delivery() -> bool:
+    """Tarea de los workers. Retorna True si procesó al menos una entrega."""
+    config = get_outbox_config()
+    _release_expired_leases(config)
+    if resilience.is_open('brevo'):
+        # Fallaría al instante y gastaría un intento de la entrega: esperar
+        return False
+    delivery = claim_next_delivery()
+    if delivery is None:
+        return False
+    companions = claim_companions(delivery, config)
+    if companions:
+        deliver_batch([delivery, *companions])
+    else:
+        deliver(delivery)
+    return True
+
+
+# =============================================================================
+# WORKERS
+# =============================================================================
+
+_config = get_outbox_config()
+_workers = WorkerPool(
+    'email-outbox',
+    process_next_delivery,
+    concurrency=_config['workers'],
+    poll_interval=_config['poll_interval'],
+)
+
+
+def start_workers() -> None:
+    if _workers.concurrency > 0:
+        _workers.start()
+
+
+def stop_workers(timeout: float | None = None) -> None:
+    _workers.stop(timeout)
+
+
+def outbox_stats() -> dict[str, Any]:
+    counts = {status: 0 for status, _ in EmailDelivery.STATUS_CHOICES}
+    for row in EmailDelivery.objects.values('status').order_by().annotate(n=Count('id')):
+        counts[row['status']] = row['n']
+    return {"workers_running": _workers.running, "deliveries": counts, "batching": email_batch_stats()}
@@ -0,0 +1,144 @@
+"""
+Caché de consultas de pagos a Mercado Pago - Datos con Alex
+============================================================
+Evita repetir sdk.payment().get para pagos que ya conocemos:
+
+- Estados terminales (approved, rejected, refunded, cancelled, ...):
+  TTL largo, el pago ya no va a cambiar
+- Estados no terminales (pending, in_process, ...): TTL corto
+
+Usa el caché de Django 'payments' (FileBasedCache en PAYMENTS_RUNTIME_DIR),
+compartido entre todos los gunicorn workers. Solo se cachean respuestas
+HTTP 200 de MP.
+============================================================
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from typing import Any
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics
+from .clients import mp_payment_get
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = frozenset({'approved', 'rejected', 'refunded', 'cancelled', 'charged_back'})
+
+DEFAULT_PAYMENT_CACHE: dict[str, Any] = {
+    'terminal_ttl': 24 * 3600,
+    'pending_ttl': 10,
+}
+
+
+def get_payment_cache_config() -> dict[str, Any]:
+    config = dict(DEFAULT_PAYMENT_CACHE)
+    config.update(getattr(settings, 'PAYMENT_STATUS_CACHE', {}))
+    return config
+
+
+class _Counters:
+    """Contadores por proceso (hits/misses/bypass)."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+
+    def incr(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+
+_counters = _Counters()
+
+
+def _cache_key(payment_id: str) -> str:
+    return f"mp:payment:{payment_id}"
+
+
+def get_payment(payment_id: str, refresh_non_terminal: bool = False) -> dict[str, Any]:
+    """
+    Respuesta de MP para payment.get ({"status": http, "response": {...}}),
+    desde el caché si está disponible.
+
+    refresh_non_terminal=True ignora entradas cacheadas en estado no
+    terminal (lo usa el webhook: si MP notifica, el estado pudo cambiar).
+    """
+    cache = caches['payments']
+    key = _cache_key(payment_id)
+
+    cached = cache.get(key)
+    if cached is not None:
+        is_terminal = cached.get("response", {}).get("status") in TERMINAL_STATUSES
+        if is_terminal or not refresh_non_terminal:
+            _counters.incr('hits')
+            metrics.CACHE_HITS.inc(cache='payment_status')
+            logger.debug(f"[PAYMENT_CACHE] HIT payment={payment_id}")
+            return cached
+        _counters.incr('refreshes')
+        metrics.CACHE_MISSES.inc(cache='payment_status')
+    else:
+        _counters.incr('misses')
+        metrics.CACHE_MISSES.inc(cache='payment_status')
+
+    payment_response = mp_payment_get(payment_id)
+    store_payment(payment_id, payment_response)
+    return payment_response
+
+
+async def aget_payment(payment_id: str, refresh_non_terminal: bool = False) -> dict[str, Any]:
+    """Versión async de get_payment (cliente httpx, sin bloquear el event loop)."""
+    from .async_clients import amp_payment_get
+
+    cached = await caches['payments'].aget(_cache_key(payment_id))
+    if cached is not None:
+        is_terminal = cached.get("response", {}).get("status") in TERMINAL_STATUSES
+        if is_terminal or not refresh_non_terminal:
+            _counters.incr('hits')
+            metrics.CACHE_HITS.inc(cache='payment_status')
+            return cached
+        _counters.incr('refreshes')
+        metrics.CACHE_MISSES.inc(cache='payment_status')
+    else:
+        _counters.incr('misses')
+        metrics.CACHE_MISSES.inc(cache='payment_status')
+
+    payment_response = await amp_payment_get(payment_id)
+    await sync_to_async(store_payment, thread_sensitive=False)(payment_id, payment_response)
+    return payment_response
+
+
+def store_payment(payment_id: str, payment_response: dict[str, Any]) -> None:
+    """Guarda una respuesta de MP con el TTL según su estado."""
+    if payment_response.get("status") != 200:
+        return
+    config = get_payment_cache_config()
+    status = (payment_response.get("response") or {}).get("status")
+    ttl = config['terminal_ttl'] if status in TERMINAL_STATUSES else config['pending_ttl']
+    try:
+        caches['payments'].set(_cache_key(payment_id), dict(payment_response), ttl)
+    except Exception:
+        # El caché es una optimización: un error de disco no debe romper el pago
+        logger.exception(f"[PAYMENT_CACHE] No se pudo cachear payment={payment_id}")
+
+
+def invalidate_payment(payment_id: str) -> None:
+    caches['payments'].delete(_cache_key(payment_id))
+
+
+def payment_cache_stats() -> dict[str, Any]:
+    lookups = _counters.hits + _counters.misses + _counters.refreshes
+    return {
+        "hits": _counters.hits,
+        "misses": _counters.misses,
+        "refreshes": _counters.refreshes,
+        "hit_rate": round(_counters.hits / lookups, 4) if lookups else 0.0,
+        "scope": "por proceso (el caché en sí es compartido)",
+    }
@@ -0,0 +1,229 @@
+"""
+Caché idempotente de preferencias de Mercado Pago - Datos con Alex
+===================================================================
+create_preference es la llamada más lenta a MP y el checkout la repite
+seguido (doble click, volver atrás y reintentar). Dentro de un TTL corto
+devolvemos la misma preferencia en vez de crear otra:
+
+- Clave explícita: header `Idempotency-Key` (reusarla con otros datos
+  es un error 422)
+- Clave derivada: (email, course_id, price), para clientes que no mandan
+  el header
+
+Dos niveles:
+- BoundedCache por proceso (LRU con tamaño máximo)
+- Caché de Django 'payments' (FileBasedCache), compartido entre workers
+
+Los requests concurrentes con la misma clave pasan por un single-flight:
+solo uno llega a MP.
+===================================================================
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Any, Awaitable, Callable
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+
+from . import metrics
+from .cache import BoundedCache
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PREFERENCE_CACHE: dict[str, Any] = {
+    'ttl': 600,
+    'max_entries': 1024,
+    'max_key_length': 255,
+}
+
+
+def get_preference_cache_config() -> dict[str, Any]:
+    config = dict(DEFAULT_PREFERENCE_CACHE)
+    config.update(getattr(settings, 'PREFERENCE_CACHE', {}))
+    return config
+
+
+class IdempotencyKeyMismatch(Exception):
+    """La Idempotency-Key ya se usó con otros datos de compra."""
+
+
+class _Counters:
+    """Contadores por proceso."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.local_hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def incr(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+
+_config = get_preference_cache_config()
+_local = BoundedCache('preferences', max_entries=_config['max_entries'], ttl=_config['ttl'])
+_counters = _Counters()
+_flight = SingleFlight('preference', lock_dir=Path(settings.PAYMENTS_RUNTIME_DIR) / 'locks')
+
+
+def fingerprint(email: str, course_id: str, price: float) -> str:
+    """Huella de la compra (la clave derivada)."""
+    raw = json.dumps([email.strip().lower(), course_id, round(float(price), 2)])
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+def _cache_keys(purchase_fingerprint: str, idempotency_key: str | None) -> list[str]:
+    keys = []
+    if idempotency_key:
+        digest = hashlib.sha256(idempotency_key.encode()).hexdigest()
+        keys.append(f"mp:preference:key:{digest}")
+    keys.append(f"mp:preference:fp:{purchase_fingerprint}")
+    return keys
+
+
+def _lookup(keys: list[str], purchase_fingerprint: str) -> dict[str, Any] | None:
+    for key in keys:
+        entry = _local.get(key)
+        counter = 'local_hits'
+        if entry is None:
+            try:
+                entry = caches['payments'].get(key)
+            except Exception:
+                logger.exception("[PREFERENCE_CACHE] Error leyendo el caché compartido")
+                entry = None
+            if entry is not None:
+                _local.set(key, entry)
+            counter = 'shared_hits'
+        if entry is None:
+            continue
+        if entry['fingerprint'] != purchase_fingerprint:
+            if key.startswith('mp:preference:key:'):
+                raise IdempotencyKeyMismatch()
+            continue
+        _counters.incr(counter)
+        metrics.CACHE_HITS.inc(cache='preferences')
+        if key != keys[0]:
+            # Hit por la clave derivada: atar también la Idempotency-Key a
+            # esta compra para detectar su reuso con otros datos
+            _store(keys[:1], purchase_fingerprint, entry['response'])
+        return entry['response']
+    return None
+
+
+def _store(keys: list[str], purchase_fingerprint: str, response: dict[str, Any]) -> None:
+    entry = {'fingerprint': purchase_fingerprint, 'response': response}
+    for key in keys:
+        _local.set(key, entry)
+        try:
+            caches['payments'].set(key, entry, _config['ttl'])
+        except Exception:
+            # El caché es una optimización: no romper el checkout por un error de disco
+            logger.exception("[PREFERENCE_CACHE] No se pudo guardar la preferencia")
+
+
+def get_or_create_preference(
+    purchase_fingerprint: str,
+    idempotency_key: str | None,
+    create: Callable[[], dict[str, Any]],
+) -> tuple[dict[str, Any], bool]:
+    """
+    Respuesta de create_preference para esta compra: (respuesta, reutilizada).
+
+    `create()` crea la preferencia en MP y retorna el dict de respuesta
+    para el frontend; solo se cachean las respuestas con success=True.
+    Lanza IdempotencyKeyMismatch si la clave se usó con otra compra.
+    """
+    if idempotency_key and len(idempotency_key) > _config['max_key_length']:
+        idempotency_key = idempotency_key[:_config['max_key_length']]
+    keys = _cache_keys(purchase_fingerprint, idempotency_key)
+
+    cached = _lookup(keys, purchase_fingerprint)
+    if cached is not None:
+        return cached, True
+
+    def create_once() -> dict[str, Any]:
+        # Otro request pudo haberla creado mientras esperábamos el lock
+        cached = _lookup(keys, purchase_fingerprint)
+        if cached is not None:
+            return {'response': cached, 'reused': True}
+        _counters.incr('misses')
+        metrics.CACHE_MISSES.inc(cache='preferences')
+        response = create()
+        if response.get('success'):
+            _store(keys, purchase_fingerprint, response)
+        return {'response': response, 'reused': False}
+
+    result, shared = _flight.do(keys[0], create_once)
+    if shared:
+        _counters.incr('coalesced')
+    return result['response'], shared or result['reused']
+
+
+# Creaciones async en vuelo por (event loop, clave)
+_async_flights: dict[tuple[int, str], asyncio.Task] = {}
+
+
+async def aget_or_create_preference(
+    purchase_fingerprint: str,
+    idempotency_key: str | None,
+    create: Callable[[], Awaitable[dict[str, Any]]],
+) -> tuple[dict[str, Any], bool]:
+    """
+    Versión async de get_or_create_preference (vistas ASGI).
+
+    Los requests concurrentes del mismo proceso comparten la creación; entre
+    procesos la deduplicación es la del caché compartido (sin file lock, que
+    bloquearía el event loop).
+    """
+    if idempotency_key and len(idempotency_key) > _config['max_key_length']:
+        idempotency_key = idempotency_key[:_config['max_key_length']]
+    keys = _cache_keys(purchase_fingerprint, idempotency_key)
+
+    cached = await sync_to_async(_lookup, thread_sensitive=False)(keys, purchase_fingerprint)
+    if cached is not None:
+        return cached, True
+
+    flight_key = (id(asyncio.get_running_loop()), keys[0])
+    task = _async_flights.get(flight_key)
+    shared = task is not None
+    if task is None:
+        async def create_once() -> dict[str, Any]:
+            _counters.incr('misses')
+            metrics.CACHE_MISSES.inc(cache='preferences')
+            response = await create()
+            if response.get('success'):
+                await sync_to_async(_store, thread_sensitive=False)(keys, purchase_fingerprint, response)
+            return response
+
+        task = asyncio.ensure_future(create_once())
+        _async_flights[flight_key] = task
+        task.add_done_callback(lambda _: _async_flights.pop(flight_key, None))
+    response = await asyncio.shield(task)
+    if shared:
+        _counters.incr('coalesced')
+    return response, shared
+
+
+def preference_cache_stats() -> dict[str, Any]:
+    hits = _counters.local_hits + _counters.shared_hits
+    lookups = hits + _counters.misses
+    return {
+        "local_hits": _counters.local_hits,
+        "shared_hits": _counters.shared_hits,
+        "misses": _counters.misses,
+        "coalesced": _counters.coalesced,
+        "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+        "local": _local.stats(),
+        "scope": "por proceso (el caché compartido vive en 'payments')",
+    }
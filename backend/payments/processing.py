@@ -0,0 +1,292 @@
+"""
+Procesamiento de pagos compartido - Datos con Alex
+===================================================
+Lógica común de pago_exitoso y webhook:
+
+0. validate: si el ledger local (ledger.py) ya tiene el pago en estado
+   terminal, se responde desde ahí
+1. Consultar el pago a Mercado Pago (con caché, ver payment_cache.py) y
+   registrar su estado en el ledger
+2. Si está aprobado: reclamar el payment_id (idempotencia) y encolar
+   la entrega por email en el outbox. Un reclamo sin entrega (proceso
+   caído entre el reclamo y el encolado) no cuenta como procesado: se
+   encola la entrega, que es única por payment_id
+
+Todo pasa por un single-flight por payment_id: si el redirect y el
+webhook llegan a la vez (mismo worker o workers distintos), solo el
+primero consulta a MP y encola; el resto comparte su resultado.
+
+El resultado es un dict serializable a JSON con un campo `outcome`:
+- mp_error / mp_exception: no se pudo consultar a MP
+- mp_unavailable: circuit breaker de MP abierto (no se consultó); desde
+  validate el pago queda en el inbox para procesarlo cuando MP vuelva
+- not_approved: el pago existe pero no está aprobado (ver `status`)
+- no_customer_email: aprobado, pero la metadata no trae email
+- queued: aprobado y entrega encolada (ver `delivery_status`)
+- already_processed: aprobado, otro request ya lo había reclamado
+- enqueue_failed: aprobado, pero falló el encolado (ver `error`)
+===================================================
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from pathlib import Path
+from types import SimpleNamespace
+from typing import Any
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from . import metrics, timing
+from .idempotency import get_idempotency_store
+from .journal import record_event
+from .ledger import get_terminal_order, record_payment
+from .outbox import enqueue_delivery, get_delivery
+from .payment_cache import aget_payment, get_payment
+from .resilience import CircuitOpenError
+from .singleflight import SingleFlight
+from .tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+_payment_flight = SingleFlight(
+    'payment',
+    lock_dir=Path(settings.PAYMENTS_RUNTIME_DIR) / 'locks',
+)
+
+
+def process_payment(
+    payment_id: str,
+    source: str,
+    payment_response: dict[str, Any] | None = None,
+) -> dict[str, Any]:
+    """
+    Consulta y procesa un pago (single-flight por payment_id).
+
+    `source` es 'validate' o 'webhook' (se usa para logs y para el origen
+    de la entrega). Los llamadores concurrentes reciben el mismo resultado
+    con `shared=True`. `payment_response` evita la consulta a MP si ya se
+    hizo (la usa aprocess_payment).
+    """
+    result, shared = _payment_flight.do(
+        payment_id, lambda: _process_payment(payment_id, source, payment_response),
+    )
+    if result['outcome'] == 'queued' and not shared:
+        metrics.APPROVED.inc(source=source)
+    elif _is_duplicate(result, shared):
+        metrics.DUPLICATES_SKIPPED.inc(source=source)
+    if shared:
+        get_tracer(source).info('payment_result_shared', payment_id=payment_id, outcome=result['outcome'])
+    else:
+        record_event(f"PAYMENT_{result['outcome'].upper()}", payment_id, {
+            'source': source,
+            **{k: result[k] for k in ('status', 'status_detail', 'delivery_status', 'error') if result.get(k) is not None},
+        })
+    return {**result, 'shared': shared}
+
+
+def _is_duplicate(result: dict[str, Any], shared: bool) -> bool:
+    """Un pago aprobado que este llamador no tuvo que procesar."""
+    return result['outcome'] == 'already_processed' or (shared and result['outcome'] == 'queued')
+
+
+def singleflight_stats() -> dict[str, Any]:
+    return _payment_flight.stats()
+
+
+# Requests async en vuelo por (event loop, payment_id, source)
+_async_flights: dict[tuple[int, str, str], asyncio.Task] = {}
+
+
+async def aprocess_payment(payment_id: str, source: str) -> dict[str, Any]:
+    """
+    Versión async de process_payment (vistas ASGI).
+
+    La consulta a MP se hace con el cliente httpx sin bloquear el event
+    loop; el resto (idempotencia, ledger, outbox: solo base de datos) corre
+    en un thread con process_payment. Requests concurrentes del mismo pago
+    en este proceso comparten la misma tarea.
+    """
+    key = (id(asyncio.get_running_loop()), payment_id, source)
+    task = _async_flights.get(key)
+    shared = task is not None
+    if task is None:
+        task = asyncio.ensure_future(_aprocess_payment(payment_id, source))
+        _async_flights[key] = task
+        task.add_done_callback(lambda _: _async_flights.pop(key, None))
+    result = await asyncio.shield(task)
+    if shared:
+        if _is_duplicate(result, shared):
+            metrics.DUPLICATES_SKIPPED.inc(source=source)
+        get_tracer(source).info('payment_result_shared', payment_id=payment_id, outcome=result['outcome'])
+    return {**result, 'shared': result['shared'] or shared}
+
+
+async def _aprocess_payment(payment_id: str, source: str) -> dict[str, Any]:
+    payment_response = None
+    answered_locally = source == 'validate' and (
+        await sync_to_async(_answer_from_ledger, thread_sensitive=False)(payment_id, {})
+    ) is not None
+    if not answered_locally:
+        try:
+            payment_response = await aget_payment(payment_id, refresh_non_terminal=(source == 'webhook'))
+        except CircuitOpenError as e:
+            return {**await sync_to_async(_mp_unavailable, thread_sensitive=False)(payment_id, source, e), 'shared': False}
+        except Exception as e:
+            get_tracer(source).exception('mp_payment_exception', payment_id=payment_id, error=f"{type(e).__name__}: {e}")
+            return {'payment_id': payment_id, 'outcome': 'mp_exception', 'error': str(e), 'shared': False}
+    return await sync_to_async(process_payment, thread_sensitive=False)(payment_id, source, payment_response)
+
+
+def _mp_unavailable(payment_id: str, source: str, error: CircuitOpenError) -> dict[str, Any]:
+    """Resultado con el breaker de MP abierto (validate deja el pago en el inbox)."""
+    trace = get_tracer(source)
+    result = {'payment_id': payment_id, 'outcome': 'mp_unavailable', 'error': str(error),
+              'retry_after': round(error.retry_after)}
+    if source == 'validate':
+        from .inbox import defer_payment  # inbox importa este módulo
+
+        try:
+            defer_payment(payment_id, source, delay=error.retry_after)
+            result['deferred'] = True
+        except Exception as e:
+            trace.exception('payment_defer_failed', payment_id=payment_id, error=f"{type(e).__name__}: {e}")
+            result['deferred'] = False
+    trace.warning('mp_unavailable', payment_id=payment_id, retry_after=result['retry_after'],
+                  deferred=result.get('deferred'))
+    return result
+
+
+def _answer_from_ledger(payment_id: str, result: dict[str, Any]) -> dict[str, Any] | None:
+    """Resultado desde la orden local, o None si hay que consultar a MP."""
+    try:
+        order = get_terminal_order(payment_id)
+    except Exception:
+        logger.exception(f"[LEDGER] Error leyendo la orden de payment {payment_id}")
+        return None
+    if order is None:
+        return None
+
+    local = {**result, 'status': order.status, 'status_detail': order.status_detail,
+             'amount': float(order.price), 'source': 'ledger'}
+    if order.status != 'approved':
+        return {**local, 'outcome': 'not_approved'}
+
+    # Aprobado: solo si la entrega ya existe (si no, el camino normal la encola)
+    delivery = get_delivery(payment_id)
+    if delivery is None:
+        return None
+    return {**local, 'outcome': 'already_processed', 'delivery_status': delivery.status}
+
+
+def _process_payment(
+    payment_id: str,
+    source: str,
+    prefetched: dict[str, Any] | None = None,
+) -> dict[str, Any]:
+    trace = get_tracer(source)
+    result: dict[str, Any] = {'payment_id': payment_id}
+
+    # 0. LEDGER LOCAL: un pago en estado terminal ya no cambia (salvo por un
+    # webhook, que siempre va a MP), validate responde sin consultar afuera
+    if source == 'validate':
+        with timing.span('ledger'):
+            local = _answer_from_ledger(payment_id, result)
+        if local is not None:
+            trace.info('payment_answered_locally', payment_id=payment_id,
+                       status=local['status'], outcome=local['outcome'])
+            return local
+
+    # 1. CONSULTAR A MERCADO PAGO (o al caché compartido de pagos).
+    # Un webhook implica que el estado pudo cambiar: no confiar en un
+    # estado no terminal cacheado.
+    try:
+        if prefetched is not None:
+            payment_response = prefetched
+        else:
+            payment_response = get_payment(payment_id, refresh_non_terminal=(source == 'webhook'))
+        mp_http_status = payment_response.get("status")
+
+        if mp_http_status != 200:
+            trace.error('mp_payment_error', payment_id=payment_id, mp_http_status=mp_http_status,
+                        response=lambda: str(payment_response)[:500])
+            return {**result, 'outcome': 'mp_error', 'mp_http_status': mp_http_status}
+
+        payment_data = payment_response.get("response", {})
+        status = payment_data.get("status")
+        status_detail = payment_data.get("status_detail", "N/A")
+        amount = payment_data.get("transaction_amount")
+
+        # Extraer metadata (MP convierte keys a snake_case)
+        metadata = payment_data.get("metadata", {})
+
+        trace.info('payment_fetched', payment_id=payment_id, status=status,
+                   status_detail=status_detail, amount=amount)
+        record_payment(payment_id, payment_data)
+        trace.debug('payment_metadata', payment_id=payment_id, metadata=metadata)
+
+    except CircuitOpenError as e:
+        return _mp_unavailable(payment_id, source, e)
+    except Exception as e:
+        trace.exception('mp_payment_exception', payment_id=payment_id, error=f"{type(e).__name__}: {e}")
+        return {**result, 'outcome': 'mp_exception', 'error': str(e)}
+
+    result.update({'status': status, 'status_detail': status_detail, 'amount': amount})
+
+    # 2. SOLO PROCESAMOS PAGOS APROBADOS
+    if status != 'approved':
+        trace.info('payment_not_approved', payment_id=payment_id, status=status)
+        return {**result, 'outcome': 'not_approved'}
+
+    # 3. DATOS DEL CLIENTE DESDE LA METADATA
+    customer_email = metadata.get("customer_email", "")
+    customer_name = metadata.get("customer_first_name", "Cliente")
+    course_id = metadata.get("course_id", "tracker-habitos")
+    course_title = metadata.get("course_title", "Producto Digital")
+    result['customer_email'] = customer_email
+
+    trace.debug('payment_customer', payment_id=payment_id, customer_email=customer_email,
+                customer_name=customer_name, course_id=course_id, course_title=course_title)
+
+    if not customer_email:
+        trace.error('payment_without_email', payment_id=payment_id, metadata_keys=lambda: list(metadata))
+        return {**result, 'outcome': 'no_customer_email'}
+
+    order = SimpleNamespace(
+        id=payment_data.get("external_reference", payment_id),
+        first_name=customer_name,
+        email=customer_email,
+        course_title=course_title,
+        course_id=course_id,
+        price=metadata.get("price", amount or 0),
+        status=status
+    )
+
+    # 4. RECLAMAR EL PAGO (atómico entre workers)
+    idempotency = get_idempotency_store()
+    with timing.span('idempotency'):
+        claimed = idempotency.claim(payment_id, source=source)
+    if not claimed:
+        delivery = get_delivery(payment_id)
+        if delivery is not None:
+            trace.info('payment_already_processed', payment_id=payment_id, delivery_status=delivery.status)
+            return {**result, 'outcome': 'already_processed', 'delivery_status': delivery.status}
+        # Reclamado pero sin entrega: el proceso que lo reclamó murió antes
+        # de encolar. La entrega es única por payment_id, así que encolarla
+        # acá es seguro aunque ese proceso siga vivo y también la encole.
+        trace.warning('claim_without_delivery', payment_id=payment_id)
+
+    # 5. ENCOLAR LA ENTREGA (los workers del outbox envían el email)
+    try:
+        with timing.span('enqueue'):
+            delivery, created = enqueue_delivery(payment_id, order, source=source)
+        trace.info('delivery_enqueued', payment_id=payment_id, course_id=order.course_id,
+                   created=created, delivery_status=delivery.status)
+        return {**result, 'outcome': 'queued', 'delivery_status': delivery.status}
+    except Exception as e:
+        trace.exception('delivery_enqueue_failed', payment_id=payment_id, error=f"{type(e).__name__}: {e}")
+        # Sin entrega no debe quedar el reclamo: el próximo intento la encola
+        idempotency.release(payment_id)
+        return {**result, 'outcome': 'enqueue_failed', 'error': str(e)}
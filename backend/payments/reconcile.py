@@ -0,0 +1,270 @@
+"""
+Conciliación con Mercado Pago - Datos con Alex
+===============================================
+Red de seguridad para cuando fallan tanto pago_exitoso como el webhook
+(Brevo caído, worker que murió a mitad de camino): recorre los pagos
+aprobados de una ventana de tiempo en la API de búsqueda de MP y entrega
+los que no tienen entrega en el outbox.
+
+1. Pide páginas de /v1/payments/search (status=approved, orden por
+   date_created ascendente), con un límite de requests por segundo
+2. Cruza cada página con email_deliveries en una sola consulta
+3. Los pagos sin entrega pasan por process_payment con el pago de la
+   búsqueda (sin otra consulta a MP), en un pool de threads acotado y con
+   su propio límite por segundo. Reprocesar es seguro: la idempotencia y
+   el outbox evitan emails duplicados
+4. Después de cada página guarda un checkpoint (JSON) para poder retomar
+
+La API de MP no pagina con offsets arbitrariamente grandes: cada
+`max_offset` resultados la ventana se corre al date_created del último
+pago visto (los pagos repetidos en el borde no se entregan dos veces).
+
+Uso: `python manage.py reconcile_payments` (ver el comando).
+===============================================
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable
+
+import requests
+from django.conf import settings
+from django.db import close_old_connections
+
+from .clients import mp_payment_search
+from .models import EmailDelivery
+from .outbox import retry_delivery
+from .processing import process_payment
+from .resilience import CircuitOpenError
+from .tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+reconcile_trace = get_tracer('reconcile')
+
+DEFAULT_PAYMENT_RECONCILE: dict[str, Any] = {
+    'page_size': 100,
+    'max_offset': 1000,          # offset máximo antes de correr la ventana
+    'search_rate': 5.0,          # requests/s a la búsqueda de MP
+    'redelivery_rate': 10.0,     # entregas encoladas por segundo
+    'concurrency': 4,            # threads de reentrega
+}
+
+
+def get_reconcile_config() -> dict[str, Any]:
+    config = dict(DEFAULT_PAYMENT_RECONCILE)
+    config.update(getattr(settings, 'PAYMENT_RECONCILE', {}))
+    return config
+
+
+def default_checkpoint_path() -> Path:
+    return Path(settings.PAYMENTS_RUNTIME_DIR) / 'reconcile' / 'checkpoint.json'
+
+
+def format_mp_date(value: datetime) -> str:
+    """Fecha en el formato de begin_date / end_date de la búsqueda de MP."""
+    return value.isoformat(timespec='milliseconds')
+
+
+class RateLimiter:
+    """Token bucket thread-safe: `rate` permisos por segundo (0 = sin límite)."""
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# =============================================================================
+# CHECKPOINT
+# =============================================================================
+
+@dataclass
+class ReconcileState:
+    """Progreso de una conciliación (lo que se guarda en el checkpoint)."""
+
+    begin_date: str
+    end_date: str
+    cursor: str                   # begin_date efectivo de la página actual
+    offset: int = 0
+    pages: int = 0
+    finished: bool = False
+    counts: dict[str, int] = field(default_factory=dict)
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        self.counts[name] = self.counts.get(name, 0) + amount
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps({**asdict(self), 'updated_at': time.time()}, indent=2))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path) -> ReconcileState | None:
+        try:
+            data = json.loads(path.read_text())
+        except FileNotFoundError:
+            return None
+        data.pop('updated_at', None)
+        return cls(**data)
+
+
+# =============================================================================
+# CONCILIACIÓN
+# =============================================================================
+
+def _delivery_statuses(payment_ids: list[str]) -> dict[str, str]:
+    return dict(EmailDelivery.objects.filter(payment_id__in=payment_ids).values_list('payment_id', 'status'))
+
+
+def _redeliver(payment: dict[str, Any], limiter: RateLimiter) -> str:
+    limiter.acquire()
+    try:
+        result = process_payment(str(payment['id']), 'reconcile', {'status': 200, 'response': payment})
+        return result['outcome']
+    except Exception as e:
+        reconcile_trace.exception('redelivery_failed', payment_id=str(payment.get('id')),
+                                  error=f"{type(e).__name__}: {e}")
+        return 'error'
+    finally:
+        close_old_connections()
+
+
+class Reconciler:
+    """
+    Recorre una ventana de pagos aprobados y entrega los que falten.
+
+    `dry_run` solo cuenta (no encola nada ni escribe el checkpoint).
+    `retry_failed` también reencola las entregas en estado failed.
+    `on_page` recibe el estado después de cada página (progreso del comando).
+    """
+
+    def __init__(
+        self,
+        state: ReconcileState,
+        checkpoint: Path | None = None,
+        dry_run: bool = False,
+        retry_failed: bool = False,
+        on_page: Callable[[ReconcileState, list[str]], None] | None = None,
+        **options: Any,
+    ) -> None:
+        self.config = {**get_reconcile_config(), **{k: v for k, v in options.items() if v is not None}}
+        self.state = state
+        self.checkpoint = checkpoint
+        self.dry_run = dry_run
+        self.retry_failed = retry_failed
+        self.on_page = on_page
+        self._search_limiter = RateLimiter(self.config['search_rate'])
+        self._redelivery_limiter = RateLimiter(self.config['redelivery_rate'])
+        # Pagos ya vistos en el borde de la ventana corrida
+        self._seen_at_cursor: set[str] = set()
+
+    def _fetch_page(self) -> list[dict[str, Any]]:
+        self._search_limiter.acquire()
+        try:
+            response = self._search()
+        except (requests.RequestException, CircuitOpenError) as e:
+            raise RuntimeError(f"Búsqueda de pagos en MP: {type(e).__name__}: {e}") from e
+        if response.get('status') != 200:
+            raise RuntimeError(f"Búsqueda de pagos en MP: HTTP {response.get('status')}: {str(response.get('response'))[:300]}")
+        return (response.get('response') or {}).get('results') or []
+
+    def _search(self) -> dict[str, Any]:
+        return mp_payment_search({
+            'status': 'approved',
+            'sort': 'date_created',
+            'criteria': 'asc',
+            'range': 'date_created',
+            'begin_date': self.state.cursor,
+            'end_date': self.state.end_date,
+            'limit': self.config['page_size'],
+            'offset': self.state.offset,
+        })
+
+    def _advance(self, results: list[dict[str, Any]]) -> None:
+        if len(results) < self.config['page_size']:
+            self.state.finished = True
+            return
+        self.state.offset += len(results)
+        if self.state.offset < self.config['max_offset']:
+            return
+        # Correr la ventana al último date_created visto
+        last_created = results[-1].get('date_created') or ''
+        if last_created and last_created != self.state.cursor:
+            self.state.cursor = last_created
+            self.state.offset = 0
+            self._seen_at_cursor = {str(p['id']) for p in results if p.get('date_created') == last_created}
+
+    def run_page(self, executor: ThreadPoolExecutor) -> list[str]:
+        """Procesa una página. Retorna los payment_id que faltaba entregar."""
+        results = self._fetch_page()
+        approved = [
+            p for p in results
+            if p.get('status') == 'approved' and str(p.get('id')) not in self._seen_at_cursor
+        ]
+        self._seen_at_cursor = set()
+        self.state.pages += 1
+        self.state.incr('scanned', len(results))
+        self.state.incr('approved', len(approved))
+
+        statuses = _delivery_statuses([str(p['id']) for p in approved])
+        missing = [p for p in approved if str(p['id']) not in statuses]
+        failed = [pid for pid, status in statuses.items() if status == EmailDelivery.STATUS_FAILED]
+        self.state.incr('delivered', sum(1 for s in statuses.values() if s == EmailDelivery.STATUS_SENT))
+        self.state.incr('in_progress', sum(
+            1 for s in statuses.values() if s in (EmailDelivery.STATUS_QUEUED, EmailDelivery.STATUS_SENDING)
+        ))
+        self.state.incr('failed', len(failed))
+        self.state.incr('missing', len(missing))
+
+        if not self.dry_run:
+            for outcome in executor.map(lambda p: _redeliver(p, self._redelivery_limiter), missing):
+                self.state.incr(f"outcome_{outcome}")
+            if self.retry_failed:
+                self.state.incr('failed_requeued', sum(1 for pid in failed if retry_delivery(pid)))
+
+        self._advance(results)
+        if self.checkpoint is not None and not self.dry_run:
+            self.state.save(self.checkpoint)
+        missing_ids = [str(p['id']) for p in missing]
+        if self.on_page is not None:
+            self.on_page(self.state, missing_ids)
+        return missing_ids
+
+    def run(self, max_pages: int | None = None) -> ReconcileState:
+        started = time.monotonic()
+        reconcile_trace.info('reconcile_started', begin_date=self.state.begin_date, end_date=self.state.end_date,
+                             cursor=self.state.cursor, offset=self.state.offset, dry_run=self.dry_run)
+        with ThreadPoolExecutor(max_workers=self.config['concurrency'], thread_name_prefix='reconcile') as executor:
+            pages = 0
+            while not self.state.finished and (max_pages is None or pages < max_pages):
+                self.run_page(executor)
+                pages += 1
+        reconcile_trace.info('reconcile_finished', finished=self.state.finished, pages=self.state.pages,
+                             duration_s=round(time.monotonic() - started, 2), **self.state.counts)
+        return self.state
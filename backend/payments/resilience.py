@@ -0,0 +1,333 @@
+"""
+Resiliencia de las llamadas a Mercado Pago y Brevo - Datos con Alex
+====================================================================
+Un upstream degradado (MP lento, Brevo caído) no debe dejar a todos los
+workers esperando: cada llamada pasa por call() / acall(), que agrega
+
+- Deadline por llamada: tiempo total, reintentos incluidos. Cada intento
+  recorta su read timeout a lo que queda (PooledHttpClient, Brevo y httpx
+  leen remaining_timeout())
+- Reintentos acotados con backoff exponencial y jitter ("full jitter"),
+  solo para llamadas idempotentes (consultas) y solo ante errores
+  transitorios: conexión, timeout, 429 y 5xx
+- Circuit breaker por upstream: después de `breaker_failures` fallas
+  seguidas se abre y las llamadas fallan al instante (CircuitOpenError)
+  durante `breaker_reset_timeout` segundos; después deja pasar una
+  llamada de prueba (half-open) y se cierra si sale bien. Una respuesta
+  del upstream (aunque sea un 4xx) cuenta como éxito; un error local
+  (bug, serialización) no cuenta ni como éxito ni como falla
+
+Con el breaker abierto cada camino cae a su cola: validate deja el pago
+en el inbox de webhooks, el consumidor del inbox y el outbox de emails no
+toman trabajo nuevo, y create_preference responde 503 con Retry-After.
+
+Los breakers son por proceso (cada gunicorn worker decide solo).
+====================================================================
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import logging
+import random
+import threading
+import time
+from typing import Any, Awaitable, Callable, TypeVar
+
+import httpx
+import requests
+import urllib3
+from sib_api_v3_sdk.rest import ApiException
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+# Estados HTTP que indican un upstream con problemas (no un request inválido)
+TRANSIENT_STATUS = frozenset({429, 500, 502, 503, 504})
+
+# Deadline (time.monotonic()) de la llamada en curso en este thread / task
+_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar('upstream_deadline', default=None)
+
+
+class CircuitOpenError(Exception):
+    """El breaker del upstream está abierto: la llamada no se intentó."""
+
+    def __init__(self, upstream: str, retry_after: float) -> None:
+        super().__init__(f"{upstream} no disponible (circuit breaker abierto, reintentar en {retry_after:.0f}s)")
+        self.upstream = upstream
+        self.retry_after = retry_after
+
+
+# =============================================================================
+# CIRCUIT BREAKER
+# =============================================================================
+
+class CircuitBreaker:
+    """Breaker por conteo de fallas consecutivas, thread-safe."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self.opened = 0
+        self.rejected = 0
+        self.retries = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            return self.HALF_OPEN
+        return self._state
+
+    def retry_after(self) -> float:
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0.0
+            return max(self.reset_timeout - (time.monotonic() - self._opened_at), 0.0)
+
+    def allow(self) -> bool:
+        """True si la llamada puede intentarse (en half-open, una sola a la vez)."""
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self._probe_in_flight:
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self._state != self.CLOSED:
+                logger.warning(f"[RESILIENCE] {self.name}: circuit breaker cerrado (upstream recuperado)")
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_neutral(self) -> None:
+        """La llamada falló sin que el upstream respondiera (error local): no cuenta."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._probe_in_flight = False
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    self.opened += 1
+                    logger.error(
+                        f"[RESILIENCE] {self.name}: circuit breaker abierto tras {self._failures} falla(s) "
+                        f"seguidas, reintento en {self.reset_timeout:.0f}s"
+                    )
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            state = self._current_state()
+            return {
+                "state": state,
+                "consecutive_failures": self._failures,
+                "retry_after": round(max(self.reset_timeout - (time.monotonic() - self._opened_at), 0.0), 1)
+                if state == self.OPEN else 0.0,
+                "failure_threshold": self.failure_threshold,
+                "reset_timeout": self.reset_timeout,
+                "times_opened": self.opened,
+                "rejected_calls": self.rejected,
+                "retries": self.retries,
+            }
+
+
+_breakers: dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(upstream: str, config: dict[str, Any]) -> CircuitBreaker:
+    breaker = _breakers.get(upstream)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(upstream, CircuitBreaker(
+                upstream, config['breaker_failures'], config['breaker_reset_timeout'],
+            ))
+    return breaker
+
+
+def is_open(upstream: str) -> bool:
+    """True si el breaker del upstream está abierto y todavía no admite una prueba."""
+    breaker = _breakers.get(upstream)
+    return breaker is not None and breaker.state == CircuitBreaker.OPEN
+
+
+def breaker_stats() -> dict[str, Any]:
+    stats: dict[str, Any] = {name: breaker.stats() for name, breaker in sorted(_breakers.items())}
+    stats['scope'] = 'por proceso'
+    return stats
+
+
+# =============================================================================
+# DEADLINES Y REINTENTOS
+# =============================================================================
+
+def remaining_timeout(read_timeout: float) -> float:
+    """Read timeout del intento actual: el configurado, recortado al deadline."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return read_timeout
+    return max(min(read_timeout, deadline - time.monotonic()), 0.1)
+
+
+def is_transient(error: BaseException) -> bool:
+    """Errores que indican un upstream con problemas (vale reintentar)."""
+    if isinstance(error, ApiException):
+        return error.status in TRANSIENT_STATUS or not error.status
+    return isinstance(error, (
+        requests.RequestException, urllib3.exceptions.HTTPError, httpx.TransportError, TimeoutError, ConnectionError,
+    ))
+
+
+def is_upstream_answer(error: BaseException) -> bool:
+    """Excepciones que traen una respuesta del upstream (p. ej. un 400): está vivo."""
+    if isinstance(error, ApiException):
+        return bool(error.status)
+    return isinstance(error, httpx.HTTPStatusError)
+
+
+def _record_error(breaker: CircuitBreaker, error: Exception) -> bool:
+    """
+    Registra una excepción de `fn` en el breaker. True si es transitoria
+    (cuenta como falla y vale reintentar). Una respuesta de error del
+    upstream (4xx) cuenta como éxito; un error local (KeyError, TypeError
+    del SDK, serialización) no cuenta para ningún lado.
+    """
+    if is_transient(error):
+        return True
+    if is_upstream_answer(error):
+        breaker.record_success()
+    else:
+        breaker.record_neutral()
+    return False
+
+
+def _backoff(attempt: int, config: dict[str, Any]) -> float:
+    return random.uniform(0, min(config['backoff_max'], config['backoff_base'] * (2 ** (attempt - 1))))
+
+
+def _should_retry(
+    attempt: int, delay: float, deadline: float, idempotent: bool, config: dict[str, Any],
+) -> bool:
+    return idempotent and attempt <= config['max_retries'] and time.monotonic() + delay < deadline
+
+
+def call(
+    upstream: str,
+    fn: Callable[[], T],
+    config: dict[str, Any],
+    idempotent: bool = False,
+    failed: Callable[[T], bool] | None = None,
+) -> T:
+    """
+    Ejecuta `fn` con deadline, reintentos (si es idempotente) y breaker.
+
+    `failed(result)` marca como falla una respuesta sin excepción (p. ej.
+    un dict del SDK de MP con status 503). Si se agotan los reintentos se
+    devuelve esa última respuesta (o se relanza la última excepción).
+    Lanza CircuitOpenError si el breaker está abierto.
+    """
+    breaker = get_breaker(upstream, config)
+    deadline = time.monotonic() + config['deadline']
+    token = _deadline.set(deadline)
+    try:
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(upstream, breaker.retry_after())
+            error = None
+            try:
+                result = fn()
+            except Exception as e:
+                if not _record_error(breaker, e):
+                    raise
+                error = e
+            else:
+                if failed is None or not failed(result):
+                    breaker.record_success()
+                    return result
+            breaker.record_failure()
+
+            attempt += 1
+            delay = _backoff(attempt, config)
+            if not _should_retry(attempt, delay, deadline, idempotent, config):
+                if error is not None:
+                    raise error
+                return result
+            breaker.record_retry()
+            logger.warning(f"[RESILIENCE] {upstream}: reintento {attempt}/{config['max_retries']} en {delay:.2f}s "
+                           f"({type(error).__name__ if error else 'respuesta con error'})")
+            time.sleep(delay)
+    finally:
+        _deadline.reset(token)
+
+
+async def acall(
+    upstream: str,
+    fn: Callable[[], Awaitable[T]],
+    config: dict[str, Any],
+    idempotent: bool = False,
+    failed: Callable[[T], bool] | None = None,
+) -> T:
+    """Versión async de call() (cliente httpx de las vistas ASGI)."""
+    breaker = get_breaker(upstream, config)
+    deadline = time.monotonic() + config['deadline']
+    token = _deadline.set(deadline)
+    try:
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                raise CircuitOpenError(upstream, breaker.retry_after())
+            error = None
+            try:
+                result = await fn()
+            except Exception as e:
+                if not _record_error(breaker, e):
+                    raise
+                error = e
+            else:
+                if failed is None or not failed(result):
+                    breaker.record_success()
+                    return result
+            breaker.record_failure()
+
+            attempt += 1
+            delay = _backoff(attempt, config)
+            if not _should_retry(attempt, delay, deadline, idempotent, config):
+                if error is not None:
+                    raise error
+                return result
+            breaker.record_retry()
+            logger.warning(f"[RESILIENCE] {upstream}: reintento {attempt}/{config['max_retries']} en {delay:.2f}s "
+                           f"({type(error).__name__ if error else 'respuesta con error'})")
+            await asyncio.sleep(delay)
+    finally:
+        _deadline.reset(token)
@@ -17,24 +17,24 @@ from __future__ import annotations
 import os
 import logging
 import base64
-from pathlib import Path
+import threading
 from typing import Any
 
-import sib_api_v3_sdk
 from sib_api_v3_sdk.rest import ApiException
 from django.conf import settings
+from django.utils.html import escape
 
-logger = logging.getLogger(__name__)
-
-# =============================================================================
-# CONFIGURACIÓN DE PRODUCTOS
-# =============================================================================
+from . import metrics
+from .bundles import delivery_files
+from .cache import BoundedCache
+from .catalog import get_catalog, get_product
+from .clients import brevo_send_transac_email
+from .downloads import make_token
+from .emails import get_skeleton
+from .tracing import get_tracer
 
-PRODUCT_FILES: dict[str, list[str]] = {
-    'tracker-habitos': ['tracker-habitos.xlsx'],
-    'planificador-financiero': ['planificador-financiero.xlsx'],
-    'pack-productividad': ['tracker-habitos.xlsx', 'planificador-financiero.xlsx'],
-}
+logger = logging.getLogger(__name__)
+trace = get_tracer('services')
 
 # =============================================================================
 # VALIDACIÓN DE CONFIGURACIÓN
@@ -58,30 +58,73 @@ def validate_email_config() -> dict[str, Any]:
     }
 
 def validate_product_files(product_id: str) -> dict[str, Any]:
-    """Valida la existencia de los archivos de un producto."""
-    file_paths = get_product_files(product_id)
-    result = {"product_id": product_id, "files": []}
-    for path in file_paths:
-        exists = os.path.exists(path)
-        result["files"].append({
-            "path": path,
-            "filename": os.path.basename(path),
-            "exists": exists,
-            "size": os.path.getsize(path) if exists else 0
-        })
-    return result
+    """Archivos de un producto según el catálogo (metadata precalculada)."""
+    product = get_product(product_id)
+    files = [f.as_dict() for f in product.files] if product else []
+    return {"product_id": product_id, "in_catalog": product is not None, "files": files}
 
 # =============================================================================
 # FUNCIONES DE ARCHIVOS
 # =============================================================================
 
 def get_product_files(product_id: str) -> list[str]:
-    filenames = PRODUCT_FILES.get(product_id)
-    if not filenames:
-        filenames = [f"{product_id}.xlsx"]
-    
-    base_path = Path(settings.BASE_DIR) / 'files'
-    return [str(base_path / f) for f in filenames]
+    """Rutas de los archivos del producto (vacío si no está en el catálogo)."""
+    product = get_product(product_id)
+    return product.file_paths if product else []
+
+# =============================================================================
+# CACHÉ DE ADJUNTOS (base64 pre-codificado)
+# =============================================================================
+# Los xlsx casi nunca cambian: se codifican una sola vez por proceso y se
+# reutilizan en cada envío. La entrada se valida contra (mtime, size) del
+# archivo, así que reemplazar un archivo en disco invalida su versión cacheada.
+
+_attachment_cache = BoundedCache(
+    'attachments',
+    max_entries=getattr(settings, 'ATTACHMENT_CACHE_MAX_ENTRIES', 32),
+    max_bytes=getattr(settings, 'ATTACHMENT_CACHE_MAX_BYTES', 32 * 1024 * 1024),
+)
+
+
+def get_encoded_attachment(path: str, name: str | None = None) -> dict[str, str] | None:
+    """
+    Devuelve el adjunto listo para Brevo ({"content": base64, "name": ...}).
+    `name` es el nombre del adjunto (default: el del archivo).
+    Retorna None si el archivo no existe.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _attachment_cache.get(path)
+    if cached is not None and cached[0] == signature:
+        metrics.CACHE_HITS.inc(cache='attachments')
+        return {"content": cached[1], "name": name or os.path.basename(path)}
+    metrics.CACHE_MISSES.inc(cache='attachments')
+
+    with open(path, "rb") as f:
+        content = base64.b64encode(f.read()).decode('ascii')
+    _attachment_cache.set(path, (signature, content), size=len(content))
+    logger.debug(f"[ATTACHMENTS] Codificado {os.path.basename(path)} ({stat.st_size} bytes)")
+    return {"content": content, "name": name or os.path.basename(path)}
+
+
+def warm_attachment_cache() -> int:
+    """Pre-codifica los archivos de todos los productos. Retorna cuántos cargó."""
+    loaded = 0
+    paths = {path for product in get_catalog() for _, path, _ in delivery_files(product)}
+    for path in sorted(paths):
+        if get_encoded_attachment(path) is not None:
+            loaded += 1
+        else:
+            logger.warning(f"[ATTACHMENTS] Archivo no encontrado al precargar: {path}")
+    return loaded
+
+
+def attachment_cache_stats() -> dict[str, Any]:
+    return _attachment_cache.stats()
 
 # =============================================================================
 # ENVÍO DE EMAIL VÍA API
@@ -91,131 +134,171 @@ def send_product_email(order: Any) -> bool:
     """
     Envía el email usando la API de Brevo (HTTPS).
     """
-    print(f"[SERVICES] ========== send_product_email INICIO ==========")
-    
     config_check = validate_email_config()
     if not config_check["valid"]:
-        print(f"[SERVICES] ❌ CONFIG INVÁLIDA: {config_check['errors']}")
-        logger.critical(f"[API ABORTED] Errores: {config_check['errors']}")
+        trace.critical('email_config_invalid', errors=config_check['errors'])
         return False
-    
-    print(f"[SERVICES] ✅ Config válida")
 
     try:
-        # API Configuration
-        api_key_raw = os.environ.get('EMAIL_HOST_PASSWORD', '')
-        api_key = api_key_raw.strip()
-        configuration = sib_api_v3_sdk.Configuration()
-        configuration.api_key['api-key'] = api_key
-        api_instance = sib_api_v3_sdk.TransactionalEmailsApi(sib_api_v3_sdk.ApiClient(configuration))
-
-        print(f"[SERVICES] ✅ API Key: '{api_key[:15]}...' (len={len(api_key)}, raw_len={len(api_key_raw)})")
-
-        # Destination Data
+        # Destination Data (el cliente Brevo compartido vive en clients.py)
         recipient_email = getattr(order, 'email', '').strip()
         customer_name = getattr(order, 'first_name', 'Cliente')
         product_id = getattr(order, 'course_id', '')
-        product_title = getattr(order, 'course_title', 'Producto Digital')
-        from_email_raw = os.environ.get('DEFAULT_FROM_EMAIL', '')
-        from_email = from_email_raw.strip()
-
-        print(f"[SERVICES] Datos de envío:")
-        print(f"[SERVICES]    to         = '{recipient_email}'")
-        print(f"[SERVICES]    from       = '{from_email}' (raw_repr={repr(from_email_raw)})")
-        print(f"[SERVICES]    product_id = '{product_id}'")
-        print(f"[SERVICES]    title      = '{product_title}'")
-        print(f"[SERVICES]    name       = '{customer_name}'")
-        logger.info(f"[API] Preparando envío: to={recipient_email}, from={from_email}, product={product_id}")
-
-        # Content
-        html_content = f"""
-        <html>
-        <body style="font-family: sans-serif; color: #333; padding: 20px;">
-            <div style="max-width: 600px; margin: 0 auto; background: white; padding: 30px; border-radius: 12px; border: 1px solid #eee;">
-                <h1 style="color: #22c55e;">🎉 ¡Gracias por tu compra!</h1>
-                <p>Hola <strong>{customer_name}</strong>,</p>
-                <p>Tu pedido <strong>{product_title}</strong> está confirmado.</p>
-                <p>📎 <strong>Tus archivos están adjuntos a este correo.</strong></p>
-                <hr style="border: none; border-top: 1px solid #eee; margin: 20px 0;">
-                <p style="font-size: 12px; color: #999;">Datos con Alex</p>
-            </div>
-        </body>
-        </html>
-        """
-
-        # Attachments
-        attachments = []
-        file_paths = get_product_files(product_id)
-        
-        print(f"[SERVICES] Archivos a adjuntar para '{product_id}': {file_paths}")
-        
-        for path in file_paths:
-            if os.path.exists(path):
-                file_size = os.path.getsize(path)
-                with open(path, "rb") as f:
-                    content = base64.b64encode(f.read()).decode('utf-8')
-                attachments.append({
-                    "content": content,
-                    "name": os.path.basename(path)
-                })
-                print(f"[SERVICES]    ✅ Archivo cargado: {os.path.basename(path)} ({file_size} bytes)")
-            else:
-                print(f"[SERVICES]    ❌ Archivo NO EXISTE: {path}")
-                logger.error(f"[API] Archivo no existe: {path}")
-
-        if not attachments:
-            print(f"[SERVICES] ❌ ABORTADO: No hay archivos para enviar")
-            logger.error("[API ABORTED] No hay archivos para enviar")
+
+        # Asunto, remitente, HTML y adjuntos vienen precalculados por producto
+        # (payments/emails.py); acá solo se completan los datos del cliente
+        with metrics.stage_timer('attachment_load'):
+            skeleton = get_skeleton(product_id)
+        if skeleton is None:
+            trace.error('email_aborted', product_id=product_id, reason='unknown_product')
             return False
 
-        print(f"[SERVICES] ✅ {len(attachments)} archivo(s) listo(s) para adjuntar")
+        trace.info('email_preparing', to=recipient_email, sender=skeleton.sender['email'], product_id=product_id)
+        trace.debug('email_details', subject=skeleton.subject, name=customer_name, language=skeleton.language,
+                    api_key_len=lambda: len(os.environ.get('EMAIL_HOST_PASSWORD', '').strip()))
+
+        for path in skeleton.missing_files:
+            trace.error('attachment_missing', product_id=product_id, path=path)
+        if not skeleton.deliverable:
+            trace.error('email_aborted', product_id=product_id, reason='no_attachments')
+            return False
 
-        # Send SMTP Email object
-        send_smtp_email = sib_api_v3_sdk.SendSmtpEmail(
-            to=[{"email": recipient_email, "name": customer_name}],
-            sender={"email": from_email, "name": "Datos con Alex"},
-            subject=f"🎉 Tu compra: {product_title}",
-            html_content=html_content,
-            attachment=attachments
-        )
+        if skeleton.uses_links:
+            # Links firmados (payments/downloads.py) en vez de adjuntos
+            send_smtp_email = skeleton.build(recipient_email, customer_name, make_token(order.id, product_id))
+            trace.debug('download_links_ready', product_id=product_id, payment_id=order.id)
+        else:
+            trace.debug('attachments_ready', product_id=product_id,
+                        files=lambda: [(a['name'], len(a['content'])) for a in skeleton.attachments])
+            send_smtp_email = skeleton.build(recipient_email, customer_name)
 
-        print(f"[SERVICES] 📧 Llamando a Brevo API send_transac_email()...")
-        
         # Execute
-        api_response = api_instance.send_transac_email(send_smtp_email)
-        
-        print(f"[SERVICES] ✅ ¡EMAIL ENVIADO! message_id: {api_response.message_id}")
-        logger.info(f"[API SUCCESS] Email enviado vía API. ID: {api_response.message_id}")
-        print(f"[SERVICES] ========== send_product_email FIN (éxito) ==========")
+        with trace.span('brevo_send', to=recipient_email, product_id=product_id) as span:
+            api_response = brevo_send_transac_email(send_smtp_email)
+            span.fields['message_id'] = api_response.message_id
         return True
 
     except ApiException as e:
-        print(f"[SERVICES] ❌ BREVO API ERROR: status={e.status}, reason={e.reason}")
-        print(f"[SERVICES]    body: {e.body}")
-        print(f"[SERVICES]    headers: {e.headers}")
-        logger.error(f"[API FAILED] Error en Brevo API: {e}")
-        print(f"[SERVICES] ========== send_product_email FIN (API error) ==========")
+        trace.error('brevo_api_error', status=e.status, reason=e.reason, body=str(e.body)[:500])
         return False
     except Exception as e:
-        print(f"[SERVICES] ❌ ERROR INESPERADO: {type(e).__name__}: {e}")
-        import traceback
-        print(f"[SERVICES] Traceback:\n{traceback.format_exc()}")
-        logger.exception(f"[API CRITICAL] Error inesperado: {e}")
-        print(f"[SERVICES] ========== send_product_email FIN (excepción) ==========")
+        trace.exception('email_unexpected_error', error=f"{type(e).__name__}: {e}")
         return False
 
+# =============================================================================
+# ENVÍO EN LOTE (message versions de Brevo)
+# =============================================================================
+# En una promoción llegan muchas ventas del mismo producto a la vez: en vez
+# de un request por cliente, un solo request con una "message version" por
+# cliente. Asunto, HTML y adjuntos viajan una sola vez.
+
+class _BatchCounters:
+    """Contadores por proceso."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.batches = 0
+        self.batched_recipients = 0
+        self.fallbacks = 0
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+
+_batch_counters = _BatchCounters()
+
+
+def _send_batch(product_id: str, orders: list[Any]) -> dict[str, bool]:
+    failed = {str(order.id): False for order in orders}
+    config_check = validate_email_config()
+    if not config_check["valid"]:
+        trace.critical('email_config_invalid', errors=config_check['errors'])
+        return failed
+
+    with metrics.stage_timer('attachment_load'):
+        skeleton = get_skeleton(product_id)
+    if skeleton is None:
+        trace.error('email_aborted', product_id=product_id, reason='unknown_product')
+        return failed
+    for path in skeleton.missing_files:
+        trace.error('attachment_missing', product_id=product_id, path=path)
+    if not skeleton.deliverable:
+        trace.error('email_aborted', product_id=product_id, reason='no_attachments')
+        return failed
+
+    recipients = [
+        (getattr(order, 'email', '').strip(), getattr(order, 'first_name', '') or 'Cliente',
+         make_token(order.id, product_id) if skeleton.uses_links else '')
+        for order in orders
+    ]
+    try:
+        with trace.span('brevo_send_batch', product_id=product_id, recipients=len(recipients)) as span:
+            api_response = brevo_send_transac_email(skeleton.build_batch(recipients))
+            message_ids = api_response.message_ids or []
+            span.fields['message_ids'] = len(message_ids)
+    except ApiException as e:
+        trace.error('brevo_batch_error', status=e.status, reason=e.reason, body=str(e.body)[:500],
+                    product_id=product_id, recipients=len(recipients))
+        if e.status == 400:
+            # Un destinatario inválido rechaza todo el lote: uno por uno
+            _batch_counters.incr('fallbacks')
+            return {str(order.id): send_product_email(order) for order in orders}
+        return failed
+    except Exception as e:
+        trace.exception('email_unexpected_error', error=f"{type(e).__name__}: {e}", product_id=product_id)
+        return failed
+
+    _batch_counters.incr('batches')
+    _batch_counters.incr('batched_recipients', len(orders))
+    for index, order in enumerate(orders):
+        trace.info('email_sent_in_batch', payment_id=str(order.id), to=recipients[index][0],
+                   message_id=message_ids[index] if index < len(message_ids) else None)
+    return {str(order.id): True for order in orders}
+
+
+def send_product_emails(orders: list[Any]) -> dict[str, bool]:
+    """
+    Envía el producto a varios clientes. Retorna {order.id: enviado}.
+
+    Los orders del mismo producto van en un solo request a Brevo. Se envían
+    uno por uno (send_product_email) los que quedan solos y los de nombres
+    con caracteres que habría que escapar en el HTML. Si Brevo rechaza el
+    lote con un 400 (p. ej. un email inválido), se reintenta cada uno por
+    separado para que un destinatario malo no tumbe al resto.
+    """
+    by_product: dict[str, list[Any]] = {}
+    single: list[Any] = []
+    for order in orders:
+        name = getattr(order, 'first_name', '') or 'Cliente'
+        if escape(name) == name:
+            by_product.setdefault(getattr(order, 'course_id', ''), []).append(order)
+        else:
+            single.append(order)
+
+    results: dict[str, bool] = {}
+    for product_id, product_orders in by_product.items():
+        if len(product_orders) > 1:
+            results.update(_send_batch(product_id, product_orders))
+        else:
+            single.extend(product_orders)
+    for order in single:
+        results[str(order.id)] = send_product_email(order)
+    return results
+
+
+def email_batch_stats() -> dict[str, Any]:
+    return {
+        "batches": _batch_counters.batches,
+        "batched_recipients": _batch_counters.batched_recipients,
+        "fallbacks": _batch_counters.fallbacks,
+        "scope": "por proceso",
+    }
+
 # Mantenemos las otras funciones para compatibilidad con las vistas de debug
 def test_email_connection():
     return {"service": "Brevo API (HTTPS)", "config_valid": validate_email_config()["valid"]}
 
 def list_available_products():
-    result = {"products": []}
-    base_path = Path(settings.BASE_DIR) / 'files'
-    for pid, files in PRODUCT_FILES.items():
-        ready = all((base_path / f).exists() for f in files)
-        result["products"].append({
-            "id": pid, 
-            "ready": ready,
-            "all_files_exist": ready
-        })
-    return result
+    # Precalculado al cargar el catálogo: sin stat() por request
+    return get_catalog().summary
@@ -0,0 +1,226 @@
+"""
+Single-flight por clave - Datos con Alex
+=========================================
+Coalesce llamadas concurrentes con la misma clave (p. ej. un payment_id):
+la primera ejecuta la función y las demás esperan y comparten su resultado.
+
+- Dentro del proceso: un Event por clave en vuelo
+- Entre procesos (gunicorn workers): file lock (fcntl.flock) sobre un
+  archivo de lock propio de la clave + un archivo con el último
+  resultado. Quien estaba esperando el lock mientras el líder trabajaba
+  lee ese resultado en vez de repetir el trabajo. Las llamadas
+  posteriores (sin solapamiento) ejecutan la función normalmente.
+  Claves distintas nunca se esperan entre sí.
+
+Los resultados compartidos entre procesos deben ser serializables a JSON.
+En plataformas sin fcntl (Windows) solo se coalesce dentro del proceso.
+=========================================
+"""
+
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin coordinación entre procesos
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: BaseException | None = None
+
+
+class SingleFlight:
+    """
+    Ejecuta fn() una sola vez por clave entre llamadas concurrentes.
+
+    do() retorna (resultado, compartido): compartido=True si el resultado
+    vino de otra llamada (de este proceso o de otro worker).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        lock_dir: str | Path | None = None,
+        result_ttl: float = 5.0,
+        lock_timeout: float = 30.0,
+    ) -> None:
+        self.name = name
+        self.result_ttl = result_ttl
+        self.lock_timeout = lock_timeout
+        self.lock_dir = Path(lock_dir) if lock_dir and fcntl is not None else None
+        if self.lock_dir is not None:
+            self.lock_dir.mkdir(parents=True, exist_ok=True)
+        self._calls: dict[str, _Call] = {}
+        self._lock = threading.Lock()
+        self.leader_calls = 0
+        self.shared_calls = 0
+        self._result_writes = 0
+
+    def _incr(self, name: str) -> int:
+        """Suma 1 al contador `name` (bajo el lock: lo llaman muchos threads)."""
+        with self._lock:
+            value = getattr(self, name) + 1
+            setattr(self, name, value)
+            return value
+
+    def do(self, key: str, fn: Callable[[], Any]) -> tuple[Any, bool]:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            self._incr('shared_calls')
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        shared = False
+        try:
+            call.result, shared = self._do_across_processes(key, fn)
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+        self._incr('shared_calls' if shared else 'leader_calls')
+        return call.result, shared
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "cross_process": self.lock_dir is not None,
+            "in_flight": len(self._calls),
+            "leader_calls": self.leader_calls,
+            "shared_calls": self.shared_calls,
+        }
+
+    # -------------------------------------------------------------------------
+    # Coordinación entre procesos
+    # -------------------------------------------------------------------------
+
+    def _do_across_processes(self, key: str, fn: Callable[[], Any]) -> tuple[Any, bool]:
+        if self.lock_dir is None:
+            return fn(), False
+
+        digest = hashlib.sha256(f"{self.name}:{key}".encode()).hexdigest()[:32]
+        lock_path = self.lock_dir / f"{self.name}-{digest}.lock"
+        result_path = self.lock_dir / f"{self.name}-{digest}.json"
+
+        waiting_since = time.time()
+        lock_file = self._acquire(lock_path)
+        try:
+            cached = self._read_result(result_path, written_after=waiting_since)
+            if cached is not None:
+                return cached, True
+            result = fn()
+            self._write_result(result_path, result)
+            return result, False
+        finally:
+            if lock_file is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+
+    def _acquire(self, lock_path: Path):
+        """
+        Archivo de lock de la clave, ya bloqueado (None si venció el timeout).
+
+        Solo espera a otra llamada con la misma clave. Si el archivo fue
+        purgado mientras se esperaba (el lock quedó sobre un inode borrado),
+        se vuelve a abrir.
+        """
+        deadline = time.monotonic() + self.lock_timeout
+        delay = 0.001
+        while True:
+            lock_file = open(lock_path, 'a+')
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        lock_file.close()
+                        # Preferimos trabajo duplicado antes que bloquear el request para siempre
+                        logger.warning(f"[SINGLEFLIGHT] {self.name}: timeout esperando lock, se continúa sin él")
+                        return None
+                    time.sleep(delay)
+                    delay = min(delay * 2, 0.05)
+            try:
+                if os.fstat(lock_file.fileno()).st_ino == os.stat(lock_path).st_ino:
+                    return lock_file
+            except FileNotFoundError:
+                pass
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            lock_file.close()
+
+    def _read_result(self, path: Path, written_after: float) -> Any:
+        """
+        Resultado escrito por otro proceso mientras esperábamos el lock.
+
+        La hora de escritura va dentro del archivo (no el mtime, que en
+        algunos filesystems tiene granularidad de segundos): un resultado
+        de una llamada que terminó antes de que empezáramos a esperar no
+        se reutiliza.
+        """
+        try:
+            with open(path) as f:
+                stored = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not isinstance(stored, dict) or stored.get('written_at', 0) < written_after:
+            return None
+        return stored.get('result')
+
+    def _write_result(self, path: Path, result: Any) -> None:
+        try:
+            fd, tmp = tempfile.mkstemp(dir=self.lock_dir, prefix='.tmp-')
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'written_at': time.time(), 'result': result}, f, default=str)
+            os.replace(tmp, path)
+        except (OSError, TypeError, ValueError):
+            logger.exception(f"[SINGLEFLIGHT] {self.name}: no se pudo guardar el resultado compartido")
+        if self._incr('_result_writes') % 100 == 0:
+            self._purge_stale()
+
+    def _purge_stale(self) -> None:
+        """
+        Borra resultados y locks viejos (barato: se llama cada 100
+        resultados escritos). Un lock se borra solo si nadie lo tiene tomado.
+        """
+        cutoff = time.time() - self.result_ttl
+        for path in self.lock_dir.glob(f"{self.name}-*.json"):
+            try:
+                if path.stat().st_mtime < cutoff:
+                    path.unlink(missing_ok=True)
+            except OSError:
+                pass
+        lock_cutoff = time.time() - max(self.result_ttl, self.lock_timeout)
+        for path in self.lock_dir.glob(f"{self.name}-*.lock"):
+            try:
+                if path.stat().st_mtime >= lock_cutoff:
+                    continue
+                with open(path, 'a+') as lock_file:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    path.unlink(missing_ok=True)
+            except (BlockingIOError, OSError):
+                pass
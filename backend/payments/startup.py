@@ -0,0 +1,66 @@
+"""
+Precalentado del servidor - Datos con Alex
+===========================================
+Carga los recursos compartidos (catálogo de productos, bundles zip,
+adjuntos codificados, esqueletos de los emails) para que el primer pago
+no pague el costo.
+
+Lo llaman config/wsgi.py y config/asgi.py, así que corre solo en procesos
+que sirven requests (gunicorn, uvicorn, runserver) y no en cada
+`manage.py check/migrate/reconcile_payments`. Con gunicorn y preload_app
+corre una vez en el master y los workers lo heredan (copy-on-write).
+
+PAYMENTS_WARM_UP=false lo desactiva: todo se arma igual en el primer uso.
+===========================================
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+def warm_up() -> None:
+    """Precarga lo que usa el primer pago. Nunca impide el arranque."""
+    from .bundles import build_bundles
+    from .catalog import get_catalog
+    from .emails import prerender_email_templates
+    from .services import warm_attachment_cache
+    from .webhook_guard import get_webhook_security_config
+
+    if not settings.DEBUG and not get_webhook_security_config()['secret']:
+        logger.warning("[STARTUP] MP_WEBHOOK_SECRET no configurado: el webhook no verifica firmas")
+
+    if os.environ.get('PAYMENTS_WARM_UP', 'true').lower() != 'true':
+        return
+
+    try:
+        get_catalog()
+    except Exception:
+        # Se reintenta en el primer request; el error queda en los logs
+        logger.exception("[STARTUP] Error cargando el catálogo de productos")
+
+    try:
+        bundles = build_bundles()
+        logger.info(f"[STARTUP] Bundles listos ({len(bundles)} producto(s) con varios archivos)")
+    except Exception:
+        # Sin bundle se entregan los archivos sueltos
+        logger.exception("[STARTUP] Error armando los bundles de productos")
+
+    try:
+        loaded = warm_attachment_cache()
+        logger.info(f"[STARTUP] Caché de adjuntos precargado ({loaded} archivo(s))")
+    except Exception:
+        # Nunca impedir el arranque por un archivo faltante o ilegible
+        logger.exception("[STARTUP] Error precargando el caché de adjuntos")
+
+    try:
+        ready = prerender_email_templates()
+        logger.info(f"[STARTUP] Emails precalculados ({ready} producto(s) con todos sus adjuntos)")
+    except Exception:
+        # Se arman en el primer envío; el error queda en los logs
+        logger.exception("[STARTUP] Error precalculando los templates de email")
@@ -0,0 +1,189 @@
+"""
+Carreras de un mismo pago - Datos con Alex
+===========================================
+validate y el webhook del mismo payment_id llegan a la vez, desde varios
+threads y desde varios procesos (como los gunicorn workers), contra
+Mercado Pago y Brevo falsos (benchmarks/fake_upstreams.py). Para cada
+pago tiene que haber:
+
+- Una sola consulta a MP (GET /v1/payments/<id>)
+- Una sola entrega en el outbox, encolada por un solo llamador
+- Un solo email en Brevo, aunque varios procesos vacíen el outbox a la vez
+
+    python manage.py test payments
+===========================================
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any
+from unittest import mock
+
+from django.core.cache import caches
+from django.db import connections
+from django.test import TransactionTestCase, override_settings
+
+from benchmarks.fake_upstreams import FaultProfile, base_urls, start_fake_brevo, start_fake_mercadopago
+from payments import clients, ledger, outbox
+from payments.models import EmailDelivery
+from payments.processing import process_payment
+
+PAYMENTS = 5
+THREADS = 8
+PROCESSES = 4
+SOURCES = ('validate', 'webhook')
+
+# Latencia fija de MP: los llamadores de un mismo pago se superponen
+MP_LATENCY = 0.05
+
+
+def _race(payment_ids: list[str], threads: int, barrier: Any = None) -> list[tuple[str, str, bool]]:
+    """Procesa cada pago desde `threads` threads a la vez: (payment_id, outcome, shared)."""
+    calls = [(payment_id, SOURCES[n % len(SOURCES)]) for payment_id in payment_ids for n in range(threads)]
+    start = threading.Barrier(len(calls))
+
+    def call(payment_id: str, source: str) -> tuple[str, str, bool]:
+        start.wait()
+        try:
+            result = process_payment(payment_id, source)
+            return payment_id, result['outcome'], result['shared']
+        finally:
+            connections.close_all()
+
+    if barrier is not None:
+        barrier.wait()
+    with ThreadPoolExecutor(max_workers=len(calls)) as executor:
+        return list(executor.map(lambda args: call(*args), calls))
+
+
+def _drain_outbox(threads: int) -> None:
+    """Vacía el outbox desde varios threads a la vez."""
+    def worker() -> None:
+        try:
+            while outbox.process_next_delivery():
+                pass
+        finally:
+            connections.close_all()
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for future in [executor.submit(worker) for _ in range(threads)]:
+            future.result()
+
+
+def _child(payment_ids: list[str], barrier: Any, results: Any) -> None:
+    """Un "worker" de gunicorn: la misma carrera en un proceso aparte."""
+    try:
+        outcomes = _race(payment_ids, THREADS // 2, barrier)
+        ledger.flush()
+        _drain_outbox(2)
+        results.put(('ok', outcomes))
+    except BaseException as e:
+        results.put(('error', f"{type(e).__name__}: {e}"))
+    finally:
+        ledger.stop_writer(timeout=2)
+        connections.close_all()
+
+
+class ConcurrentPaymentTests(TransactionTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        profile = FaultProfile(latency=lambda: MP_LATENCY)
+        cls.mp_server, cls.mp = start_fake_mercadopago(profile)
+        cls.brevo_server, cls.brevo = start_fake_brevo()
+        urls = base_urls(cls.mp_server, cls.brevo_server)
+
+        from django.conf import settings
+        outbound = {name: dict(config) for name, config in settings.OUTBOUND_HTTP.items()}
+        outbound['mercadopago']['base_url'] = urls['MP_API_BASE_URL']
+        outbound['brevo']['base_url'] = urls['BREVO_API_BASE_URL']
+        cls.enterClassContext(override_settings(OUTBOUND_HTTP=outbound))
+        cls.enterClassContext(mock.patch.dict(os.environ, {
+            'MP_ACCESS_TOKEN': 'TEST-race',
+            'EMAIL_HOST_PASSWORD': 'xkeysib-race',
+            'DEFAULT_FROM_EMAIL': 'ventas@datosconalex.test',
+        }))
+        # Los tests vacían el outbox explícitamente (y sin threads de fondo al hacer fork)
+        cls.enterClassContext(mock.patch.object(outbox._workers, 'concurrency', 0))
+        clients.close_clients()
+        cls.addClassCleanup(clients.close_clients)
+
+    @classmethod
+    def tearDownClass(cls):
+        ledger.stop_writer(timeout=2)
+        for server in (cls.mp_server, cls.brevo_server):
+            server.shutdown()
+            server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        # El caché de pagos es un FileBasedCache compartido entre procesos
+        caches['payments'].clear()
+        self.emails = {}
+        for n in range(PAYMENTS):
+            preference = self.mp.create_preference({
+                'items': [{'title': 'Tracker de Hábitos', 'unit_price': 1.0, 'currency_id': 'ARS'}],
+                'external_reference': f"race-{self._testMethodName}-{n}",
+                'metadata': {
+                    'customer_email': f"race-{self._testMethodName}-{n}@datosconalex.test",
+                    'customer_first_name': 'Cliente',
+                    'course_id': 'tracker-habitos',
+                    'course_title': 'Tracker de Hábitos',
+                },
+            })
+            payment = self.mp.pay(preference['id'])
+            self.emails[str(payment['id'])] = payment['metadata']['customer_email']
+        self.payment_ids = list(self.emails)
+
+    def assertOncePerPayment(self, outcomes: list[tuple[str, str, bool]]):
+        leaders = Counter(payment_id for payment_id, outcome, shared in outcomes if outcome == 'queued' and not shared)
+        failures = [(payment_id, outcome) for payment_id, outcome, _ in outcomes
+                    if outcome not in ('queued', 'already_processed')]
+        self.assertEqual(failures, [])
+        deliveries = Counter(EmailDelivery.objects.filter(
+            payment_id__in=self.payment_ids,
+        ).values_list('payment_id', flat=True))
+        sent = Counter(EmailDelivery.objects.filter(
+            payment_id__in=self.payment_ids, status=EmailDelivery.STATUS_SENT,
+        ).values_list('payment_id', flat=True))
+        emails = self.brevo.deliveries_for('race-')
+        for payment_id in self.payment_ids:
+            with self.subTest(payment_id=payment_id):
+                self.assertEqual(self.mp.payment_gets[payment_id], 1, "consultas a MP")
+                self.assertEqual(leaders[payment_id], 1, "llamadores que encolaron la entrega")
+                self.assertEqual(deliveries[payment_id], 1, "entregas en el outbox")
+                self.assertEqual(sent[payment_id], 1, "entregas enviadas")
+                self.assertEqual(emails.get(self.emails[payment_id]), 1, "emails en Brevo")
+
+    def test_threads_share_one_lookup_and_one_email(self):
+        outcomes = _race(self.payment_ids, THREADS)
+        ledger.flush()
+        _drain_outbox(4)
+        self.assertOncePerPayment(outcomes)
+
+    def test_processes_share_one_lookup_and_one_email(self):
+        context = multiprocessing.get_context('fork')
+        barrier = context.Barrier(PROCESSES)
+        results = context.Queue()
+        # Nada abierto que los procesos hijos hereden
+        ledger.stop_writer(timeout=2)
+        connections.close_all()
+        children = [
+            context.Process(target=_child, args=(self.payment_ids, barrier, results))
+            for _ in range(PROCESSES)
+        ]
+        for child in children:
+            child.start()
+        reports = [results.get(timeout=60) for _ in children]
+        for child in children:
+            child.join(timeout=10)
+
+        errors = [report for status, report in reports if status != 'ok']
+        self.assertEqual(errors, [])
+        self.assertOncePerPayment([outcome for _, report in reports for outcome in report])
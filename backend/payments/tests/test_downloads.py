@@ -0,0 +1,182 @@
+"""
+Links de descarga firmados (payments/downloads.py)
+===================================================
+Firma y vencimiento del token (adulterado, vencido, de otro producto),
+respuestas Range / If-Range / 304 y el tope de descargas por link, que se
+cuenta en bytes: pedir el archivo en rangos no lo esquiva.
+===================================================
+"""
+
+from __future__ import annotations
+
+import time
+from pathlib import Path
+
+from django.test import SimpleTestCase, override_settings
+
+from payments.catalog import get_product
+from payments.downloads import (
+    DownloadTokenError, _b64decode, _b64encode, make_token, verify_token,
+)
+
+PRODUCT_ID = 'tracker-habitos'
+FILENAME = 'tracker-habitos.xlsx'
+DOWNLOADS = {'enabled': True, 'base_url': 'https://backend.test', 'secret': 'download-secret',
+             'ttl': 3600, 'max_downloads': 0}
+
+
+def downloads(**overrides):
+    return override_settings(PAYMENT_DOWNLOADS={**DOWNLOADS, **overrides})
+
+
+@downloads()
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'default'},
+    'payments': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'downloads-tests'},
+})
+class DownloadTests(SimpleTestCase):
+
+    def setUp(self):
+        from django.core.cache import caches
+        caches['payments'].clear()
+        self.content = Path(get_product(PRODUCT_ID).files[0].path).read_bytes()
+        self.token = make_token('1234567890', PRODUCT_ID)
+
+    def get(self, filename=FILENAME, token=None, method='get', **headers):
+        url = f"/api/payments/download/{token or self.token}/{filename}"
+        return getattr(self.client, method)(url, headers=headers)
+
+    def body(self, response) -> bytes:
+        return b''.join(response.streaming_content)
+
+    # -- Tokens ----------------------------------------------------------------
+
+    def test_token_round_trip(self):
+        grant = verify_token(self.token)
+        self.assertEqual((grant.payment_id, grant.product_id), ('1234567890', PRODUCT_ID))
+        self.assertGreater(grant.expires_at, time.time())
+
+    def test_tampered_payload_is_rejected(self):
+        version, payload, signature = self.token.split('.')
+        forged = _b64encode(_b64decode(payload).decode().replace(PRODUCT_ID, 'pack-productividad').encode())
+        with self.assertRaises(DownloadTokenError) as raised:
+            verify_token(f"{version}.{forged}.{signature}")
+        self.assertEqual(raised.exception.status, 403)
+
+    def test_extended_expiry_is_rejected(self):
+        version, payload, signature = self.token.split('.')
+        payment_id, product_id, _ = _b64decode(payload).decode().split('|')
+        extended = _b64encode(f"{payment_id}|{product_id}|{int(time.time()) + 10 ** 8}".encode())
+        with self.assertRaises(DownloadTokenError):
+            verify_token(f"{version}.{extended}.{signature}")
+
+    def test_tampered_signature_is_rejected(self):
+        version, payload, signature = self.token.split('.')
+        tampered = ('A' if signature[0] != 'A' else 'B') + signature[1:]
+        for token in (f"{version}.{payload}.{tampered}", f"v0.{payload}.{signature}", 'garbage'):
+            with self.subTest(token=token), self.assertRaises(DownloadTokenError):
+                verify_token(token)
+
+    def test_token_signed_with_another_secret_is_rejected(self):
+        with downloads(secret='other-secret'):
+            token = make_token('1234567890', PRODUCT_ID)
+        with self.assertRaises(DownloadTokenError):
+            verify_token(token)
+
+    def test_expired_token_is_gone(self):
+        token = make_token('1234567890', PRODUCT_ID, ttl=-10)
+        with self.assertRaises(DownloadTokenError) as raised:
+            verify_token(token)
+        self.assertEqual(raised.exception.status, 410)
+        self.assertEqual(self.get(token=token).status_code, 410)
+
+    def test_invalid_token_is_forbidden(self):
+        self.assertEqual(self.get(token=self.token[:-2] + 'xx').status_code, 403)
+
+    def test_file_of_another_product_is_not_found(self):
+        self.assertEqual(self.get('planificador-financiero.xlsx').status_code, 404)
+        self.assertEqual(self.get('../settings.py').status_code, 404)
+
+    # -- Range / If-Range / 304 ------------------------------------------------
+
+    def test_full_download(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('attachment', response['Content-Disposition'])
+
+    def test_range_responses(self):
+        size = len(self.content)
+        cases = {
+            'bytes=0-9': (0, 9),
+            'bytes=100-': (100, size - 1),
+            'bytes=-10': (size - 10, size - 1),
+            f'bytes=10-{size + 50}': (10, size - 1),
+        }
+        for header, (start, end) in cases.items():
+            with self.subTest(range=header):
+                response = self.get(Range=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'], f"bytes {start}-{end}/{size}")
+                self.assertEqual(self.body(response), self.content[start:end + 1])
+
+    def test_unsatisfiable_range(self):
+        response = self.get(Range=f"bytes={len(self.content)}-")
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f"bytes */{len(self.content)}")
+
+    def test_multiple_ranges_get_the_whole_file(self):
+        self.assertEqual(self.get(Range='bytes=0-9,20-29').status_code, 200)
+
+    def test_if_range_with_current_etag_resumes(self):
+        etag = self.get(method='head')['ETag']
+        response = self.get(Range='bytes=100-', **{'If-Range': etag})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), self.content[100:])
+
+    def test_if_range_with_stale_etag_sends_the_whole_file(self):
+        response = self.get(Range='bytes=100-', **{'If-Range': '"stale"'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+
+    def test_if_none_match_is_not_modified(self):
+        etag = self.get(method='head')['ETag']
+        self.assertEqual(self.get(**{'If-None-Match': etag}).status_code, 304)
+
+    # -- Tope de descargas -----------------------------------------------------
+
+    def test_cap_stops_repeated_downloads(self):
+        with downloads(max_downloads=2):
+            self.assertEqual(self.get().status_code, 200)
+            self.assertEqual(self.get().status_code, 200)
+            self.assertEqual(self.get().status_code, 410)
+
+    def test_ranges_do_not_bypass_the_cap(self):
+        with downloads(max_downloads=1):
+            self.assertEqual(self.get(Range='bytes=0-0').status_code, 206)
+            self.assertEqual(self.get(Range='bytes=1-').status_code, 206)
+            etag = self.get(method='head')['ETag']
+            self.assertEqual(self.get(Range='bytes=1-', **{'If-Range': etag}).status_code, 410)
+            self.assertEqual(self.get().status_code, 410)
+
+    def test_split_download_counts_once(self):
+        with downloads(max_downloads=2):
+            self.assertEqual(self.get(Range='bytes=0-99').status_code, 206)
+            self.assertEqual(self.get(Range='bytes=100-').status_code, 206)
+            self.assertEqual(self.get().status_code, 200)
+            self.assertEqual(self.get(Range='bytes=0-0').status_code, 410)
+
+    def test_head_and_not_modified_do_not_count(self):
+        with downloads(max_downloads=1):
+            etag = self.get(method='head')['ETag']
+            self.assertEqual(self.get(**{'If-None-Match': etag}).status_code, 304)
+            self.assertEqual(self.get().status_code, 200)
+            self.assertEqual(self.get().status_code, 410)
+
+    def test_cap_is_per_file_and_token(self):
+        with downloads(max_downloads=1):
+            self.assertEqual(self.get().status_code, 200)
+            other = make_token('999', PRODUCT_ID)
+            self.assertEqual(self.get(token=other).status_code, 200)
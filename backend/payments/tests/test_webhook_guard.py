@@ -0,0 +1,146 @@
+"""
+Filtro previo del webhook (payments/webhook_guard.py)
+======================================================
+Firma x-signature (válida, inválida, ausente, vieja), el data.id firmado
+contra el del body, el IPN legacy con y sin `legacy_ipn` y los ids
+recientes. Sin base de datos ni red: check_notification no hace I/O.
+======================================================
+"""
+
+from __future__ import annotations
+
+import json
+import time
+from unittest import mock
+
+from django.test import RequestFactory, SimpleTestCase
+
+from payments import webhook_guard
+from payments.webhook_guard import check_notification, remember, sign
+
+SECRET = 'webhook-secret'
+PAYMENT_ID = '1234567890'
+
+
+class WebhookGuardTests(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        patcher = mock.patch.dict(webhook_guard._config, {'secret': SECRET, 'max_age': 0, 'legacy_ipn': False})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        webhook_guard._recent.clear()
+        self.addCleanup(webhook_guard._recent.clear)
+
+    def notification(self, data_id=PAYMENT_ID, body_id=None, ts=None, signature=None,
+                     request_id='req-1', notification_id='evt-1', headers=True):
+        """POST de un webhook de MP, firmado con SECRET salvo que se indique otra firma."""
+        ts = str(int(time.time())) if ts is None else ts
+        body = {'id': notification_id, 'type': 'payment', 'action': 'payment.updated',
+                'data': {'id': body_id or data_id}}
+        extra = {}
+        if headers:
+            v1 = signature if signature is not None else sign(SECRET, data_id, request_id, ts)
+            extra = {'HTTP_X_SIGNATURE': f"ts={ts},v1={v1}", 'HTTP_X_REQUEST_ID': request_id}
+        return self.factory.post(f"/api/payments/webhook/?data.id={data_id}&type=payment",
+                                 data=json.dumps(body), content_type='application/json', **extra)
+
+    def legacy_ipn(self, payment_id=PAYMENT_ID, topic='payment'):
+        return self.factory.post(f"/api/payments/webhook/?topic={topic}&id={payment_id}",
+                                 data=b'', content_type='application/json')
+
+    def assertRejected(self, check, status, reason):
+        self.assertFalse(check.accepted)
+        self.assertEqual((check.status, check.reason), (status, reason))
+
+    # -- Firma -----------------------------------------------------------------
+
+    def test_valid_signature_is_accepted(self):
+        check = check_notification(self.notification())
+        self.assertTrue(check.accepted)
+        self.assertEqual(check.payment_id, PAYMENT_ID)
+
+    def test_signature_with_millisecond_ts_is_accepted(self):
+        with mock.patch.dict(webhook_guard._config, {'max_age': 300}):
+            check = check_notification(self.notification(ts=str(int(time.time() * 1000))))
+        self.assertTrue(check.accepted)
+
+    def test_bad_signature_is_rejected(self):
+        self.assertRejected(check_notification(self.notification(signature='0' * 64)), 401, 'bad_signature')
+
+    def test_signature_for_another_request_id_is_rejected(self):
+        request = self.notification()
+        request.META['HTTP_X_REQUEST_ID'] = 'req-2'
+        self.assertRejected(check_notification(request), 401, 'bad_signature')
+
+    def test_missing_signature_is_rejected(self):
+        self.assertRejected(check_notification(self.notification(headers=False)), 401, 'missing_signature')
+
+    def test_stale_signature_is_rejected(self):
+        with mock.patch.dict(webhook_guard._config, {'max_age': 300}):
+            check = check_notification(self.notification(ts=str(int(time.time()) - 3600)))
+        self.assertRejected(check, 401, 'stale_signature')
+
+    def test_old_signature_is_accepted_without_max_age(self):
+        self.assertTrue(check_notification(self.notification(ts=str(int(time.time()) - 3600))).accepted)
+
+    def test_body_payment_id_must_match_the_signed_one(self):
+        check = check_notification(self.notification(data_id=PAYMENT_ID, body_id='999'))
+        self.assertRejected(check, 401, 'unsigned_payment_id')
+
+    def test_without_secret_nothing_is_verified(self):
+        with mock.patch.dict(webhook_guard._config, {'secret': ''}):
+            self.assertTrue(check_notification(self.notification(headers=False)).accepted)
+
+    # -- IPN legacy ------------------------------------------------------------
+
+    def test_legacy_ipn_is_rejected_by_default(self):
+        self.assertFalse(webhook_guard.DEFAULT_WEBHOOK_SECURITY['legacy_ipn'])
+        self.assertRejected(check_notification(self.legacy_ipn()), 401, 'missing_signature')
+
+    def test_legacy_ipn_is_accepted_unverified_when_enabled(self):
+        with mock.patch.dict(webhook_guard._config, {'legacy_ipn': True}):
+            check = check_notification(self.legacy_ipn())
+        self.assertTrue(check.accepted)
+        self.assertEqual(check.payment_id, PAYMENT_ID)
+        self.assertEqual(check.recent_key, f"ipn:{PAYMENT_ID}")
+
+    def test_repeated_legacy_ipn_is_dropped_before_the_inbox(self):
+        with mock.patch.dict(webhook_guard._config, {'legacy_ipn': True}):
+            first = check_notification(self.legacy_ipn())
+            remember(first)
+            repeated = check_notification(self.legacy_ipn())
+            other = check_notification(self.legacy_ipn(payment_id='555'))
+        self.assertTrue(first.accepted)
+        self.assertFalse(repeated.accepted)
+        self.assertEqual((repeated.status, repeated.reason), (200, 'duplicate'))
+        self.assertTrue(other.accepted)
+
+    def test_legacy_ipn_of_another_topic_is_ignored(self):
+        with mock.patch.dict(webhook_guard._config, {'legacy_ipn': True}):
+            check = check_notification(self.legacy_ipn(topic='merchant_order'))
+        self.assertRejected(check, 200, 'ignored')
+
+    def test_legacy_query_with_a_signature_is_verified(self):
+        request = self.legacy_ipn()
+        request.META['HTTP_X_SIGNATURE'] = f"ts={int(time.time())},v1={'0' * 64}"
+        with mock.patch.dict(webhook_guard._config, {'legacy_ipn': True}):
+            self.assertRejected(check_notification(request), 401, 'bad_signature')
+
+    # -- Forma y repetidas -----------------------------------------------------
+
+    def test_repeated_notification_is_dropped(self):
+        remember(check_notification(self.notification()))
+        self.assertRejected(check_notification(self.notification()), 200, 'duplicate')
+
+    def test_large_content_length_is_rejected_without_reading(self):
+        request = self.notification()
+        request.META['CONTENT_LENGTH'] = str(10 ** 6)
+        with mock.patch.object(type(request), 'body', new_callable=mock.PropertyMock) as body:
+            self.assertRejected(check_notification(request), 413, 'body_too_large')
+        body.assert_not_called()
+
+    def test_malformed_body_is_rejected(self):
+        with mock.patch.dict(webhook_guard._config, {'secret': ''}):
+            request = self.factory.post('/api/payments/webhook/', data=b'[1]', content_type='application/json')
+            self.assertRejected(check_notification(request), 400, 'malformed_body')
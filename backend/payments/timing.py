@@ -0,0 +1,107 @@
+"""
+Desglose de tiempos por request - Datos con Alex
+=================================================
+Cuando un comprador dice que "validando pago" tardó, ¿fue Mercado Pago,
+Brevo o nuestro código? ServerTimingMiddleware abre un RequestTiming por
+request en create_preference, pago_exitoso y webhook, y las etapas que se
+ejecutan adentro anotan su duración:
+
+- Las etapas de metrics.stage_timer() (request_parse, mp_payment_get,
+  mp_preference_create, ...) se anotan solas
+- timing.span('nombre') mide cualquier otro bloque
+
+Al terminar, el middleware agrega el header `Server-Timing` (las DevTools
+del navegador lo muestran en la pestaña Network) y, si el request superó
+`slow_request_ms`, emite un evento `slow_request` con el desglose.
+
+El RequestTiming vive en un contextvar: lo ven también los threads de
+sync_to_async y las tareas asyncio creadas durante el request. Fuera de un
+request anotar no hace nada.
+=================================================
+"""
+
+from __future__ import annotations
+
+import contextvars
+import time
+from typing import Any
+
+from django.conf import settings
+
+DEFAULT_SERVER_TIMING: dict[str, Any] = {
+    'enabled': True,
+    'views': ('create_preference', 'pago_exitoso', 'webhook'),
+    'slow_request_ms': 1000,
+    'timing_allow_origin': '',     # origen del frontend (lectura desde JS); vacío = no se envía
+}
+
+
+def get_server_timing_config() -> dict[str, Any]:
+    config = dict(DEFAULT_SERVER_TIMING)
+    config.update(getattr(settings, 'SERVER_TIMING', {}))
+    return config
+
+
+class RequestTiming:
+    """Duraciones por nombre de etapa de un request (se suman si se repiten)."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.spans: dict[str, list[float]] = {}
+
+    def record(self, name: str, seconds: float) -> None:
+        # Un dict por request: los threads de sync_to_async anotan de a uno
+        self.spans.setdefault(name, []).append(seconds)
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def summary_ms(self) -> dict[str, float]:
+        return {name: round(sum(durations) * 1000, 1) for name, durations in self.spans.items()}
+
+    def header(self, total: float) -> str:
+        """Valor de Server-Timing: `mp_payment_get;dur=812.3, total;dur=830.1`."""
+        entries = []
+        for name, durations in self.spans.items():
+            desc = f';desc="x{len(durations)}"' if len(durations) > 1 else ''
+            entries.append(f"{name}{desc};dur={sum(durations) * 1000:.1f}")
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ', '.join(entries)
+
+
+_current: contextvars.ContextVar[RequestTiming | None] = contextvars.ContextVar('request_timing', default=None)
+
+
+def start() -> tuple[RequestTiming, contextvars.Token]:
+    timing = RequestTiming()
+    return timing, _current.set(timing)
+
+
+def finish(token: contextvars.Token) -> None:
+    _current.reset(token)
+
+
+def record(name: str, seconds: float) -> None:
+    """Anota una etapa en el request en curso (si hay uno)."""
+    timing = _current.get()
+    if timing is not None:
+        timing.record(name, seconds)
+
+
+class _Span:
+    __slots__ = ('name', 'started')
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+
+    def __enter__(self) -> '_Span':
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        record(self.name, time.perf_counter() - self.started)
+
+
+def span(name: str) -> _Span:
+    """Context manager que anota la duración del bloque como `name`."""
+    return _Span(name)
@@ -0,0 +1,268 @@
+"""
+Tracing estructurado del flujo de pagos - Datos con Alex
+=========================================================
+Reemplaza los print() de pago_exitoso, webhook y send_product_email.
+
+- Cada etapa ("validate", "webhook", "services", ...) tiene su logger
+  `payments.trace.<etapa>` con su propio nivel (PAYMENTS_TRACING['stages'])
+- Los eventos son estructurados: un nombre + campos, emitidos como una
+  línea JSON
+- Nivel deshabilitado = cero trabajo: no se resuelven campos ni se
+  formatea nada. Los campos costosos se pasan como callables (lazy)
+- Los eventos DEBUG (campos verbosos: metadata, respuestas completas)
+  además se muestrean con `debug_sample_rate`, de forma determinística
+  por payment_id (todos los eventos de un mismo pago o ninguno)
+- El request solo encola el LogRecord (QueueHandler, sin bloquear); un
+  thread (QueueListener) serializa y escribe a stdout. Si la cola se
+  llena, el evento se descarta y se cuenta
+
+Uso:
+    trace = get_tracer('validate')
+    trace.info('payment_fetched', payment_id=pid, status=status)
+    trace.debug('payment_metadata', payment_id=pid, metadata=lambda: metadata)
+=========================================================
+"""
+
+from __future__ import annotations
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+import threading
+import time
+import zlib
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any
+
+from django.conf import settings
+
+DEFAULT_TRACING: dict[str, Any] = {
+    'level': 'INFO',
+    'stages': {},              # {'validate': 'DEBUG', 'services': 'WARNING'}
+    'debug_sample_rate': 0.01,
+    'queue_size': 10000,
+}
+
+TRACE_LOGGER = 'payments.trace'
+
+
+def get_tracing_config() -> dict[str, Any]:
+    config = dict(DEFAULT_TRACING)
+    config.update(getattr(settings, 'PAYMENTS_TRACING', {}))
+    return config
+
+
+# =============================================================================
+# FORMATO (se ejecuta en el thread del listener, no en el request)
+# =============================================================================
+
+class TraceFormatter(logging.Formatter):
+    """Una línea JSON por evento."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'stage': getattr(record, 'trace_stage', record.name),
+            'event': record.getMessage(),
+            **getattr(record, 'trace_fields', {}),
+        }
+        if record.exc_info:
+            data['exception'] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str, ensure_ascii=False)
+
+
+# =============================================================================
+# HANDLER NO BLOQUEANTE
+# =============================================================================
+
+class TraceQueueHandler(QueueHandler):
+    """
+    QueueHandler que no formatea en el thread del request y descarta
+    (contando) si la cola está llena. Re-arranca el listener después de un
+    fork (gunicorn con preload_app).
+    """
+
+    def __init__(self, queue_size: int, target: logging.Handler) -> None:
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.target = target
+        self.dropped = 0
+        self._listener: QueueListener | None = None
+        self._pid: int | None = None
+        self._lock = threading.Lock()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Cola en memoria del mismo proceso: el record viaja tal cual y el
+        # formateo queda para el listener
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if self._pid != os.getpid():
+            self._start_listener()
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _start_listener(self) -> None:
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Después de un fork el thread del listener no existe: uno nuevo
+            # (y una cola nueva, la heredada puede tener el lock tomado)
+            self.queue = queue.Queue(maxsize=self.queue.maxsize)
+            self._listener = QueueListener(self.queue, self.target, respect_handler_level=False)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def flush(self) -> None:
+        """Espera a que el listener escriba lo encolado (shutdown)."""
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._listener = None
+            self._pid = None
+        self.target.flush()
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            'queued': self.queue.qsize(),
+            'dropped': self.dropped,
+            'listener_running': self._pid == os.getpid(),
+        }
+
+
+# =============================================================================
+# TRACER
+# =============================================================================
+
+class Tracer:
+    """Emisor de eventos de una etapa."""
+
+    def __init__(self, stage: str) -> None:
+        self.stage = stage
+        self.logger = logging.getLogger(f"{TRACE_LOGGER}.{stage}")
+
+    def enabled(self, level: int) -> bool:
+        return self.logger.isEnabledFor(level)
+
+    def sampled(self, sample_key: Any = None) -> bool:
+        """True si los eventos DEBUG de esta clave (payment_id) se emiten."""
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return False
+        rate = _state.debug_sample_rate
+        if rate >= 1:
+            return True
+        if sample_key is None:
+            return random.random() < rate
+        return zlib.crc32(str(sample_key).encode()) % 10000 < rate * 10000
+
+    def emit(self, level: int, event: str, fields: dict[str, Any], exc_info: bool = False) -> None:
+        if not self.logger.isEnabledFor(level):
+            return
+        if level == logging.DEBUG and not self.sampled(fields.get('payment_id')):
+            return
+        resolved = {key: value() if callable(value) else value for key, value in fields.items()}
+        self.logger.log(
+            level, event,
+            exc_info=exc_info,
+            extra={'trace_stage': self.stage, 'trace_fields': resolved},
+        )
+
+    def debug(self, event: str, **fields: Any) -> None:
+        self.emit(logging.DEBUG, event, fields)
+
+    def info(self, event: str, **fields: Any) -> None:
+        self.emit(logging.INFO, event, fields)
+
+    def warning(self, event: str, **fields: Any) -> None:
+        self.emit(logging.WARNING, event, fields)
+
+    def error(self, event: str, **fields: Any) -> None:
+        self.emit(logging.ERROR, event, fields)
+
+    def critical(self, event: str, **fields: Any) -> None:
+        self.emit(logging.CRITICAL, event, fields)
+
+    def exception(self, event: str, **fields: Any) -> None:
+        """ERROR con el traceback de la excepción en curso."""
+        self.emit(logging.ERROR, event, fields, exc_info=True)
+
+    def span(self, event: str, **fields: Any) -> '_Span':
+        """Context manager que emite `event` con duration_ms al salir."""
+        return _Span(self, event, fields)
+
+
+class _Span:
+    def __init__(self, tracer: Tracer, event: str, fields: dict[str, Any]) -> None:
+        self.tracer = tracer
+        self.event = event
+        self.fields = fields
+
+    def __enter__(self) -> '_Span':
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        duration_ms = round((time.perf_counter() - self.started) * 1000, 2)
+        if exc_type is None:
+            self.tracer.info(self.event, duration_ms=duration_ms, **self.fields)
+        else:
+            self.tracer.error(self.event, duration_ms=duration_ms, error=f"{exc_type.__name__}: {exc}", **self.fields)
+
+
+# =============================================================================
+# CONFIGURACIÓN
+# =============================================================================
+
+class _State:
+    def __init__(self) -> None:
+        self.handler: TraceQueueHandler | None = None
+        self.debug_sample_rate = DEFAULT_TRACING['debug_sample_rate']
+        self.tracers: dict[str, Tracer] = {}
+        self.lock = threading.Lock()
+
+
+_state = _State()
+
+
+def configure_tracing() -> None:
+    """
+    Instala el handler no bloqueante y los niveles por etapa (idempotente).
+    Se llama desde PaymentsConfig.ready().
+    """
+    config = get_tracing_config()
+    with _state.lock:
+        _state.debug_sample_rate = float(config['debug_sample_rate'])
+
+        root = logging.getLogger(TRACE_LOGGER)
+        root.setLevel(config['level'])
+        root.propagate = False
+        for stage, level in config['stages'].items():
+            logging.getLogger(f"{TRACE_LOGGER}.{stage}").setLevel(level)
+
+        if _state.handler is None:
+            target = logging.StreamHandler(sys.stdout)
+            target.setFormatter(TraceFormatter())
+            _state.handler = TraceQueueHandler(int(config['queue_size']), target)
+            root.addHandler(_state.handler)
+            atexit.register(_state.handler.flush)
+
+
+def get_tracer(stage: str) -> Tracer:
+    tracer = _state.tracers.get(stage)
+    if tracer is None:
+        tracer = _state.tracers.setdefault(stage, Tracer(stage))
+    return tracer
+
+
+def tracing_stats() -> dict[str, Any]:
+    levels = {
+        stage: logging.getLevelName(tracer.logger.getEffectiveLevel())
+        for stage, tracer in sorted(_state.tracers.items())
+    }
+    handler = _state.handler.stats() if _state.handler else None
+    return {'levels': levels, 'debug_sample_rate': _state.debug_sample_rate, 'handler': handler}
@@ -4,10 +4,17 @@ URLs para el módulo de pagos con Mercado Pago
 Datos con Alex - Sistema de Pagos
 """
 
+from django.conf import settings
 from django.urls import path
 from . import views
 from . import views_debug
 
+# Detrás de config/asgi.py las rutas de pago usan las vistas async
+if getattr(settings, 'PAYMENTS_ASYNC_VIEWS', False):
+    from . import views_async as payment_views
+else:
+    payment_views = views
+
 app_name = 'payments'
 
 urlpatterns = [
@@ -17,19 +24,23 @@ urlpatterns = [
     
     # POST /api/payments/create-preference/
     # Crea una preferencia de pago y retorna el init_point
-    path('create-preference/', views.create_preference, name='create_preference'),
+    path('create-preference/', payment_views.create_preference, name='create_preference'),
     
     # GET /api/payments/validate/?payment_id=xxx
     # Valida un pago exitoso usando los parámetros de MP
-    path('validate/', views.pago_exitoso, name='pago_exitoso'),
+    path('validate/', payment_views.pago_exitoso, name='pago_exitoso'),
     
     # POST /api/payments/webhook/
     # Recibe notificaciones de Mercado Pago (backup)
-    path('webhook/', views.webhook, name='webhook'),
+    path('webhook/', payment_views.webhook, name='webhook'),
+    
+    # GET /api/payments/delivery-status/?payment_id=xxx
+    # Estado de la entrega por email (queued/sending/sent/failed)
+    path('delivery-status/', views.delivery_status, name='delivery_status'),
     
-    # GET /api/payments/download/<order_id>/
-    # Legacy - ya no funciona (archivos van por email)
-    path('download/<int:order_id>/', views.download_file, name='download_file'),
+    # GET /api/payments/download/<token>/<archivo>
+    # Descarga con el link firmado que llega por email
+    path('download/<str:token>/<str:filename>', views.download_file, name='download_file'),
     
     # ==========================================================================
     # ENDPOINTS DE DIAGNÓSTICO
@@ -54,5 +65,9 @@ urlpatterns = [
     # GET /api/payments/system-status/
     # Estado completo del sistema
     path('system-status/', views_debug.system_status, name='system_status'),
+    
+    # GET /api/payments/metrics/
+    # Métricas de todos los workers (formato Prometheus)
+    path('metrics/', views_debug.metrics, name='metrics'),
 ]
 
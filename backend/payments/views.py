@@ -5,13 +5,19 @@ VERSIÓN PRODUCCIÓN - "Datos con Alex"
 
 Este módulo maneja:
 1. create_preference - Crea preferencias de pago con metadata del cliente
-2. pago_exitoso - Valida pagos por redirección y envía emails
-3. webhook - FUENTE DE VERDAD para notificaciones de Mercado Pago (backup)
-
-ARQUITECTURA STATELESS:
-- No usamos base de datos para órdenes
+   (idempotente: Idempotency-Key o email+producto+precio)
+2. pago_exitoso - Valida pagos por redirección y encola el email
+3. webhook - FUENTE DE VERDAD para notificaciones de Mercado Pago (backup),
+   guardadas en un inbox y procesadas en segundo plano
+4. delivery_status - Estado de la entrega por email (outbox)
+5. download_file - Descarga de los archivos con el link firmado del email
+
+ARQUITECTURA:
 - Los datos del cliente viajan en la metadata de Mercado Pago
+- Cada compra queda en el ledger local (tabla orders, payments/ledger.py),
+  escrito en lote fuera del request
 - El webhook actúa como backup si pago_exitoso falla
+- Los emails se envían desde el outbox (payments/outbox.py), fuera del request
 
 IMPORTANTE PARA PRODUCCIÓN:
 - MP_ACCESS_TOKEN debe ser APP_USR-xxxx (no TEST-xxxx)
@@ -23,20 +29,32 @@ IMPORTANTE PARA PRODUCCIÓN:
 import json
 import os
 import time
-import hashlib
-import hmac
-from types import SimpleNamespace
 from pathlib import Path
-from django.http import JsonResponse, FileResponse
+from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-import mercadopago
 from dotenv import load_dotenv
 
 import logging
-from .services import send_product_email
+from . import metrics, timing
+from .clients import mp_preference_create
+from .downloads import handle_download
+from .inbox import store_notification
+from .catalog import get_product
+from .journal import record_event
+from .ledger import record_preference
+from .models import EmailDelivery
+from .outbox import get_delivery
+from .preference_cache import IdempotencyKeyMismatch, fingerprint, get_or_create_preference
+from .processing import process_payment
+from .resilience import CircuitOpenError
+from .tracing import get_tracer
+from .webhook_guard import check_notification, remember
 
 logger = logging.getLogger(__name__)
+validate_trace = get_tracer('validate')
+webhook_trace = get_tracer('webhook')
+event_trace = get_tracer('events')
 
 # =============================================================================
 # CONFIGURACIÓN
@@ -45,9 +63,8 @@ logger = logging.getLogger(__name__)
 BACKEND_DIR = Path(__file__).resolve().parent.parent
 load_dotenv(BACKEND_DIR / '.env')
 
-# Inicializar SDK de Mercado Pago
+# Credenciales de Mercado Pago (el SDK compartido vive en clients.py)
 MP_ACCESS_TOKEN = os.getenv('MP_ACCESS_TOKEN', '')
-sdk = mercadopago.SDK(MP_ACCESS_TOKEN)
 
 # URL del frontend para redirecciones (Railway/Vercel)
 FRONTEND_URL = os.getenv('FRONTEND_URL', 'http://localhost:5173')
@@ -55,9 +72,8 @@ FRONTEND_URL = os.getenv('FRONTEND_URL', 'http://localhost:5173')
 # Modo debug (desactivar en producción)
 DEBUG_MODE = os.getenv('DEBUG', 'False').lower() == 'true'
 
-# Cache simple en memoria para evitar envío duplicado de emails
-# En producción real, usar Redis o similar
-_processed_payments = set()
+# La deduplicación de pagos (evitar envío duplicado de emails) vive en
+# payments/idempotency.py: compartida entre workers y persistente.
 
 
 def is_production_token():
@@ -66,19 +82,209 @@ def is_production_token():
 
 
 def log_payment_event(event_type: str, payment_id: str, details: dict):
-    """Log estructurado para monitoreo en Railway."""
-    log_data = {
-        "event": event_type,
-        "payment_id": payment_id,
-        "production": is_production_token(),
-        **details
-    }
-    logger.info(f"[PAYMENT_EVENT] {json.dumps(log_data)}")
+    """
+    Evento estructurado: queda en el journal local (payments/journal.py)
+    y sale por el tracing para monitoreo en Railway. No bloquea el request.
+    """
+    details = {"production": is_production_token(), **details}
+    record_event(event_type, payment_id, details)
+    event_trace.info(event_type, payment_id=payment_id, **details)
+
+
+def _price_mismatch(client_price, price):
+    try:
+        return round(float(client_price), 2) != price
+    except (TypeError, ValueError):
+        return True
+
+
+def _delivery_message(delivery_status):
+    """Mensaje para el comprador según el estado de la entrega."""
+    if delivery_status == EmailDelivery.STATUS_SENT:
+        return '¡Pago exitoso! Revisá tu email (y la carpeta de spam).'
+    if delivery_status in (EmailDelivery.STATUS_QUEUED, EmailDelivery.STATUS_SENDING):
+        return '¡Pago exitoso! Te estamos enviando el email con tu compra (revisá también la carpeta de spam).'
+    return '¡Pago exitoso! Hubo un problema enviando el email, contactanos a datos.conalex@gmail.com'
 
 
 # =============================================================================
 # CREATE PREFERENCE - Inicia el flujo de pago
 # =============================================================================
+# Las partes sin I/O (validación, armado de la preferencia, respuesta) se
+# comparten con la versión async de views_async.py.
+
+def parse_checkout(request):
+    """
+    Valida el body de create_preference.
+    Retorna (checkout, None) o (None, JsonResponse de error).
+    """
+    try:
+        data = json.loads(request.body)
+    except json.JSONDecodeError:
+        return None, JsonResponse({
+            'success': False, 
+            'error': 'JSON inválido en el request'
+        }, status=400)
+
+    # Validar campos requeridos
+    first_name = data.get('first_name', '').strip()
+    last_name = data.get('last_name', '').strip()
+    document = data.get('document', '').strip()
+    email = data.get('email', '').strip().lower()
+    course_id = data.get('course_id', 'tracker-habitos')
+
+    # Validaciones básicas
+    if not all([first_name, last_name, email]):
+        return None, JsonResponse({
+            'success': False, 
+            'error': 'Faltan datos requeridos (nombre, apellido, email)'
+        }, status=400)
+    
+    if '@' not in email or '.' not in email:
+        return None, JsonResponse({
+            'success': False, 
+            'error': 'Email inválido'
+        }, status=400)
+    
+    product = get_product(course_id)
+    if product is None:
+        return None, JsonResponse({
+            'success': False, 
+            'error': 'Producto inexistente'
+        }, status=400)
+
+    client_price = data.get('price')
+    if client_price is not None and _price_mismatch(client_price, product.price):
+        logger.warning(f"[PREFERENCE] Precio del cliente ignorado para {course_id}: {client_price!r} (catálogo: {product.price})")
+
+    checkout = {
+        'first_name': first_name,
+        'last_name': last_name,
+        'document': document,
+        'email': email,
+        'product': product,
+        # Idempotencia: doble submit o reintento del checkout devuelven la
+        # misma preferencia (ver payments/preference_cache.py)
+        'idempotency_key': request.headers.get('Idempotency-Key', '').strip() or None,
+        'fingerprint': fingerprint(email, product.id, product.price),
+    }
+    return checkout, None
+
+
+def build_preference_data(checkout):
+    """Preferencia de MP para un checkout validado. Retorna (order_id, data)."""
+    product = checkout['product']
+
+    # Generar ID de referencia (timestamp único)
+    temp_order_id = int(time.time() * 1000)  # Milisegundos para mayor unicidad
+
+    preference_data = {
+        "items": [product.mp_item],
+        "back_urls": {
+            "success": f"{FRONTEND_URL}/pago-exitoso",
+            "failure": f"{FRONTEND_URL}/pago-fallido",
+            "pending": f"{FRONTEND_URL}/pago-pendiente",
+        },
+        "auto_return": "approved",
+        "external_reference": str(temp_order_id),
+        "statement_descriptor": "DATOS CON ALEX",
+        "payer": {
+            "name": checkout['first_name'],
+            "surname": checkout['last_name'],
+            "email": checkout['email'],
+            "identification": {
+                "type": "DNI",
+                "number": checkout['document'].replace('.', '').replace('-', '').replace(' ', '')
+            }
+        },
+        # METADATA CRÍTICA - Aquí viajan los datos del cliente
+        "metadata": {
+            "customer_first_name": checkout['first_name'],
+            "customer_last_name": checkout['last_name'],
+            "customer_email": checkout['email'],
+            "course_id": product.id,
+            "course_title": product.title,
+            "price": product.price,
+            "created_at": time.strftime("%Y-%m-%d %H:%M:%S")
+        }
+    }
+
+    # Log de inicio
+    log_payment_event("PREFERENCE_CREATING", str(temp_order_id), {
+        "email": checkout['email'],
+        "course": product.id,
+        "price": product.price,
+        "frontend_url": FRONTEND_URL
+    })
+    return temp_order_id, preference_data
+
+
+def preference_result(checkout, temp_order_id, preference_response):
+    """Respuesta para el frontend a partir de la respuesta de MP."""
+    preference = preference_response.get("response") or {}
+
+    if "id" not in preference:
+        error_msg = preference.get("message", "Error desconocido de Mercado Pago")
+        logger.error(f"[MP_ERROR] create_preference failed: {preference_response}")
+        return {'success': False, 'error': f'Error MP: {error_msg}'}
+
+    product = checkout['product']
+    log_payment_event("PREFERENCE_CREATED", str(temp_order_id), {
+        "preference_id": preference.get('id'),
+        "init_point": (preference.get('init_point') or '')[:50] + "..."
+    })
+    record_preference(
+        temp_order_id, preference.get('id'),
+        {k: checkout[k] for k in ('first_name', 'last_name', 'document', 'email')},
+        product.id, product.title, product.price,
+    )
+
+    # Respuesta exitosa
+    # PRODUCCIÓN: usamos init_point
+    # SANDBOX: usamos sandbox_init_point
+    response_data = {
+        'success': True,
+        'preference_id': preference.get('id'),
+        'order_id': temp_order_id
+    }
+
+    if is_production_token():
+        response_data['init_point'] = preference.get('init_point')
+    else:
+        response_data['init_point'] = preference.get('sandbox_init_point')
+        response_data['sandbox_init_point'] = preference.get('sandbox_init_point')
+    return response_data
+
+
+def preference_json_response(checkout, response_data, reused):
+    if not response_data.get('success'):
+        return JsonResponse(response_data, status=500)
+
+    if reused:
+        log_payment_event("PREFERENCE_REUSED", str(response_data.get('order_id')), {
+            "preference_id": response_data.get('preference_id'),
+            "idempotency_key": bool(checkout['idempotency_key']),
+        })
+    response = JsonResponse(response_data)
+    response['Idempotent-Replayed'] = 'true' if reused else 'false'
+    return response
+
+
+IDEMPOTENCY_KEY_MISMATCH_RESPONSE = {
+    'success': False,
+    'error': 'Idempotency-Key ya usada con otros datos de compra'
+}
+
+
+def mp_unavailable_response(retry_after):
+    """503 con Retry-After: el circuit breaker de MP está abierto."""
+    response = JsonResponse({
+        'success': False,
+        'error': 'Mercado Pago no está respondiendo. Intentá de nuevo en unos minutos.'
+    }, status=503)
+    response['Retry-After'] = str(max(round(retry_after), 1))
+    return response
+
 
 @csrf_exempt
 @require_http_methods(["POST"])
@@ -86,8 +292,8 @@ def create_preference(request):
     """
     Crea un ID de preferencia en Mercado Pago.
     
-    STATELESS: Los datos del cliente se guardan en 'metadata' de MP,
-    no en base de datos local.
+    Los datos del cliente se guardan en 'metadata' de MP y en el ledger
+    local de órdenes.
     
     Request Body:
     {
@@ -95,11 +301,11 @@ def create_preference(request):
         "last_name": "Pérez",
         "document": "12345678",
         "email": "cliente@email.com",
-        "course_id": "tracker-habitos",
-        "title": "Tracker de Hábitos",
-        "price": 1.00,
-        "quantity": 1
+        "course_id": "tracker-habitos"
     }
+
+    Título y precio salen del catálogo del servidor (payments/catalog.py);
+    si el cliente manda `price` y no coincide, se ignora y se loguea.
     
     Response:
     {
@@ -110,129 +316,27 @@ def create_preference(request):
     }
     """
     try:
-        data = json.loads(request.body)
-        
-        # Validar campos requeridos
-        first_name = data.get('first_name', '').strip()
-        last_name = data.get('last_name', '').strip()
-        document = data.get('document', '').strip()
-        email = data.get('email', '').strip().lower()
-        course_id = data.get('course_id', 'tracker-habitos')
-        title = data.get('title', 'Producto Digital')
-        price = float(data.get('price', 0))
-        quantity = int(data.get('quantity', 1))
-
-        # Validaciones básicas
-        if not all([first_name, last_name, email, price]):
-            return JsonResponse({
-                'success': False, 
-                'error': 'Faltan datos requeridos (nombre, apellido, email, precio)'
-            }, status=400)
-        
-        if '@' not in email or '.' not in email:
-            return JsonResponse({
-                'success': False, 
-                'error': 'Email inválido'
-            }, status=400)
-        
-        if price <= 0:
-            return JsonResponse({
-                'success': False, 
-                'error': 'El precio debe ser mayor a 0'
-            }, status=400)
-
-        # Generar ID de referencia (timestamp único)
-        temp_order_id = int(time.time() * 1000)  # Milisegundos para mayor unicidad
-
-        # Construir preferencia de Mercado Pago
-        preference_data = {
-            "items": [
-                {
-                    "id": course_id,
-                    "title": title,
-                    "currency_id": "ARS",
-                    "unit_price": price,
-                    "quantity": quantity,
-                    "description": f"Archivo Excel: {title}",
-                    "category_id": "learnings",
-                }
-            ],
-            "back_urls": {
-                "success": f"{FRONTEND_URL}/pago-exitoso",
-                "failure": f"{FRONTEND_URL}/pago-fallido",
-                "pending": f"{FRONTEND_URL}/pago-pendiente",
-            },
-            "auto_return": "approved",
-            "external_reference": str(temp_order_id),
-            "statement_descriptor": "DATOS CON ALEX",
-            "payer": {
-                "name": first_name,
-                "surname": last_name,
-                "email": email,
-                "identification": {
-                    "type": "DNI",
-                    "number": document.replace('.', '').replace('-', '').replace(' ', '')
-                }
-            },
-            # METADATA CRÍTICA - Aquí viajan los datos del cliente
-            "metadata": {
-                "customer_first_name": first_name,
-                "customer_last_name": last_name,
-                "customer_email": email,
-                "course_id": course_id,
-                "course_title": title,
-                "price": price,
-                "created_at": time.strftime("%Y-%m-%d %H:%M:%S")
-            }
-        }
-        
-        # Log de inicio
-        log_payment_event("PREFERENCE_CREATING", str(temp_order_id), {
-            "email": email,
-            "course": course_id,
-            "price": price,
-            "frontend_url": FRONTEND_URL
-        })
-        
-        # Crear preferencia en MP
-        preference_response = sdk.preference().create(preference_data)
-        preference = preference_response.get("response", {})
-        
-        if "id" not in preference:
-            error_msg = preference_response.get("response", {}).get("message", "Error desconocido de Mercado Pago")
-            logger.error(f"[MP_ERROR] create_preference failed: {preference_response}")
-            return JsonResponse({
-                'success': False, 
-                'error': f'Error MP: {error_msg}'
-            }, status=500)
-        
-        log_payment_event("PREFERENCE_CREATED", str(temp_order_id), {
-            "preference_id": preference.get('id'),
-            "init_point": preference.get('init_point', '')[:50] + "..."
-        })
-            
-        # Respuesta exitosa
-        # PRODUCCIÓN: usamos init_point
-        # SANDBOX: usamos sandbox_init_point
-        response_data = {
-            'success': True,
-            'preference_id': preference.get('id'),
-            'order_id': temp_order_id
-        }
-        
-        if is_production_token():
-            response_data['init_point'] = preference.get('init_point')
-        else:
-            response_data['init_point'] = preference.get('sandbox_init_point')
-            response_data['sandbox_init_point'] = preference.get('sandbox_init_point')
-            
-        return JsonResponse(response_data)
-        
-    except json.JSONDecodeError:
-        return JsonResponse({
-            'success': False, 
-            'error': 'JSON inválido en el request'
-        }, status=400)
+        with metrics.stage_timer('request_parse'):
+            checkout, error_response = parse_checkout(request)
+        if error_response is not None:
+            return error_response
+
+        def create_at_mp():
+            temp_order_id, preference_data = build_preference_data(checkout)
+            return preference_result(checkout, temp_order_id, mp_preference_create(preference_data))
+
+        try:
+            response_data, reused = get_or_create_preference(
+                checkout['fingerprint'], checkout['idempotency_key'], create_at_mp,
+            )
+        except IdempotencyKeyMismatch:
+            return JsonResponse(IDEMPOTENCY_KEY_MISMATCH_RESPONSE, status=422)
+        except CircuitOpenError as e:
+            logger.warning(f"[PREFERENCE] {e}")
+            return mp_unavailable_response(e.retry_after)
+
+        return preference_json_response(checkout, response_data, reused)
+
     except Exception as e:
         logger.exception("[CRITICAL] Error en create_preference")
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
@@ -242,211 +346,181 @@ def create_preference(request):
 # PAGO EXITOSO - Validación por redirección (usuario presente)
 # =============================================================================
 
+def get_validate_payment_id(request):
+    """payment_id de los parámetros del redirect de MP (o None)."""
+    validate_trace.debug('request_received', query=lambda: dict(request.GET))
+    payment_id = request.GET.get('payment_id') or request.GET.get('collection_id')
+    if not payment_id:
+        validate_trace.warning('missing_payment_id')
+        return None
+    validate_trace.info('request_started', payment_id=payment_id)
+    return payment_id
+
+
+MISSING_PAYMENT_ID_RESPONSE = {
+    'success': False, 
+    'error': 'Falta payment_id en la URL'
+}
+
+
+def validate_response(payment_id, result):
+    """Respuesta de pago_exitoso según el resultado de process_payment."""
+    outcome = result['outcome']
+    status = result.get('status')
+
+    if outcome == 'mp_error':
+        return JsonResponse({
+            'success': False, 
+            'error': 'Error al consultar el pago con Mercado Pago'
+        }, status=502)
+    
+    if outcome == 'mp_exception':
+        return JsonResponse({
+            'success': False, 
+            'error': 'Error de conexión con Mercado Pago'
+        }, status=502)
+
+    if outcome == 'mp_unavailable':
+        if not result.get('deferred'):
+            return mp_unavailable_response(result['retry_after'])
+        # El pago quedó en el inbox: el email sale cuando MP vuelva
+        return JsonResponse({
+            'success': False,
+            'status': 'pending',
+            'payment_id': payment_id,
+            'deferred': True,
+            'message': 'Estamos confirmando tu pago con Mercado Pago. Si fue aprobado, '
+                       'vas a recibir el email en unos minutos.'
+        }, status=202)
+
+    # Solo procesamos pagos APROBADOS
+    if outcome == 'already_processed':
+        return JsonResponse({
+            'success': True,
+            'status': 'approved',
+            'payment_id': payment_id,
+            'email_sent': result['delivery_status'] == EmailDelivery.STATUS_SENT,
+            'delivery_status': result['delivery_status'],
+            'message': _delivery_message(result['delivery_status'])
+        })
+    
+    if outcome == 'no_customer_email':
+        return JsonResponse({
+            'success': True,
+            'status': 'approved',
+            'payment_id': payment_id,
+            'email_sent': False,
+            'email_error': 'No se encontró el email del cliente en la metadata',
+            'message': '¡Pago exitoso! Pero no pudimos enviar el email. Contactanos a datos.conalex@gmail.com'
+        })
+    
+    if outcome in ('queued', 'enqueue_failed'):
+        delivery_status = result.get('delivery_status')
+        validate_trace.info('request_finished', payment_id=payment_id, outcome=outcome,
+                            delivery_status=delivery_status)
+
+        return JsonResponse({
+            'success': True,
+            'status': 'approved',
+            'payment_id': payment_id,
+            'email_sent': delivery_status == EmailDelivery.STATUS_SENT,
+            'delivery_status': delivery_status,
+            'email_error': result.get('error'),
+            'customer_email': result.get('customer_email', '')[:3] + "***",
+            'message': _delivery_message(delivery_status)
+        })
+    
+    validate_trace.info('request_finished', payment_id=payment_id, outcome=outcome, status=status)
+    if status == 'pending':
+        return JsonResponse({
+            'success': False,
+            'status': 'pending',
+            'message': 'Tu pago está pendiente de acreditación. Te avisaremos cuando se confirme.'
+        })
+    
+    elif status == 'in_process':
+        return JsonResponse({
+            'success': False,
+            'status': 'in_process',
+            'message': 'Tu pago está siendo procesado. Recibirás el producto una vez se confirme.'
+        })
+    
+    else:
+        return JsonResponse({
+            'success': False, 
+            'status': status,
+            'message': f'El pago no fue aprobado. Estado: {status}'
+        })
+
+
 @csrf_exempt
 @require_http_methods(["GET"])
 def pago_exitoso(request):
     """
-    Valida el pago consultando a MP y envía el email.
+    Valida el pago consultando a MP y encola el email en el outbox.
     MÉTODO PRIMARIO de entrega. El webhook es backup.
     """
-    print("=" * 80)
-    print("[VALIDATE] ========== INICIO pago_exitoso ==========")
-    print(f"[VALIDATE] Query params: {dict(request.GET)}")
-    logger.info(f"[VALIDATE] ========== INICIO pago_exitoso ==========")
-    
     try:
-        # Obtener payment_id de los parámetros
-        payment_id = request.GET.get('payment_id') or request.GET.get('collection_id')
-        
+        payment_id = get_validate_payment_id(request)
         if not payment_id:
-            print("[VALIDATE] ❌ ERROR: No hay payment_id en los parámetros")
-            logger.warning("[VALIDATE] Llamada sin payment_id")
-            return JsonResponse({
-                'success': False, 
-                'error': 'Falta payment_id en la URL'
-            }, status=400)
-        
-        print(f"[VALIDATE] ✅ payment_id recibido: {payment_id}")
-        logger.info(f"[VALIDATE] payment_id: {payment_id}")
-        
-        # Consultar a Mercado Pago para obtener datos REALES del pago
-        print(f"[VALIDATE] Consultando MP API para payment {payment_id}...")
-        try:
-            payment_response = sdk.payment().get(payment_id)
-            mp_http_status = payment_response.get("status")
-            print(f"[VALIDATE] MP API respondió HTTP status: {mp_http_status}")
-            
-            if mp_http_status != 200:
-                print(f"[VALIDATE] ❌ ERROR: MP devolvió status {mp_http_status}")
-                print(f"[VALIDATE] Respuesta completa de MP: {json.dumps(payment_response, default=str)[:500]}")
-                logger.error(f"[MP_ERROR] get payment {payment_id}: {payment_response}")
-                return JsonResponse({
-                    'success': False, 
-                    'error': 'Error al consultar el pago con Mercado Pago'
-                }, status=502)
-            
-            payment_data = payment_response.get("response", {})
-            status = payment_data.get("status")
-            status_detail = payment_data.get("status_detail", "N/A")
-            amount = payment_data.get("transaction_amount")
-            
-            # Extraer metadata (MP convierte keys a snake_case)
-            metadata = payment_data.get("metadata", {})
-            
-            print(f"[VALIDATE] ✅ Datos del pago obtenidos de MP:")
-            print(f"[VALIDATE]    status         = {status}")
-            print(f"[VALIDATE]    status_detail  = {status_detail}")
-            print(f"[VALIDATE]    amount         = {amount}")
-            print(f"[VALIDATE]    metadata keys  = {list(metadata.keys())}")
-            print(f"[VALIDATE]    metadata       = {json.dumps(metadata, default=str)}")
-            logger.info(f"[VALIDATE] Payment {payment_id}: status={status}, amount={amount}, metadata_keys={list(metadata.keys())}")
-            
-        except Exception as e:
-            print(f"[VALIDATE] ❌ EXCEPCIÓN consultando MP: {type(e).__name__}: {e}")
-            logger.exception(f"[CRITICAL] Error recuperando pago {payment_id}")
-            return JsonResponse({
-                'success': False, 
-                'error': 'Error de conexión con Mercado Pago'
-            }, status=502)
-
-        # Solo procesamos pagos APROBADOS
-        if status == 'approved':
-            print(f"[VALIDATE] ✅ Pago APROBADO - procesando envío de email...")
-            
-            # Verificar si ya procesamos este pago (evitar doble envío)
-            if payment_id in _processed_payments:
-                print(f"[VALIDATE] ⚠️ Payment {payment_id} YA FUE PROCESADO anteriormente (skip)")
-                logger.info(f"[SKIP] Payment {payment_id} ya fue procesado")
-                return JsonResponse({
-                    'success': True,
-                    'status': 'approved',
-                    'payment_id': payment_id,
-                    'email_sent': True,
-                    'message': '¡Pago exitoso! El email ya fue enviado anteriormente.'
-                })
-            
-            # Construir objeto order para el servicio de email
-            customer_email = metadata.get("customer_email", "")
-            customer_name = metadata.get("customer_first_name", "Cliente")
-            course_id = metadata.get("course_id", "tracker-habitos")
-            course_title = metadata.get("course_title", "Producto Digital")
-            
-            print(f"[VALIDATE] Datos del cliente extraídos de metadata:")
-            print(f"[VALIDATE]    customer_email = '{customer_email}'")
-            print(f"[VALIDATE]    customer_name  = '{customer_name}'")
-            print(f"[VALIDATE]    course_id      = '{course_id}'")
-            print(f"[VALIDATE]    course_title   = '{course_title}'")
-            
-            # Validar que tenemos email del cliente
-            if not customer_email:
-                print(f"[VALIDATE] ❌ ERROR: No hay customer_email en metadata!")
-                print(f"[VALIDATE]    Metadata completa: {json.dumps(metadata, default=str)}")
-                logger.error(f"[ERROR] No hay email en metadata para payment {payment_id}")
-                return JsonResponse({
-                    'success': True,
-                    'status': 'approved',
-                    'payment_id': payment_id,
-                    'email_sent': False,
-                    'email_error': 'No se encontró el email del cliente en la metadata',
-                    'message': '¡Pago exitoso! Pero no pudimos enviar el email. Contactanos a datos.conalex@gmail.com'
-                })
-            
-            fake_order = SimpleNamespace(
-                id=payment_data.get("external_reference", payment_id),
-                first_name=customer_name,
-                email=customer_email,
-                course_title=course_title,
-                course_id=course_id,
-                price=metadata.get("price", amount or 0),
-                status=status
-            )
-            
-            # Enviar email con producto
-            email_sent = False
-            email_error = None
-            
-            try:
-                print(f"[VALIDATE] 📧 Llamando a send_product_email()...")
-                print(f"[VALIDATE]    → to: {fake_order.email}")
-                print(f"[VALIDATE]    → product: {fake_order.course_id}")
-                print(f"[VALIDATE]    → name: {fake_order.first_name}")
-                logger.info(f"[EMAIL] Enviando a {fake_order.email} - Producto: {fake_order.course_id}")
-                
-                email_sent = send_product_email(fake_order)
-                
-                print(f"[VALIDATE] 📧 send_product_email() retornó: {email_sent}")
-                
-                if email_sent:
-                    _processed_payments.add(payment_id)
-                    print(f"[VALIDATE] ✅ EMAIL ENVIADO EXITOSAMENTE")
-                    logger.info(f"[EMAIL_SENT_SUCCESS] Payment {payment_id} → {fake_order.email}")
-                else:
-                    print(f"[VALIDATE] ❌ send_product_email retornó False - EMAIL NO ENVIADO")
-                    logger.error(f"[EMAIL_SENT_FAILED] Payment {payment_id} → {fake_order.email}")
-                    
-            except Exception as email_ex:
-                email_error = str(email_ex)
-                print(f"[VALIDATE] ❌ EXCEPCIÓN en send_product_email: {type(email_ex).__name__}: {email_error}")
-                logger.error(f"[CRITICAL] Email error for {payment_id}: {email_error}")
-            
-            print(f"[VALIDATE] ========== FIN pago_exitoso (email_sent={email_sent}) ==========")
-            print("=" * 80)
-            
-            return JsonResponse({
-                'success': True,
-                'status': 'approved',
-                'payment_id': payment_id,
-                'email_sent': email_sent,
-                'email_error': email_error,
-                'customer_email': customer_email[:3] + "***",
-                'message': '¡Pago exitoso! Revisá tu email (y la carpeta de spam).' if email_sent 
-                          else '¡Pago exitoso! Hubo un problema enviando el email, contactanos a datos.conalex@gmail.com'
-            })
-        
-        elif status == 'pending':
-            print(f"[VALIDATE] ⏳ Pago PENDIENTE - no se envía email")
-            return JsonResponse({
-                'success': False,
-                'status': 'pending',
-                'message': 'Tu pago está pendiente de acreditación. Te avisaremos cuando se confirme.'
-            })
-        
-        elif status == 'in_process':
-            print(f"[VALIDATE] ⏳ Pago EN PROCESO - no se envía email")
-            return JsonResponse({
-                'success': False,
-                'status': 'in_process',
-                'message': 'Tu pago está siendo procesado. Recibirás el producto una vez se confirme.'
-            })
-        
-        else:
-            print(f"[VALIDATE] ❌ Pago NO aprobado. Status: {status}")
-            return JsonResponse({
-                'success': False, 
-                'status': status,
-                'message': f'El pago no fue aprobado. Estado: {status}'
-            })
+            return JsonResponse(MISSING_PAYMENT_ID_RESPONSE, status=400)
+
+        # Consultar a MP y encolar el email (single-flight por payment_id:
+        # si el webhook llega a la vez, comparte este mismo resultado)
+        result = process_payment(payment_id, source='validate')
+        return validate_response(payment_id, result)
 
     except Exception as e:
-        print(f"[VALIDATE] ❌ EXCEPCIÓN GENERAL: {type(e).__name__}: {e}")
-        logger.exception("[CRITICAL] Error en pago_exitoso")
+        validate_trace.exception('request_failed', error=f"{type(e).__name__}: {e}")
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
 
 # =============================================================================
-# DOWNLOAD FILE - Legacy endpoint
+# DELIVERY STATUS - Estado de la entrega por email (outbox)
 # =============================================================================
 
 @csrf_exempt
 @require_http_methods(["GET"])
-def download_file(request, order_id):
+def delivery_status(request):
     """
-    Endpoint legacy - No funciona en arquitectura stateless.
-    Los archivos se entregan por email.
+    Estado de la entrega de un pago: queued, sending, sent o failed.
+    GET /api/payments/delivery-status/?payment_id=xxx
     """
+    payment_id = request.GET.get('payment_id') or request.GET.get('collection_id')
+    if not payment_id:
+        return JsonResponse({'success': False, 'error': 'Falta payment_id en la URL'}, status=400)
+
+    delivery = get_delivery(payment_id)
+    if delivery is None:
+        return JsonResponse({'success': False, 'payment_id': payment_id, 'delivery_status': None}, status=404)
+
     return JsonResponse({
-        'error': 'Este endpoint ya no está disponible. El archivo fue enviado a tu email.'
-    }, status=410)
+        'success': True,
+        'payment_id': payment_id,
+        'delivery_status': delivery.status,
+        'email_sent': delivery.status == EmailDelivery.STATUS_SENT,
+        'attempts': delivery.attempts,
+        'customer_email': delivery.email[:3] + "***",
+        'sent_at': delivery.sent_at.isoformat() if delivery.sent_at else None,
+        'message': _delivery_message(delivery.status)
+    })
+
+
+# =============================================================================
+# DOWNLOAD FILE - Links firmados del email (payments/downloads.py)
+# =============================================================================
+
+@csrf_exempt
+@require_http_methods(["GET", "HEAD"])
+def download_file(request, token, filename):
+    """
+    Descarga un archivo comprado con el link firmado que llegó por email.
+    GET /api/payments/download/<token>/<archivo>
+
+    Soporta Range (reanudar descargas), ETag / Last-Modified (304) y un
+    tope opcional de descargas por link.
+    """
+    return handle_download(request, token, filename)
 
 
 # =============================================================================
@@ -459,187 +533,32 @@ def webhook(request):
     """
     Webhook de Mercado Pago - FUENTE DE VERDAD para notificaciones.
     Backup cuando pago_exitoso no se ejecuta.
-    SIEMPRE responde 200 OK para que MP no reintente.
+    
+    Fast-ack: solo guarda la notificación cruda en el inbox y responde 200.
+    El consumidor de payments/inbox.py consulta a MP y encola el email.
+    Antes, payments/webhook_guard.py descarta firmas inválidas, payloads mal
+    formados, notificaciones que no son de pagos y repetidas.
     """
     # GET request = MP verificando que el webhook existe
     if request.method == 'GET':
         return JsonResponse({'status': 'webhook active', 'production': is_production_token()})
     
-    print("=" * 80)
-    print("[WEBHOOK] ========== NOTIFICACIÓN RECIBIDA ==========")
-    logger.info("[WEBHOOK] ========== NOTIFICACIÓN RECIBIDA ==========")
-    
+    # Firma, forma del payload e ids recientes: sin I/O, antes de tocar el inbox
+    with metrics.stage_timer('request_parse'):
+        check = check_notification(request)
+    if not check.accepted:
+        # debug: un flood de basura no debe convertirse en un flood de logs
+        webhook_trace.debug('notification_filtered', reason=check.reason, status=check.status)
+        return JsonResponse(check.response_body(), status=check.status)
+
     try:
-        # 1. PARSEAR BODY
-        raw_body = request.body.decode('utf-8', errors='replace') if request.body else '{}'
-        print(f"[WEBHOOK] PASO 1 - Raw body recibido: {raw_body[:1000]}")
-        logger.info(f"[WEBHOOK] Raw body: {raw_body[:500]}")
-        
-        try:
-            body = json.loads(request.body) if request.body else {}
-        except json.JSONDecodeError as jde:
-            print(f"[WEBHOOK] ❌ ERROR parseando JSON: {jde}")
-            body = {}
-        
-        # 2. IDENTIFICAR TIPO DE NOTIFICACIÓN
-        notification_type = body.get('type', 'unknown')
-        action = body.get('action', 'unknown')
-        
-        print(f"[WEBHOOK] PASO 2 - Tipo de notificación:")
-        print(f"[WEBHOOK]    type   = '{notification_type}'")
-        print(f"[WEBHOOK]    action = '{action}'")
-        print(f"[WEBHOOK]    keys   = {list(body.keys())}")
-        logger.info(f"[WEBHOOK] type={notification_type}, action={action}")
-        
-        # Solo procesamos notificaciones de pago
-        if notification_type != 'payment':
-            print(f"[WEBHOOK] ⚠️ Ignorando - no es tipo 'payment' (es '{notification_type}')")
-            logger.info(f"[WEBHOOK] Ignorando notificación tipo: {notification_type}")
-            return JsonResponse({'status': 'ignored', 'reason': 'not a payment notification'})
-        
-        # 3. EXTRAER PAYMENT_ID
-        data = body.get('data', {})
-        payment_id = data.get('id') or body.get('data.id')
-        
-        print(f"[WEBHOOK] PASO 3 - Extracción de payment_id:")
-        print(f"[WEBHOOK]    body['data']      = {data}")
-        print(f"[WEBHOOK]    payment_id        = {payment_id}")
-        
-        if not payment_id:
-            print("[WEBHOOK] ❌ ERROR: No se pudo extraer payment_id")
-            logger.warning("[WEBHOOK] No payment_id en la notificación")
-            return JsonResponse({'status': 'ignored', 'reason': 'no payment_id'})
-        
-        payment_id = str(payment_id)
-        print(f"[WEBHOOK] ✅ payment_id: {payment_id}")
-        
-        # 4. CHECK DUPLICADOS
-        if payment_id in _processed_payments:
-            print(f"[WEBHOOK] ⚠️ Payment {payment_id} YA PROCESADO (en caché). Skip.")
-            logger.info(f"[WEBHOOK] Payment {payment_id} ya procesado, skipping")
-            return JsonResponse({'status': 'already_processed'})
-        
-        print(f"[WEBHOOK] PASO 4 - Payment {payment_id} NO está en caché. Procesando...")
-        
-        # 5. CONSULTAR DETALLES DEL PAGO A MP
-        print(f"[WEBHOOK] PASO 5 - Consultando MP API sdk.payment().get({payment_id})...")
-        try:
-            payment_response = sdk.payment().get(payment_id)
-            mp_http_status = payment_response.get("status")
-            
-            print(f"[WEBHOOK]    MP API HTTP status: {mp_http_status}")
-            
-            if mp_http_status != 200:
-                print(f"[WEBHOOK] ❌ ERROR: MP devolvió HTTP {mp_http_status}")
-                print(f"[WEBHOOK]    Respuesta: {json.dumps(payment_response, default=str)[:500]}")
-                logger.error(f"[WEBHOOK] Error obteniendo pago {payment_id}: {payment_response}")
-                return JsonResponse({'status': 'error', 'reason': 'mp_api_error'}, status=200)
-            
-            payment_data = payment_response.get("response", {})
-            status = payment_data.get("status")
-            status_detail = payment_data.get("status_detail", "N/A")
-            amount = payment_data.get("transaction_amount")
-            metadata = payment_data.get("metadata", {})
-            
-            print(f"[WEBHOOK] ✅ Datos del pago obtenidos de MP:")
-            print(f"[WEBHOOK]    status         = '{status}'")
-            print(f"[WEBHOOK]    status_detail  = '{status_detail}'")
-            print(f"[WEBHOOK]    amount         = {amount}")
-            print(f"[WEBHOOK]    metadata keys  = {list(metadata.keys())}")
-            print(f"[WEBHOOK]    metadata FULL  = {json.dumps(metadata, default=str)}")
-            logger.info(f"[WEBHOOK] Payment {payment_id}: status={status}, amount={amount}")
-            
-        except Exception as e:
-            print(f"[WEBHOOK] ❌ EXCEPCIÓN consultando MP: {type(e).__name__}: {e}")
-            logger.exception(f"[WEBHOOK] Error consultando MP para {payment_id}")
-            return JsonResponse({'status': 'error', 'reason': str(e)}, status=200)
-        
-        # 6. VERIFICAR APROBACIÓN
-        if status != 'approved':
-            print(f"[WEBHOOK] ⚠️ Pago NO aprobado (status='{status}'). No se envía email.")
-            logger.info(f"[WEBHOOK] Payment {payment_id} status={status}, no action needed")
-            return JsonResponse({'status': 'noted', 'payment_status': status})
-        
-        print(f"[WEBHOOK] ✅ PASO 6 - Pago APROBADO. Preparando envío de email...")
-        
-        # 7. EXTRAER DATOS DEL CLIENTE DE METADATA
-        customer_email = metadata.get("customer_email", "")
-        customer_name = metadata.get("customer_first_name", "Cliente")
-        course_id = metadata.get("course_id", "tracker-habitos")
-        course_title = metadata.get("course_title", "Producto Digital")
-        
-        print(f"[WEBHOOK] PASO 7 - Datos del cliente de metadata:")
-        print(f"[WEBHOOK]    customer_email = '{customer_email}'")
-        print(f"[WEBHOOK]    customer_name  = '{customer_name}'")
-        print(f"[WEBHOOK]    course_id      = '{course_id}'")
-        print(f"[WEBHOOK]    course_title   = '{course_title}'")
-        
-        if not customer_email:
-            print(f"[WEBHOOK] ❌ ERROR: No hay customer_email en metadata!")
-            print(f"[WEBHOOK]    metadata completa: {json.dumps(metadata, default=str)}")
-            logger.error(f"[WEBHOOK] No email en metadata para {payment_id}")
-            return JsonResponse({
-                'status': 'error', 
-                'reason': 'no_customer_email',
-                'action': 'manual_intervention_required'
-            }, status=200)
-        
-        # 8. CONSTRUIR ORDEN Y ENVIAR EMAIL
-        fake_order = SimpleNamespace(
-            id=payment_data.get("external_reference", payment_id),
-            first_name=customer_name,
-            email=customer_email,
-            course_title=course_title,
-            course_id=course_id,
-            price=metadata.get("price", amount or 0),
-            status=status
-        )
-        
-        print(f"[WEBHOOK] PASO 8 - fake_order construido:")
-        print(f"[WEBHOOK]    id     = {fake_order.id}")
-        print(f"[WEBHOOK]    email  = {fake_order.email}")
-        print(f"[WEBHOOK]    course = {fake_order.course_id}")
-        
-        try:
-            print(f"[WEBHOOK] 📧 Llamando a send_product_email()...")
-            logger.info(f"[WEBHOOK] Enviando email a {customer_email} para payment {payment_id}")
-            
-            email_sent = send_product_email(fake_order)
-            
-            print(f"[WEBHOOK] 📧 send_product_email() retornó: {email_sent}")
-            
-            if email_sent:
-                _processed_payments.add(payment_id)
-                print(f"[WEBHOOK] ✅ ¡EMAIL ENVIADO EXITOSAMENTE!")
-                print(f"[WEBHOOK] ========== FIN WEBHOOK (éxito) ==========")
-                print("=" * 80)
-                logger.info(f"[WEBHOOK_EMAIL_SUCCESS] {payment_id} → {customer_email}")
-                return JsonResponse({'status': 'processed', 'email_sent': True})
-            else:
-                print(f"[WEBHOOK] ❌ send_product_email retornó False - REVISAR LOGS DE services.py")
-                print(f"[WEBHOOK] ========== FIN WEBHOOK (email falló) ==========")
-                print("=" * 80)
-                logger.error(f"[WEBHOOK_EMAIL_FAILED] {payment_id} → {customer_email}")
-                return JsonResponse({'status': 'processed', 'email_sent': False})
-                
-        except Exception as e:
-            print(f"[WEBHOOK] ❌ EXCEPCIÓN en send_product_email: {type(e).__name__}: {e}")
-            import traceback
-            print(f"[WEBHOOK] Traceback:\n{traceback.format_exc()}")
-            print(f"[WEBHOOK] ========== FIN WEBHOOK (excepción) ==========")
-            print("=" * 80)
-            logger.exception(f"[WEBHOOK] Error enviando email para {payment_id}")
-            return JsonResponse({
-                'status': 'error', 
-                'reason': 'email_failed',
-                'error': str(e)
-            }, status=200)
-        
+        with timing.span('inbox_store'):
+            notification = store_notification(request)
     except Exception as e:
-        print(f"[WEBHOOK] ❌ EXCEPCIÓN GENERAL: {type(e).__name__}: {e}")
-        import traceback
-        print(f"[WEBHOOK] Traceback:\n{traceback.format_exc()}")
-        print("=" * 80)
-        logger.exception("[CRITICAL] Error general en webhook")
-        # SIEMPRE responder 200 para que MP no reintente
-        return JsonResponse({'status': 'error', 'reason': str(e)}, status=200)
+        webhook_trace.exception('notification_store_failed', error=f"{type(e).__name__}: {e}")
+        # Sin guardarla la perderíamos: pedir a MP que reintente
+        return JsonResponse({'status': 'error', 'reason': 'inbox_unavailable'}, status=500)
+    
+    remember(check)
+    webhook_trace.info('notification_stored', notification_id=notification.id, size=len(notification.raw_body))
+    return JsonResponse({'status': 'received', 'notification_id': notification.id})
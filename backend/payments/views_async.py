@@ -0,0 +1,122 @@
+"""
+Vistas async de pagos (ASGI) - Datos con Alex
+==============================================
+Las mismas rutas que views.py para cuando el backend corre detrás de
+config/asgi.py (PAYMENTS_ASYNC_VIEWS=true). Mientras se espera a Mercado
+Pago el worker sigue atendiendo otros requests, en vez de tener un thread
+bloqueado por cada consulta en vuelo.
+
+- create_preference: crea la preferencia con el cliente httpx
+- pago_exitoso: consulta el pago con el cliente httpx; el resto del
+  procesamiento (idempotencia, outbox) corre en un thread
+- webhook: guarda la notificación en el inbox con el ORM async
+
+Validaciones, respuestas y eventos son los de views.py (mismos helpers):
+el contrato con el frontend y con MP no cambia.
+==============================================
+"""
+
+import logging
+
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+
+from . import metrics, timing
+from .async_clients import amp_preference_create
+from .inbox import astore_notification
+from .preference_cache import IdempotencyKeyMismatch, aget_or_create_preference
+from .processing import aprocess_payment
+from .resilience import CircuitOpenError
+from .views import (
+    IDEMPOTENCY_KEY_MISMATCH_RESPONSE,
+    MISSING_PAYMENT_ID_RESPONSE,
+    build_preference_data,
+    get_validate_payment_id,
+    is_production_token,
+    mp_unavailable_response,
+    parse_checkout,
+    preference_json_response,
+    preference_result,
+    validate_response,
+    validate_trace,
+    webhook_trace,
+)
+from .webhook_guard import check_notification, remember
+
+logger = logging.getLogger(__name__)
+
+
+@csrf_exempt
+@require_http_methods(["POST"])
+async def create_preference(request):
+    """Versión async de views.create_preference."""
+    try:
+        with metrics.stage_timer('request_parse'):
+            checkout, error_response = parse_checkout(request)
+        if error_response is not None:
+            return error_response
+
+        async def create_at_mp():
+            temp_order_id, preference_data = build_preference_data(checkout)
+            return preference_result(checkout, temp_order_id, await amp_preference_create(preference_data))
+
+        try:
+            response_data, reused = await aget_or_create_preference(
+                checkout['fingerprint'], checkout['idempotency_key'], create_at_mp,
+            )
+        except IdempotencyKeyMismatch:
+            return JsonResponse(IDEMPOTENCY_KEY_MISMATCH_RESPONSE, status=422)
+        except CircuitOpenError as e:
+            logger.warning(f"[PREFERENCE] {e}")
+            return mp_unavailable_response(e.retry_after)
+
+        return preference_json_response(checkout, response_data, reused)
+
+    except Exception as e:
+        logger.exception("[CRITICAL] Error en create_preference (async)")
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["GET"])
+async def pago_exitoso(request):
+    """Versión async de views.pago_exitoso."""
+    try:
+        payment_id = get_validate_payment_id(request)
+        if not payment_id:
+            return JsonResponse(MISSING_PAYMENT_ID_RESPONSE, status=400)
+
+        result = await aprocess_payment(payment_id, source='validate')
+        return validate_response(payment_id, result)
+
+    except Exception as e:
+        validate_trace.exception('request_failed', error=f"{type(e).__name__}: {e}")
+        return JsonResponse({'success': False, 'error': str(e)}, status=500)
+
+
+@csrf_exempt
+@require_http_methods(["POST", "GET"])
+async def webhook(request):
+    """Versión async de views.webhook (fast-ack al inbox)."""
+    if request.method == 'GET':
+        return JsonResponse({'status': 'webhook active', 'production': is_production_token()})
+
+    # Firma, forma del payload e ids recientes: sin I/O, antes de tocar el inbox
+    with metrics.stage_timer('request_parse'):
+        check = check_notification(request)
+    if not check.accepted:
+        # debug: un flood de basura no debe convertirse en un flood de logs
+        webhook_trace.debug('notification_filtered', reason=check.reason, status=check.status)
+        return JsonResponse(check.response_body(), status=check.status)
+
+    try:
+        with timing.span('inbox_store'):
+            notification = await astore_notification(request)
+    except Exception as e:
+        webhook_trace.exception('notification_store_failed', error=f"{type(e).__name__}: {e}")
+        return JsonResponse({'status': 'error', 'reason': 'inbox_unavailable'}, status=500)
+
+    remember(check)
+    webhook_trace.info('notification_stored', notification_id=notification.id, size=len(notification.raw_body))
+    return JsonResponse({'status': 'received', 'notification_id': notification.id})
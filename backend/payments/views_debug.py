@@ -7,15 +7,34 @@ IMPORTANTE: En producción, considerar restringir acceso a estos endpoints.
 ==========================================================
 """
 
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse
 from django.conf import settings
 from django.core.mail import EmailMessage
+import hmac
+import ipaddress
 import os
 import logging
 from types import SimpleNamespace
 from typing import Any
 
-from .services import test_email_connection, list_available_products, validate_product_files
+from .bundles import bundle_stats
+from .downloads import downloads_stats
+from .emails import email_template_stats
+from .idempotency import get_idempotency_store
+from .inbox import inbox_stats
+from .journal import journal_stats
+from .ledger import ledger_stats
+from .metrics import get_metrics_config, metrics_enabled, metrics_stats, render as render_metrics
+from .outbox import outbox_stats
+from .payment_cache import payment_cache_stats
+from .preference_cache import preference_cache_stats
+from .processing import singleflight_stats
+from .resilience import breaker_stats
+from .tracing import tracing_stats
+from .webhook_guard import webhook_guard_stats
+from .services import (
+    test_email_connection, list_available_products, validate_product_files, attachment_cache_stats,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -145,6 +164,50 @@ def test_email(request) -> JsonResponse:
         }, status=500)
 
 
+def _metrics_authorized(request, config: dict[str, Any]) -> bool:
+    """Bearer token o IP permitida; sin ninguno configurado, solo con DEBUG."""
+    token, allowed_ips = config['token'], config['allowed_ips']
+    if not token and not allowed_ips:
+        return settings.DEBUG
+    if token:
+        scheme, _, presented = request.headers.get('Authorization', '').partition(' ')
+        if scheme.lower() == 'bearer' and hmac.compare_digest(presented.strip().encode(), token.encode()):
+            return True
+    if allowed_ips:
+        # REMOTE_ADDR: X-Forwarded-For lo puede poner cualquiera
+        try:
+            client = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+        except ValueError:
+            return False
+        for network in allowed_ips:
+            try:
+                if client in ipaddress.ip_network(network, strict=False):
+                    return True
+            except ValueError:
+                logger.warning(f"[METRICS] METRICS_ALLOWED_IPS: red inválida {network!r}")
+    return False
+
+
+def metrics(request) -> HttpResponse:
+    """
+    Métricas de todos los workers en formato de texto de Prometheus.
+    GET /api/payments/metrics/
+
+    Requiere `Authorization: Bearer <METRICS_TOKEN>` o una IP de
+    METRICS_ALLOWED_IPS (sin ninguno configurado, solo responde con DEBUG).
+    """
+    if not metrics_enabled():
+        raise Http404("Métricas desactivadas (METRICS_ENABLED=false)")
+    config = get_metrics_config()
+    if not _metrics_authorized(request, config):
+        logger.warning(f"[METRICS] Acceso denegado desde {request.META.get('REMOTE_ADDR', '?')}")
+        response = JsonResponse({"status": "forbidden"}, status=401 if config['token'] else 403)
+        if config['token']:
+            response['WWW-Authenticate'] = 'Bearer'
+        return response
+    return HttpResponse(render_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 def system_status(request) -> JsonResponse:
     """
     Estado completo del sistema.
@@ -181,5 +244,23 @@ def system_status(request) -> JsonResponse:
         "email_service": "Brevo API (HTTPS)",
         "checks": checks,
         "products": products,
+        "outbox": outbox_stats(),
+        "webhook_inbox": inbox_stats(),
+        "webhook_guard": webhook_guard_stats(),
+        "circuit_breakers": breaker_stats(),
+        "order_ledger": ledger_stats(),
+        "journal": journal_stats(),
+        "email_templates": email_template_stats(),
+        "downloads": downloads_stats(),
+        "bundles": bundle_stats(),
+        "caches": {
+            "attachments": attachment_cache_stats(),
+            "idempotency": get_idempotency_store().stats(),
+            "singleflight": singleflight_stats(),
+            "payment_status": payment_cache_stats(),
+            "preferences": preference_cache_stats(),
+        },
+        "tracing": tracing_stats(),
+        "metrics": metrics_stats(),
         "recommendation": "🚀 Sistema listo para producción" if all_ok else "⚠️ Revisar checks fallidos"
     })
@@ -0,0 +1,260 @@
+"""
+Filtro previo del webhook de Mercado Pago - Datos con Alex
+===========================================================
+Antes de guardar una notificación en el inbox (y de que el consumidor
+consulte el pago a MP) se descarta lo que no vale la pena, en este orden
+(de lo más barato a lo más caro):
+
+1. Body demasiado grande: un Content-Length mayor a `max_body_bytes` se
+   rechaza sin leer el body. Sin Content-Length (chunked, ASGI) se lee
+   hasta DATA_UPLOAD_MAX_MEMORY_SIZE (lo corta Django) y se mide lo leído
+2. Body que no es JSON o no es un objeto
+3. Firma `x-signature` inválida: HMAC-SHA256 con la clave secreta de la
+   app en MP sobre `id:<data.id>;request-id:<x-request-id>;ts:<ts>;`,
+   comparado en tiempo constante. Opcionalmente, `ts` demasiado viejo.
+   El IPN legacy (`?topic=payment&id=...`) no viene firmado: se rechaza,
+   salvo con `legacy_ipn` activo (opt-in), que entra al inbox como no
+   verificado
+4. Notificaciones que no son de un pago (se responde 200: MP no reintenta)
+5. payment_id ausente o no numérico
+6. La misma notificación repetida en los últimos minutos (filtro de ids
+   recientes por proceso; el inbox deduplica de todas formas). El IPN
+   legacy no trae id de notificación: se filtra por payment_id
+
+Nada de esto hace I/O: una notificación legítima paga un JSON chico y un
+HMAC (microsegundos). Sin `secret` configurado la firma no se verifica.
+
+Una notificación no verificada no decide nada por sí misma: el consumidor
+del inbox solo toma el payment_id y consulta el pago a MP, así que lo peor
+que logra una falsa es una consulta de más.
+===========================================================
+"""
+
+from __future__ import annotations
+
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.core.exceptions import RequestDataTooBig
+
+from . import metrics
+from .cache import BoundedCache
+from .inbox import parse_payload
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WEBHOOK_SECURITY: dict[str, Any] = {
+    'secret': '',                  # clave secreta de webhooks de la app en MP (vacío = no verificar)
+    'max_age': 0,                  # antigüedad máxima del ts firmado en segundos (0 = sin límite)
+    'max_body_bytes': 16 * 1024,   # las notificaciones de MP pesan < 1 KB
+    'legacy_ipn': False,           # aceptar IPN sin firma (?topic=&id=) como no verificado
+    'recent_ttl': 300,
+    'recent_max_entries': 4096,
+}
+
+# Tipos de notificación que procesa el consumidor del inbox
+PAYMENT_TYPES = frozenset({'payment'})
+
+
+def get_webhook_security_config() -> dict[str, Any]:
+    config = dict(DEFAULT_WEBHOOK_SECURITY)
+    config.update(getattr(settings, 'WEBHOOK_SECURITY', {}))
+    return config
+
+
+@dataclass(frozen=True)
+class WebhookCheck:
+    """Resultado del filtro: si se guarda y, si no, qué responder."""
+
+    accepted: bool
+    status: int
+    reason: str
+    payment_id: str = ''
+    recent_key: str = ''
+
+    def response_body(self) -> dict[str, Any]:
+        if self.status < 400:
+            return {'status': self.reason}
+        return {'status': 'rejected', 'reason': self.reason}
+
+
+class _Counters:
+    """Contadores por proceso."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.accepted = 0
+        self.unverified = 0
+        self.legacy_ipn = 0
+        self.rejected: dict[str, int] = {}
+
+    def incr(self, name: str) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def reject(self, reason: str) -> None:
+        with self._lock:
+            self.rejected[reason] = self.rejected.get(reason, 0) + 1
+
+
+_config = get_webhook_security_config()
+_recent = BoundedCache('webhook_recent', max_entries=_config['recent_max_entries'], ttl=_config['recent_ttl'])
+_counters = _Counters()
+
+
+# =============================================================================
+# FIRMA
+# =============================================================================
+
+def _parse_signature_header(header: str) -> tuple[str, str]:
+    """(ts, v1) de `x-signature: ts=...,v1=...` (vacíos si faltan)."""
+    parts = {}
+    for item in header.split(','):
+        key, _, value = item.partition('=')
+        parts[key.strip()] = value.strip()
+    return parts.get('ts', ''), parts.get('v1', '')
+
+
+def signature_manifest(data_id: str, request_id: str, ts: str) -> str:
+    """Texto firmado por MP (las partes sin valor se omiten)."""
+    manifest = ''
+    if data_id:
+        manifest += f"id:{data_id.lower() if data_id.isalnum() else data_id};"
+    if request_id:
+        manifest += f"request-id:{request_id};"
+    if ts:
+        manifest += f"ts:{ts};"
+    return manifest
+
+
+def sign(secret: str, data_id: str, request_id: str, ts: str) -> str:
+    """Firma v1 (hex) de una notificación: la misma cuenta que hace MP."""
+    manifest = signature_manifest(data_id, request_id, ts)
+    return hmac.new(secret.encode(), manifest.encode(), hashlib.sha256).hexdigest()
+
+
+def _check_signature(request, query: dict[str, str], config: dict[str, Any]) -> str:
+    """Motivo de rechazo por firma, o '' si es válida."""
+    ts, v1 = _parse_signature_header(request.headers.get('X-Signature', ''))
+    if not ts or not v1:
+        return 'missing_signature'
+    expected = sign(config['secret'], query.get('data.id', ''), request.headers.get('X-Request-Id', ''), ts)
+    if not hmac.compare_digest(v1.lower(), expected):
+        return 'bad_signature'
+    if config['max_age']:
+        try:
+            signed_at = int(ts)
+        except ValueError:
+            return 'bad_signature'
+        if signed_at > 10 ** 11:
+            signed_at //= 1000   # ts en milisegundos
+        if abs(time.time() - signed_at) > config['max_age']:
+            return 'stale_signature'
+    return ''
+
+
+# =============================================================================
+# FILTRO
+# =============================================================================
+
+def _is_legacy_ipn(request, query: dict[str, str]) -> bool:
+    """IPN del formato anterior: ?topic=...&id=..., sin data.id ni firma."""
+    return (
+        bool(query.get('topic')) and 'data.id' not in query
+        and not request.headers.get('X-Signature')
+    )
+
+
+def _reject(status: int, reason: str) -> WebhookCheck:
+    _counters.reject(reason)
+    return WebhookCheck(False, status, reason)
+
+
+def check_notification(request) -> WebhookCheck:
+    """Decide si una notificación POST se guarda en el inbox. Sin I/O."""
+    config = _config
+
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        content_length = 0
+    if content_length > config['max_body_bytes']:
+        return _reject(413, 'body_too_large')
+    try:
+        raw_body = request.body
+    except RequestDataTooBig:
+        return _reject(413, 'body_too_large')
+    if len(raw_body) > config['max_body_bytes']:
+        # Sin Content-Length: el body ya se leyó, pero no se parsea
+        return _reject(413, 'body_too_large')
+
+    try:
+        body = json.loads(raw_body) if raw_body else {}
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return _reject(400, 'malformed_body')
+    if not isinstance(body, dict):
+        return _reject(400, 'malformed_body')
+    query = {k: v[0] for k, v in parse_qs(request.META.get('QUERY_STRING', '')).items()}
+
+    notification_id, notification_type, payment_id = parse_payload(body, query)
+
+    legacy_ipn = _is_legacy_ipn(request, query)
+    if config['secret'] and config['legacy_ipn'] and legacy_ipn:
+        # MP no firma el IPN: se guarda igual y el consumidor consulta el pago
+        _counters.incr('unverified')
+        _counters.incr('legacy_ipn')
+    elif config['secret']:
+        reason = _check_signature(request, query, config)
+        if reason:
+            return _reject(401, reason)
+        # La firma cubre el data.id del query string: es el único que se procesa
+        if query.get('data.id', '') != payment_id:
+            return _reject(401, 'unsigned_payment_id')
+    else:
+        _counters.incr('unverified')
+
+    if notification_type not in PAYMENT_TYPES:
+        _counters.reject('not_payment')
+        return WebhookCheck(False, 200, 'ignored')
+    if not payment_id.isdigit():
+        return _reject(400, 'invalid_payment_id')
+
+    if legacy_ipn:
+        # Sin id de notificación: un IPN repetido (o reenviado) del mismo pago
+        # no vuelve a provocar una consulta a MP
+        recent_key = f"ipn:{payment_id}"
+    else:
+        recent_key = f"{notification_id}:{payment_id}" if notification_id else ''
+    if recent_key and _recent.get(recent_key) is not None:
+        _counters.reject('duplicate')
+        metrics.DUPLICATES_SKIPPED.inc(source='webhook_guard')
+        return WebhookCheck(False, 200, 'duplicate', payment_id)
+
+    _counters.incr('accepted')
+    return WebhookCheck(True, 200, 'received', payment_id, recent_key)
+
+
+def remember(check: WebhookCheck) -> None:
+    """Registra la notificación como vista (después de guardarla en el inbox)."""
+    if check.recent_key:
+        _recent.set(check.recent_key, True)
+
+
+def webhook_guard_stats() -> dict[str, Any]:
+    return {
+        "signature": "verified" if _config['secret'] else "disabled",
+        "accepted": _counters.accepted,
+        "unverified": _counters.unverified,
+        "legacy_ipn": _counters.legacy_ipn,
+        "rejected": dict(_counters.rejected),
+        "recent_ids": _recent.stats(),
+        "scope": "por proceso",
+    }